@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import timedelta
+
+DEFAULT_TASKS_PER_NODE = 1
+DEFAULT_SCALE_DOWN_DELAY = 5
+# Batch does not evaluate autoscale formulas more often than every 5 minutes
+DEFAULT_EVALUATION_INTERVAL = 5
+CONNECTOR_INTERVAL = 30.0
+HISTORY_SIZE = 256
+
+
+def autoscale_formula(min_nodes: int, max_nodes: int, tasks_per_node: int = DEFAULT_TASKS_PER_NODE,
+                      scale_down_delay: int = DEFAULT_SCALE_DOWN_DELAY) -> str:
+    # Grow with the current pending tasks, but shrink only to the peak of the last scale_down_delay minutes.
+    # Batch truncates the target, hence the rounding up in the divisions
+    return (
+        f"$pending = max(0, max($PendingTasks.GetSample(1)));\n"
+        f"$recent = $PendingTasks.GetSamplePercent(TimeInterval_Minute * {scale_down_delay}) < 70 ? "
+        f"$pending : max($PendingTasks.GetSample(TimeInterval_Minute * {scale_down_delay}));\n"
+        f"$up = ($pending + {tasks_per_node - 1}) / {tasks_per_node};\n"
+        f"$hold = min(($recent + {tasks_per_node - 1}) / {tasks_per_node}, $TargetDedicatedNodes);\n"
+        f"$TargetDedicatedNodes = max({min_nodes}, min({max_nodes}, max($up, $hold)));\n"
+        f"$NodeDeallocationOption = taskcompletion;"
+    )
+
+
+class PoolAutoscaler:
+    # Keeps the size of a pool in line with the workflow parallelism, either through a Batch autoscale
+    # formula ("formula" mode) or by resizing the pool from the pending tasks known to the executor
+    # ("connector" mode). Every decision is recorded in history for tuning
+    def __init__(self, executor, pool_id: str, config: dict):
+        self.executor = executor
+        self.pool_id = pool_id
+        self.mode = config.get("mode", "formula")
+        self.min_nodes = config.get("min_nodes", 0)
+        self.max_nodes = config["max_nodes"]
+        self.tasks_per_node = config.get("tasks_per_node", DEFAULT_TASKS_PER_NODE)
+        self.scale_down_delay = config.get("scale_down_delay", DEFAULT_SCALE_DOWN_DELAY)
+        self.evaluation_interval = config.get("evaluation_interval", DEFAULT_EVALUATION_INTERVAL)
+        self.history: deque[dict] = deque(maxlen=HISTORY_SIZE)
+        self.target: int | None = None
+        self.below_since: float | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def formula(self) -> str:
+        return autoscale_formula(self.min_nodes, self.max_nodes, self.tasks_per_node, self.scale_down_delay)
+
+    async def start(self, node_count: int | None = None):
+        self.target = node_count
+        if self.mode == "formula":
+            logging.info(f"[AzureExecutor] Enabling autoscale on pool {self.pool_id}")
+            await self.executor.batch_client.pool.enable_auto_scale(self.pool_id, {
+                "auto_scale_formula": self.formula,
+                "auto_scale_evaluation_interval": timedelta(minutes=self.evaluation_interval)
+            })
+            self.task = asyncio.ensure_future(self._loop(self.record_run, self.evaluation_interval * 60))
+        else:
+            self.task = asyncio.ensure_future(self._loop(self.step, CONNECTOR_INTERVAL))
+
+    async def _loop(self, step, interval: float):
+        while True:
+            try:
+                await step()
+            except Exception as e:
+                logging.warning(f"[AzureExecutor] Autoscale evaluation for pool {self.pool_id} failed: {e}")
+            await asyncio.sleep(interval)
+
+    def desired(self, pending: int) -> int:
+        return max(self.min_nodes, min(self.max_nodes, math.ceil(pending / self.tasks_per_node)))
+
+    async def step(self, now: float | None = None) -> dict:
+        now = time.monotonic() if now is None else now
+        pending = self.executor.pending_tasks
+        desired = self.desired(pending)
+        decision = {"time": time.time(), "pending": pending, "current": self.target, "desired": desired}
+        if self.target is None or desired > self.target:
+            self.below_since = None
+            decision["reason"] = "scale up" if self.target is not None else "initial"
+        elif desired == self.target:
+            self.below_since = None
+            decision["reason"] = "steady"
+        else:
+            # Short dips between scatter steps do not release nodes
+            self.below_since = self.below_since if self.below_since is not None else now
+            if now - self.below_since < self.scale_down_delay * 60:
+                decision["reason"] = "scale down delayed"
+                desired = self.target
+            else:
+                decision["reason"] = "scale down"
+                self.below_since = None
+        decision["target"] = desired
+        if desired != self.target:
+            await self.executor.resize_pool(self.pool_id, desired)
+            self.target = desired
+            logging.info(f"[AzureExecutor] Autoscale pool {self.pool_id}: {decision['reason']} to {desired} "
+                         f"nodes ({pending} pending tasks)")
+        self.history.append(decision)
+        return decision
+
+    async def record_run(self) -> dict | None:
+        # Batch stores the outcome of the last formula evaluation on the pool
+        pool = await self.executor.batch_client.pool.get(self.pool_id)
+        run = getattr(pool, "auto_scale_run", None)
+        if run is None or (self.history and self.history[-1]["time"] == run.timestamp):
+            return None
+        error = getattr(run, "error", None)
+        decision = {
+            "time": run.timestamp,
+            "pending": self.executor.pending_tasks,
+            "current": pool.current_dedicated_nodes,
+            "target": pool.target_dedicated_nodes,
+            "results": run.results,
+            "reason": getattr(error, "message", None) or "formula"
+        }
+        self.history.append(decision)
+        return decision
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
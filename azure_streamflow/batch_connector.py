@@ -1,10 +1,26 @@
 from __future__ import annotations
 
 import logging
+import uuid
+from urllib.parse import urlparse
 from streamflow.core.deployment import Connector, ExecutionLocation
 from streamflow.core.exception import WorkflowDefinitionException, WorkflowExecutionException
+from streamflow.core.scheduling import AvailableLocation, Hardware
+from azure_streamflow.autoscale import PoolAutoscaler
+from azure_streamflow.blob_connector import AzureBlobConnector
 from azure_streamflow.executor import AzureExecutor
+from azure_streamflow.metrics import configure_instrumentation, release_instrumentation, traced
+from azure_streamflow.nodes import DEFAULT_READY_TIMEOUT, READY_STATES, supported_vm_sizes, vm_size_hardware
+from azure_streamflow.plugin import load_schema
 from azure_streamflow.config import AzureConfig
+from azure_streamflow.staging import (
+    DEFAULT_OUTPUT_PREFIX,
+    DEFAULT_OUTPUT_SAS_EXPIRY,
+    DEFAULT_SAS_EXPIRY,
+    DEFAULT_STAGING_PREFIX,
+    BlobStager
+)
+from azure_streamflow.streams import ChunkStreamContextManager, follow_task_file
 
 class AzureBatchConnector(Connector):
     def __init__(self, config):
@@ -12,57 +28,271 @@ class AzureBatchConnector(Connector):
         self.executor = AzureExecutor(self.config)
         self.job_id = config["job"]["id"]
         self.task_id = config["task"]["id"]
+        self.pool_id = config["pool"]["id"]
+        self.autoscaler: PoolAutoscaler | None = None
+        self.deployment_name = config.get("deployment_name", "azure-batch")
+        self.locations: dict[str, AvailableLocation] = {}
+        self.locations_version = -1
+        self.hardware: Hardware | None = None
+        self.hardware_resolved = False
+        self.stager: BlobStager | None = None
+        self.instrumented = False
 
+    @classmethod
+    def get_schema(cls) -> str:
+        return load_schema("azure_bacth.json")
+
+    @traced("azure_batch.setup")
     async def setup(self, location: ExecutionLocation | None = None):
         logging.info("[AzureBatch] Setting up environment...")
         try:
+            if metrics_cfg := self.config.config.get("metrics"):
+                await configure_instrumentation(metrics_cfg)
+                self.instrumented = True
+            await self.executor.initialize()
+            if staging_cfg := self.config.config.get("staging"):
+                await self._setup_staging(staging_cfg)
             pool_cfg = self.config.config["pool"]
             os_image = pool_cfg["os_image"]
-
-            await self.executor.create_pool(
+            pool_args = dict(
                 pool_id=pool_cfg["id"],
                 vm_size=pool_cfg["vm_size"],
                 node_count=pool_cfg["node_count"],
                 publisher=os_image["publisher"],
                 offer=os_image["offer"],
-                sku=os_image["sku"]
+                sku=os_image["sku"],
+                task_slots_per_node=pool_cfg.get("task_slots_per_node", 1)
             )
 
+            if pool_cfg.get("reuse"):
+                # A compatible warm pool may live under another identifier
+                self.pool_id = await self.executor.warm_pools.acquire(**pool_args)
+            else:
+                await self.executor.create_pool(**pool_args)
+
+            self.executor.node_monitor(self.pool_id).start()
+            if autoscale_cfg := pool_cfg.get("autoscale"):
+                self.autoscaler = PoolAutoscaler(self.executor, self.pool_id, autoscale_cfg)
+                await self.autoscaler.start(pool_cfg["node_count"])
+
             job_cfg = self.config.config["job"]
-            await self.executor.submit_job(job_cfg["id"], job_cfg["pool_id"])
+            job_pool_id = self.pool_id if job_cfg["pool_id"] == pool_cfg["id"] else job_cfg["pool_id"]
+            await self.executor.submit_job(job_cfg["id"], job_pool_id)
         except Exception as e:
             raise WorkflowExecutionException(f"Failed during setup: {e}") from e
 
+    async def _setup_staging(self, staging_cfg: dict):
+        # Inputs are staged through a Blob connector sharing the credential of the Batch client
+        blob_config = {
+            **{k: v for k, v in self.config.as_dict().items() if v is not None and k != "batch_account_url"},
+            **{k: v for k, v in staging_cfg.items()
+               if k not in ("prefix", "sas_expiry", "output_prefix", "output_sas_expiry")},
+            "chunked_upload": True,
+            "parallel_download": True,
+            "sync": True
+        }
+        blob_connector = AzureBlobConnector(blob_config)
+        await blob_connector.setup()
+        self.stager = BlobStager(
+            blob_connector,
+            prefix=staging_cfg.get("prefix", DEFAULT_STAGING_PREFIX),
+            sas_expiry=staging_cfg.get("sas_expiry", DEFAULT_SAS_EXPIRY),
+            output_prefix=staging_cfg.get("output_prefix", DEFAULT_OUTPUT_PREFIX),
+            output_sas_expiry=staging_cfg.get("output_sas_expiry", DEFAULT_OUTPUT_SAS_EXPIRY)
+        )
+
+    @traced("azure_batch.copy_local_to_remote")
+    async def copy_local_to_remote(self, source: str, destination: str, location: ExecutionLocation) -> None:
+        if self.stager is None:
+            raise WorkflowExecutionException("Input staging requires the staging configuration")
+        try:
+            await self.stager.stage(source, destination)
+        except Exception as e:
+            raise WorkflowExecutionException(f"Failed to stage {source}: {e}") from e
+
+    @traced("azure_batch.copy_remote_to_remote")
+    async def copy_remote_to_remote(self, source: str, destination: str, location: ExecutionLocation) -> None:
+        # Outputs already sit in the staging container, they become inputs of later tasks without a copy
+        if self.stager is None:
+            raise WorkflowExecutionException("Moving task outputs requires the staging configuration")
+        try:
+            task_id, file_path = self._task_path(source)
+            await self.executor.task_poller(self.job_id).wait(task_id)
+            await self.stager.stage_remote(self.stager.output_blob(task_id, file_path), destination)
+        except WorkflowExecutionException:
+            raise
+        except Exception as e:
+            raise WorkflowExecutionException(f"Failed to move {source} to {destination}: {e}") from e
+
+    async def deploy(self, external: bool) -> None:
+        await self.setup()
+
+    async def undeploy(self, external: bool) -> None:
+        # External pools outlive the workflow, only the clients are released
+        if not external:
+            await self.teardown()
+        await self.close()
+
+    def _task_path(self, path: str) -> tuple[str, str]:
+        # Task files are addressed as <task id>/<path>. Outputs are relative to the task working directory,
+        # streams to the task directory holding stdout.txt and stderr.txt
+        task_id, _, file_path = path.lstrip("/").partition("/")
+        if not task_id or not file_path:
+            raise WorkflowExecutionException(f"Invalid task file path {path}, expected <task id>/<path>")
+        return task_id, file_path
+
+    @traced("azure_batch.copy_remote_to_local")
+    async def copy_remote_to_local(self, source: str, destination: str, location: ExecutionLocation) -> None:
+        if self.stager is None:
+            raise WorkflowExecutionException("Output retrieval requires the staging configuration")
+        try:
+            task_id, file_path = self._task_path(source)
+            # Output files are uploaded before the task is marked as completed
+            await self.executor.task_poller(self.job_id).wait(task_id)
+            await self.stager.blob_connector.copy_remote_to_local(
+                self.stager.output_blob(task_id, file_path), destination, location)
+        except WorkflowExecutionException:
+            raise
+        except Exception as e:
+            raise WorkflowExecutionException(f"Failed to retrieve {source}: {e}") from e
+
+    async def get_stream_reader(self, location: ExecutionLocation, src: str) -> ChunkStreamContextManager:
+        # Follows a file of the task directory while the task runs, e.g. <task id>/stdout.txt
+        task_id, file_path = self._task_path(src)
+        return ChunkStreamContextManager(follow_task_file(self.executor, self.job_id, task_id, file_path))
+
+    @traced("azure_batch.run")
     async def run(self, command: str, location: ExecutionLocation | None = None):
         try:
             task_cfg = self.config.config["task"]
-            await self.executor.submit_task(
+            # Every run is a distinct Batch task, so that concurrent runs do not collide
+            task_id = f"{self.task_id}-{uuid.uuid4().hex[:12]}"
+            # Tasks go out as soon as the first node is ready, not when the whole pool is. An autoscaled
+            # pool may have no nodes until tasks are pending, so it is not waited for
+            if not self.autoscaler:
+                await self.executor.node_monitor(self.pool_id).wait_ready(self._ready_timeout())
+            resource_files = list(task_cfg.get("resource_files", []))
+            output_files = []
+            if self.stager:
+                command, staged_files = await self.stager.prepare(command)
+                resource_files.extend(staged_files)
+                if outputs := task_cfg.get("outputs"):
+                    output_files = await self.stager.output_files(task_id, outputs)
+            await self.executor.enqueue_task(
                 job_id=self.job_id,
-                task_id=self.task_id,
+                task_id=task_id,
                 command_line=command,
-                resource_files=task_cfg.get("resource_files", [])
+                resource_files=resource_files,
+                output_files=output_files
             )
-            return self.task_id
+            # Tracked from submission on, so that the pending tasks drive the autoscaler
+            self.executor.task_poller(self.job_id).watch(task_id)
+            return task_id
         except Exception as e:
             raise WorkflowExecutionException(f"Failed to submit task: {e}") from e
 
     async def status(self, task_id: str, location: ExecutionLocation | None = None):
         try:
-            state = await self.executor.monitor_job(self.job_id)
-            return {"job_id": self.job_id, "task_id": task_id, "state": state}
+            poller = self.executor.task_poller(self.job_id)
+            poller.watch(task_id)
+            state = poller.state(task_id)
+            return {
+                "job_id": self.job_id,
+                "task_id": task_id,
+                "state": state.state if state else "active",
+                "exit_code": state.exit_code if state else None
+            }
         except Exception as e:
             raise WorkflowExecutionException(f"Failed to retrieve status: {e}") from e
 
+    async def wait(self, task_id: str, location: ExecutionLocation | None = None):
+        try:
+            state = await self.executor.task_poller(self.job_id).wait(task_id)
+            return {"job_id": self.job_id, "task_id": task_id, "state": state.state, "exit_code": state.exit_code}
+        except Exception as e:
+            raise WorkflowExecutionException(f"Failed to wait for task {task_id}: {e}") from e
+
+    def _ready_timeout(self) -> float:
+        return self.config.config["pool"].get("ready_timeout", DEFAULT_READY_TIMEOUT)
+
+    def _location(self) -> str:
+        # https://<account>.<region>.batch.azure.com
+        return self.config.config.get("location") or urlparse(self.config.batch_account_url).hostname.split(".")[1]
+
+    async def _hardware(self) -> Hardware | None:
+        if not self.hardware_resolved:
+            self.hardware = await self._resolve_hardware()
+            self.hardware_resolved = True
+        return self.hardware
+
+    async def _resolve_hardware(self) -> Hardware | None:
+        pool_cfg = self.config.config["pool"]
+        vm_size = pool_cfg["vm_size"]
+        size = None
+        if self.config.subscription_id:
+            try:
+                sizes = await supported_vm_sizes(self.executor.credentials, self.config.subscription_id, self._location())
+                size = sizes.get(vm_size.lower())
+            except Exception as e:
+                logging.warning(f"[AzureBatch] Failed to list the VM sizes of {self._location()}: {e}")
+        if size is None and (size := vm_size_hardware(vm_size)) is not None:
+            logging.warning(f"[AzureBatch] Hardware of {vm_size} estimated from its name, "
+                            f"set subscription_id or pool.node_hardware for the exact values")
+        cores, memory = size or (0.0, 0.0)
+        # The node_hardware configuration overrides the size
+        if hardware := pool_cfg.get("node_hardware"):
+            cores, memory = hardware.get("cores", cores), hardware.get("memory", memory)
+        if not cores and not memory:
+            return None
+        return Hardware(cores=cores, memory=memory)
+
+    async def get_available_locations(self, service: str | None = None, input_directory: str | None = None,
+                                      output_directory: str | None = None, tmp_directory: str | None = None):
+        monitor = self.executor.node_monitors.get(self.pool_id)
+        if monitor is None:
+            return {}
+        if not self.autoscaler:
+            await monitor.wait_ready(self._ready_timeout())
+        # Only the nodes that changed since the last call are updated
+        if monitor.version != self.locations_version:
+            slots = self.config.config["pool"].get("task_slots_per_node", 1)
+            ready = {node_id for node_id, state in monitor.nodes.items() if state in READY_STATES}
+            for node_id in set(self.locations) - ready:
+                del self.locations[node_id]
+            for node_id in ready - set(self.locations):
+                self.locations[node_id] = AvailableLocation(
+                    name=node_id,
+                    deployment=self.deployment_name,
+                    hostname=monitor.addresses.get(node_id, node_id),
+                    service=service,
+                    slots=slots,
+                    hardware=await self._hardware()
+                )
+            self.locations_version = monitor.version
+        return self.locations
+
     async def teardown(self, location: ExecutionLocation | None = None):
         logging.info("[AzureBatch] Tearing down environment...")
         try:
-            await self.executor.delete_pool(self.config.config["pool"]["id"])
+            pool_cfg = self.config.config["pool"]
+            if self.autoscaler:
+                await self.autoscaler.stop()
+            if pool_cfg.get("reuse"):
+                await self.executor.warm_pools.release(self.pool_id, pool_cfg.get("idle_timeout"))
+            else:
+                await self.executor.delete_pool(pool_cfg["id"])
         except Exception as e:
             raise WorkflowExecutionException(f"Failed during teardown: {e}") from e
 
     async def close(self):
         try:
-            await self.executor.batch_client.close()
-            await self.executor.credentials.close()
+            if self.autoscaler:
+                await self.autoscaler.stop()
+            if self.stager:
+                await self.stager.blob_connector.close()
+            await self.executor.close()
+            if self.instrumented:
+                self.instrumented = False
+                await release_instrumentation()
         except Exception as e:
             raise WorkflowExecutionException(f"Failed to close resources: {e}") from e
\ No newline at end of file
@@ -1,36 +1,159 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import collections
+import glob
+import json
 import logging
+import os
+import posixpath
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, cast
+from urllib.parse import urlparse
+
 import aiofiles
-from importlib_resources import files
 from streamflow.core.deployment import Connector, ExecutionLocation
 from streamflow.core.exception import WorkflowExecutionException
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.storage.blob import (
+    BlobSasPermissions,
+    ContainerSasPermissions,
+    ContentSettings,
+    generate_blob_sas,
+    generate_container_sas
+)
 from azure.storage.blob.aio import BlobServiceClient
 from azure.identity.aio import DefaultAzureCredential
+from azure_streamflow.clients import ClientRegistry
+from azure_streamflow.credentials import select_credential
+from azure_streamflow.index import DEFAULT_INDEX_TTL, UNKNOWN, PrefixIndex
+from azure_streamflow.metrics import (
+    client_options,
+    configure_instrumentation,
+    instrumentation,
+    record_transfer,
+    release_instrumentation,
+    traced
+)
+from azure_streamflow.operations import (
+    BATCH_OPERATIONS,
+    BATCH_SIZE,
+    has_glob,
+    join_name,
+    match_blobs,
+    match_containers,
+    validate_operations
+)
+from azure_streamflow.pack import (
+    DEFAULT_PACK_MAX_AVERAGE_SIZE,
+    DEFAULT_PACK_MIN_FILES,
+    archive_name,
+    extract_tar,
+    index_name,
+    should_pack,
+    tar_blocks
+)
+from azure_streamflow.plugin import load_schema
+from azure_streamflow.cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE, BlobCache
+from azure_streamflow.compression import (
+    ORIGINAL_MD5_METADATA,
+    ORIGINAL_SIZE_METADATA,
+    check_codec,
+    compress_blocks,
+    content_codec,
+    decompress_chunks,
+    foreign_encoding,
+    original_size,
+    slice_chunks,
+    write_chunks
+)
+from azure_streamflow.streams import ChunkStreamContextManager
+from azure_streamflow.sync import DEFAULT_MANIFEST_PATH, MTIME_METADATA, SyncManifest, is_unchanged, remote_md5
+from azure_streamflow.transfer import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_FILE_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    download_ranges,
+    read_blocks,
+    transfer_pool,
+    upload_blocks,
+    walk_local,
+    with_retries
+)
+
+STORAGE_SCOPE = "https://storage.azure.com/.default"
+DEFAULT_COPY_FROM_URL_MAX_SIZE = 256 * 1024 * 1024
+COPY_POLL_MIN = 0.5
+COPY_POLL_MAX = 15.0
+_UNKNOWN = object()
 
 class AzureBlobConnector(Connector):
     def __init__(self, config):
         self.config = config
         self.blob_service_client: BlobServiceClient | None = None
         self.credential: DefaultAzureCredential | None = None
+        self.credential_identity: tuple | None = None
+        self.registry: ClientRegistry | None = None
+        self._service_clients: dict[str, BlobServiceClient] = {}
+        self._delegation_keys: dict[str, tuple] = {}
+        self.manifest: SyncManifest | None = None
+        self.cache: BlobCache | None = None
+        self.index: PrefixIndex | None = None
+        self.instrumented = False
+        self.batch_supported = True
+
+    @property
+    def client(self) -> BlobServiceClient:
+        if self.blob_service_client is None:
+            raise WorkflowExecutionException("[AzureBlob] Blob client is not set up")
+        return self.blob_service_client
 
     @classmethod
     def get_schema(cls) -> str:
-        return files("azure_streamflow.schemas").joinpath("azure_blob.schema.json").read_text("utf-8")
+        return load_schema("azure_blob.json")
 
     async def setup(self, location: ExecutionLocation | None = None):
         logging.info("[AzureBlob] Setting up Blob client...")
+        if codec := self.config.get("compression"):
+            check_codec(codec)
         try:
-            self.credential = DefaultAzureCredential()
-            self.blob_service_client = BlobServiceClient(
-                account_url=self.config["blob_account_url"],
-                credential=self.credential
+            if metrics_cfg := self.config.get("metrics"):
+                await configure_instrumentation(metrics_cfg)
+                self.instrumented = True
+            self.registry = ClientRegistry.get()
+            self.credential_identity, credential_factory = select_credential(self.config, DefaultAzureCredential)
+            self.credential = self.registry.credential(self.credential_identity, credential_factory)
+            self.blob_service_client = self.registry.client(
+                "blob",
+                self.config["blob_account_url"],
+                self.credential_identity,
+                lambda transport: BlobServiceClient(
+                    account_url=self.config["blob_account_url"],
+                    credential=self.credential,
+                    transport=transport,
+                    **client_options("blob")
+                )
             )
+            if cache_cfg := self.config.get("cache"):
+                self.cache = BlobCache.get(
+                    cache_cfg.get("directory", DEFAULT_CACHE_DIRECTORY),
+                    cache_cfg.get("max_size", DEFAULT_CACHE_SIZE)
+                )
+            if (index_cfg := self.config.get("prefix_index")) is not None:
+                self.index = PrefixIndex(index_cfg.get("ttl", DEFAULT_INDEX_TTL))
         except Exception as e:
             raise WorkflowExecutionException(f"Failed to initialize Azure Blob Storage: {e}") from e
 
+    @traced("azure_blob.run")
     async def run(self, command: str, location: ExecutionLocation | None = None):
         try:
+            if operations := self.config.get("operations"):
+                return await self._run_operations(operations)
             action = self.config.get("action")
             container = self.config["container"]
             blob_name = self.config["blob_name"]
@@ -45,7 +168,15 @@ class AzureBlobConnector(Connector):
                 return f"{action} completed"
             elif action == "read":
                 encoding = self.config.get("encoding", "utf-8")
-                content = await self._read_blob(container, blob_name, encoding)
+                content = await self._read_blob(
+                    container,
+                    blob_name,
+                    encoding,
+                    offset=self.config.get("offset"),
+                    length=self.config.get("length"),
+                    start_line=self.config.get("start_line"),
+                    end_line=self.config.get("end_line")
+                )
                 return content
             else:
                 raise WorkflowExecutionException(f"Invalid blob action: {action}")
@@ -60,40 +191,240 @@ class AzureBlobConnector(Connector):
 
     async def close(self):
         try:
-            if self.blob_service_client:
-                await self.blob_service_client.close()
-            if self.credential:
-                await self.credential.close()
+            if self.registry:
+                if self.blob_service_client:
+                    await self.registry.release_client(
+                        "blob", self.config["blob_account_url"], self.credential_identity)
+                for account_url in self._service_clients:
+                    await self.registry.release_client("blob", account_url, self.credential_identity)
+                if self.credential:
+                    await self.registry.release_credential(self.credential_identity)
+            self.blob_service_client = None
+            self._service_clients = {}
+            self.credential = None
+            if self.manifest:
+                self.manifest.close()
+            if self.instrumented:
+                self.instrumented = False
+                await release_instrumentation()
         except Exception as e:
             raise WorkflowExecutionException(f"Failed to close resources: {e}") from e
 
-    async def _upload_blob(self, local_path: str, container: str, blob_name: str):
+    def _sync_manifest(self) -> SyncManifest:
+        if self.manifest is None:
+            self.manifest = SyncManifest(self.config.get("sync_manifest", DEFAULT_MANIFEST_PATH))
+        return self.manifest
+
+    async def _upload_blob(self, local_path: str, container: str, blob_name: str, properties=_UNKNOWN):
+        start = time.perf_counter()
         try:
-            blob_client = self.blob_service_client.get_blob_client(container=container, blob=blob_name)
-            async with aiofiles.open(local_path, "rb") as f:
-                data = await f.read()
-                await blob_client.upload_blob(data, overwrite=True)
+            blob_client = self.client.get_blob_client(container=container, blob=blob_name)
+            kwargs: dict[str, Any] = {}
+            if self.config.get("sync", False):
+                if properties is _UNKNOWN:
+                    properties = await self._blob_properties(self.client, container, blob_name)
+                if await is_unchanged(self._sync_manifest(), local_path, properties):
+                    logging.info(f"Skipped unchanged {local_path}")
+                    instrumentation().increment("azure_blob_skipped_total", direction="upload")
+                    return
+                stat = os.stat(local_path)
+                kwargs = {
+                    "content_settings": ContentSettings(
+                        content_md5=bytearray(await self._sync_manifest().md5(local_path, stat))),
+                    "metadata": {MTIME_METADATA: str(stat.st_mtime_ns)}
+                }
+            if codec := self.config.get("compression"):
+                # The Content-MD5 of a compressed blob would not match its bytes, the hash of the original
+                # content goes to the metadata instead
+                metadata = kwargs.get("metadata", {})
+                if content_settings := kwargs.get("content_settings"):
+                    metadata[ORIGINAL_MD5_METADATA] = bytes(content_settings.content_md5).hex()
+                metadata[ORIGINAL_SIZE_METADATA] = str(os.path.getsize(local_path))
+                block_size = self.config.get("block_size", DEFAULT_BLOCK_SIZE)
+                await upload_blocks(
+                    blob_client,
+                    compress_blocks(read_blocks(local_path, block_size), codec, block_size,
+                                    self.config.get("compression_level")),
+                    max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                    content_settings=ContentSettings(content_encoding=codec),
+                    metadata=metadata
+                )
+            elif self.config.get("chunked_upload", False):
+                block_size = self.config.get("block_size", DEFAULT_BLOCK_SIZE)
+                await upload_blocks(
+                    blob_client,
+                    read_blocks(local_path, block_size),
+                    max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                    **kwargs
+                )
+            else:
+                async with aiofiles.open(local_path, "rb") as f:
+                    data = await f.read()
+                    await blob_client.upload_blob(data, overwrite=True, **kwargs)
+            self._indexed_write(container, blob_name)
+            record_transfer("upload", local_path, start)
             logging.info(f"Uploaded {local_path} to {container}/{blob_name}")
         except Exception as e:
             raise WorkflowExecutionException(f"Upload failed: {e}") from e
 
-    async def _download_blob(self, container: str, blob_name: str, local_path: str):
+    async def _download_blob(self, container: str, blob_name: str, local_path: str, properties=_UNKNOWN):
+        start = time.perf_counter()
         try:
-            blob_client = self.blob_service_client.get_blob_client(container=container, blob=blob_name)
-            stream = await blob_client.download_blob()
-            data = await stream.readall()
-            async with aiofiles.open(local_path, "wb") as f:
-                await f.write(data)
+            blob_client = self.client.get_blob_client(container=container, blob=blob_name)
+            sync = self.config.get("sync", False)
+            if sync:
+                if properties is _UNKNOWN:
+                    properties = await self._blob_properties(self.client, container, blob_name)
+                    if properties is None:
+                        raise ResourceNotFoundError(f"The blob {container}/{blob_name} does not exist")
+                if await is_unchanged(self._sync_manifest(), local_path, properties):
+                    logging.info(f"Skipped unchanged {container}/{blob_name}")
+                    instrumentation().increment("azure_blob_skipped_total", direction="download")
+                    return
+            if self.cache is not None:
+                async with self.cache.open(blob_client) as cached_path:
+                    if codec := self.cache.encoding(blob_client):
+                        await write_chunks(decompress_chunks(read_blocks(cached_path), codec), local_path)
+                    else:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, shutil.copyfile, cached_path, local_path)
+            elif self.config.get("parallel_download", False):
+                if properties is _UNKNOWN:
+                    properties = await blob_client.get_blob_properties()
+                if codec := content_codec(properties):
+                    # A compressed stream is decoded in order, the SDK still fetches its chunks in parallel
+                    stream = await blob_client.download_blob(
+                        max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                        etag=properties.etag, match_condition=MatchConditions.IfNotModified, decompress=False)
+                    await write_chunks(decompress_chunks(stream.chunks(), codec), local_path)
+                else:
+                    await download_ranges(
+                        blob_client,
+                        local_path,
+                        block_size=self.config.get("block_size", DEFAULT_BLOCK_SIZE),
+                        max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                        properties=properties
+                    )
+            else:
+                stream = await blob_client.download_blob(decompress=False)
+                if codec := content_codec(stream.properties):
+                    await write_chunks(decompress_chunks(stream.chunks(), codec), local_path)
+                else:
+                    data = await stream.readall()
+                    async with aiofiles.open(local_path, "wb") as f:
+                        await f.write(data)
+            # The hash of a blob compressed by another tool is not the one of the decoded file
+            if sync and not foreign_encoding(properties) and (digest := remote_md5(properties)):
+                self._sync_manifest().record(local_path, digest)
+            record_transfer("download", local_path, start)
             logging.info(f"Downloaded {container}/{blob_name} to {local_path}")
         except Exception as e:
             raise WorkflowExecutionException(f"Download failed: {e}") from e
 
-    async def _read_blob(self, container: str, blob_name: str, encoding: str = "utf-8") -> str:
+    async def iter_blob(self, container: str, blob_name: str, offset: int | None = None,
+                        length: int | None = None) -> AsyncIterator[bytes]:
+        blob_client = self.client.get_blob_client(container=container, blob=blob_name)
+        if self.cache is not None:
+            chunks = self._cached_blob_chunks(self.cache, blob_client, offset, length)
+        else:
+            properties = None
+            if offset is not None and offset < 0:
+                properties = await blob_client.get_blob_properties()
+                if not foreign_encoding(properties):
+                    offset = max(0, original_size(properties) + offset)
+            if properties is not None and content_codec(properties):
+                stream = await blob_client.download_blob(decompress=False)
+            else:
+                stream = await blob_client.download_blob(offset=offset, length=length, decompress=False)
+                if content_codec(stream.properties) and (offset or length is not None):
+                    # Ranges address the compressed bytes
+                    stream = await blob_client.download_blob(decompress=False)
+            if codec := content_codec(stream.properties):
+                chunks = slice_chunks(decompress_chunks(stream.chunks(), codec), offset, length)
+            else:
+                chunks = stream.chunks()
+        async for chunk in chunks:
+            yield chunk
+
+    async def iter_blob_text(self, container: str, blob_name: str, encoding: str = "utf-8",
+                             offset: int | None = None, length: int | None = None,
+                             errors: str = "strict") -> AsyncIterator[str]:
+        # An incremental decoder keeps multi-byte characters split across chunks intact
+        decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        async for chunk in self.iter_blob(container, blob_name, offset, length):
+            if text := decoder.decode(chunk):
+                yield text
+        if text := decoder.decode(b"", final=True):
+            yield text
+
+    async def _cached_blob_chunks(self, cache: BlobCache, blob_client, offset: int | None,
+                                  length: int | None) -> AsyncIterator[bytes]:
+        # The cached file stays pinned until the last chunk has been read
+        async with cache.open(blob_client) as cached_path:
+            if codec := cache.encoding(blob_client):
+                if offset is not None and offset < 0 and (size := cache.original_size(blob_client)) is not None:
+                    offset = max(0, size + offset)
+                chunks = slice_chunks(decompress_chunks(read_blocks(cached_path), codec), offset, length)
+            else:
+                chunks = self._cached_chunks(cached_path, offset, length)
+            async for chunk in chunks:
+                yield chunk
+
+    async def _cached_chunks(self, path: str, offset: int | None, length: int | None) -> AsyncIterator[bytes]:
+        block_size = self.config.get("block_size", DEFAULT_BLOCK_SIZE)
+        if offset is not None and offset < 0:
+            offset = max(0, os.path.getsize(path) + offset)
+        async with aiofiles.open(path, "rb") as f:
+            if offset:
+                await f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                data = await f.read(block_size if remaining is None else min(block_size, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    async def iter_blob_lines(self, container: str, blob_name: str, encoding: str = "utf-8",
+                              offset: int | None = None, length: int | None = None,
+                              start_line: int | None = None, end_line: int | None = None,
+                              errors: str = "strict") -> AsyncIterator[str]:
+        start_line = start_line or 0
+        # A negative start line keeps only the last lines of the blob, as tail does
+        tail: collections.deque[str] | None = collections.deque(maxlen=-start_line) if start_line < 0 else None
+        lineno = 0
+        buffer = ""
+        async for text in self.iter_blob_text(container, blob_name, encoding, offset, length, errors):
+            lines = (buffer + text).splitlines(keepends=True)
+            # Hold back the last line until it is terminated, including a \r that may precede \n
+            buffer = lines.pop() if not lines[-1].endswith("\n") else ""
+            for line in lines:
+                if tail is not None:
+                    tail.append(line)
+                elif lineno >= start_line:
+                    yield line
+                lineno += 1
+                if end_line is not None and lineno >= end_line:
+                    return
+        if buffer:
+            if tail is not None:
+                tail.append(buffer)
+            elif lineno >= start_line:
+                yield buffer
+        if tail is not None:
+            for line in tail:
+                yield line
+
+    async def _read_blob(self, container: str, blob_name: str, encoding: str = "utf-8",
+                         offset: int | None = None, length: int | None = None,
+                         start_line: int | None = None, end_line: int | None = None) -> str:
         try:
-            blob_client = self.blob_service_client.get_blob_client(container=container, blob=blob_name)
-            stream = await blob_client.download_blob()
-            data = await stream.readall()
-            text = data.decode(encoding)
+            if start_line is not None or end_line is not None:
+                chunks = self.iter_blob_lines(container, blob_name, encoding, offset, length, start_line, end_line)
+            else:
+                chunks = self.iter_blob_text(container, blob_name, encoding, offset, length)
+            text = "".join([chunk async for chunk in chunks])
             logging.info(f"Read {container}/{blob_name} with encoding={encoding}")
             return text
         except Exception as e:
@@ -106,17 +437,578 @@ class AzureBlobConnector(Connector):
     async def undeploy(self, external: bool) -> None:
         pass
 
+    @traced("azure_blob.copy_local_to_remote")
     async def copy_local_to_remote(self, source: str, destination: str, location: ExecutionLocation) -> None:
-        pass
+        container, blob_name = self._remote_path(destination)
+        if os.path.isdir(source) and (pack_cfg := self.config.get("pack")) and await should_pack(
+                source,
+                pack_cfg.get("min_files", DEFAULT_PACK_MIN_FILES),
+                pack_cfg.get("max_average_size", DEFAULT_PACK_MAX_AVERAGE_SIZE)):
+            await self._upload_pack(source, container, blob_name, pack_cfg)
+        elif os.path.isdir(source):
+            # In sync mode, a single listing of the prefix replaces one properties request per file
+            index = await self._list_properties(container, blob_name) if self.config.get("sync", False) else None
+            await self._run_pool(self._local_tree(source, container, blob_name, index), self._upload_blob)
+        else:
+            await self._upload_blob(source, container, blob_name)
 
+    @traced("azure_blob.copy_remote_to_local")
     async def copy_remote_to_local(self, source: str, destination: str, location: ExecutionLocation) -> None:
-        pass
+        container, blob_name = self._remote_path(source)
+        if await self._is_blob(container, blob_name):
+            await self._download_blob(container, blob_name, destination)
+        elif not await self._download_pack(container, blob_name, destination):
+            found = 0
+
+            async def _counted(items):
+                nonlocal found
+                async for item in items:
+                    found += 1
+                    yield item
+
+            await self._run_pool(_counted(self._remote_tree(container, blob_name, destination)), self._download_file)
+            # A file inside a packed directory is read from the archive
+            if not found and not await self._extract_member(container, blob_name, destination):
+                raise WorkflowExecutionException(f"No blob, directory or packed file at {container}/{blob_name}")
 
+    @traced("azure_blob.copy_remote_to_remote")
     async def copy_remote_to_remote(self, source: str, destination: str, location: ExecutionLocation) -> None:
-        pass
+        # Bytes never flow through this host: the destination account pulls them from the source
+        src_service, src_container, src_name = self._parse_remote(source)
+        dst_service, dst_container, dst_name = self._parse_remote(destination)
+        properties = await self._blob_properties(src_service, src_container, src_name)
+        if properties is not None:
+            await self._copy_blob(
+                src_service.get_blob_client(container=src_container, blob=src_name),
+                dst_service.get_blob_client(container=dst_container, blob=dst_name),
+                properties.size
+            )
+        else:
+            await self._run_pool(
+                self._copy_tree(src_service, src_container, src_name, dst_service, dst_container, dst_name),
+                self._copy_blob
+            )
+
+    def _remote_path(self, path: str) -> tuple[str, str]:
+        # Remote paths are blob names, or name prefixes, inside the configured container
+        return self.config["container"], path.lstrip("/")
+
+    def _parse_remote(self, path: str) -> tuple[BlobServiceClient, str, str]:
+        # Full blob URLs address other containers and storage accounts
+        if path.startswith(("https://", "http://")):
+            url = urlparse(path)
+            container, _, blob_name = url.path.lstrip("/").partition("/")
+            return self._service_client(f"{url.scheme}://{url.netloc}"), container, blob_name
+        return (self.client, *self._remote_path(path))
+
+    def _service_client(self, account_url: str) -> BlobServiceClient:
+        if account_url.rstrip("/") == self.config["blob_account_url"].rstrip("/"):
+            return self.client
+        if self.registry is None or self.credential_identity is None:
+            raise WorkflowExecutionException("[AzureBlob] Blob client is not set up")
+        if account_url not in self._service_clients:
+            self._service_clients[account_url] = self.registry.client(
+                "blob",
+                account_url,
+                self.credential_identity,
+                lambda transport: BlobServiceClient(
+                    account_url=account_url, credential=self.credential, transport=transport,
+                    **client_options("blob"))
+            )
+        return self._service_clients[account_url]
+
+    async def _blob_properties(self, service_client: BlobServiceClient, container: str, blob_name: str):
+        if not blob_name or blob_name.endswith("/"):
+            return None
+        index = self.index if service_client is self.blob_service_client else None
+        if index is not None:
+            await self._load_index(index, container, blob_name)
+            if (properties := index.lookup(container, blob_name)) is not UNKNOWN:
+                return properties
+        try:
+            properties = await service_client.get_blob_client(
+                container=container, blob=blob_name).get_blob_properties()
+        except ResourceNotFoundError:
+            properties = None
+        if index is not None:
+            index.put(container, blob_name, properties)
+        return properties
+
+    async def _is_blob(self, container: str, blob_name: str) -> bool:
+        return await self._blob_properties(self.client, container, blob_name) is not None
+
+    async def _is_directory(self, container: str, prefix: str) -> bool:
+        prefix = prefix.strip("/")
+        if self.index is not None:
+            # The listing of the parent answers for the directory and for its siblings
+            await self._load_index(self.index, container, prefix)
+            if (is_directory := self.index.is_directory(container, prefix)) is not UNKNOWN:
+                return is_directory
+        container_client = self.client.get_container_client(container)
+        async for _ in container_client.list_blobs(name_starts_with=prefix + "/" if prefix else ""):
+            return True
+        return False
+
+    def _configured_prefix(self, blob_name: str) -> str | None:
+        for configured in sorted(p.strip("/") for p in self.config["prefix_index"].get("prefixes", [])):
+            if not configured or blob_name.startswith(configured + "/"):
+                return configured
+        return None
+
+    async def _load_index(self, index: PrefixIndex, container: str, blob_name: str):
+        # Names are answered by a one-level listing of their directory, shared by sibling lookups, or by
+        # a recursive listing of the broadest configured prefix holding them
+        if index.covers(container, blob_name):
+            return
+        container_client = self.client.get_container_client(container)
+        if (configured := self._configured_prefix(blob_name)) is not None:
+            await index.load(container_client, container, configured, deep=True)
+        else:
+            await index.load(container_client, container, posixpath.dirname(blob_name))
+
+    def _indexed_write(self, container: str, blob_name: str, exists: bool = True):
+        if self.index is not None:
+            if exists:
+                self.index.invalidate(container, blob_name)
+            else:
+                self.index.remove(container, blob_name)
+
+    async def exists(self, path: str) -> bool:
+        container, blob_name = self._remote_path(path)
+        if self.index is not None and await self._is_directory(container, blob_name):
+            # Directories are tried first, their listing then answers for the blobs below them
+            return True
+        return await self._is_blob(container, blob_name) or (
+            self.index is None and await self._is_directory(container, blob_name))
+
+    async def stat(self, path: str) -> dict | None:
+        container, blob_name = self._remote_path(path)
+        if self.index is not None and await self._is_directory(container, blob_name):
+            return {"size": 0, "etag": None, "last_modified": None, "directory": True}
+        if (properties := await self._blob_properties(self.client, container, blob_name)) is not None:
+            return {"size": original_size(properties), "etag": properties.etag,
+                    "last_modified": properties.last_modified, "directory": False}
+        if self.index is None and await self._is_directory(container, blob_name):
+            return {"size": 0, "etag": None, "last_modified": None, "directory": True}
+        return None
+
+    async def _list_properties(self, container: str, prefix: str) -> dict:
+        if self.index is not None:
+            # Tree transfers list recursively. Blobs written since the listing are looked up again
+            # before being compared
+            if (entries := self.index.entries(container, prefix)) is None:
+                listing = await self.index.load(
+                    self.client.get_container_client(container), container, prefix, deep=True)
+                entries = listing.entries(prefix.strip("/"))
+            return {name: _UNKNOWN if properties is UNKNOWN else properties for name, properties in entries.items()}
+        prefix = prefix.rstrip("/") + "/" if prefix else ""
+        container_client = self.client.get_container_client(container)
+        blobs = container_client.list_blobs(name_starts_with=prefix, include=["metadata"])
+        return {blob.name: blob async for blob in blobs}
+
+    async def _local_tree(self, root: str, container: str, prefix: str, index: dict | None = None):
+        async for path in walk_local(root):
+            relpath = os.path.relpath(path, root).replace(os.sep, "/")
+            blob_name = posixpath.join(prefix, relpath) if prefix else relpath
+            if index is None:
+                yield path, container, blob_name
+            else:
+                yield path, container, blob_name, index.get(blob_name)
+
+    async def _remote_tree(self, container: str, prefix: str, destination):
+        prefix = prefix.rstrip("/") + "/" if prefix else ""
+        container_client = self.client.get_container_client(container)
+        if self.config.get("sync", False):
+            blobs = container_client.list_blobs(name_starts_with=prefix, include=["metadata"])
+        else:
+            blobs = container_client.list_blobs(name_starts_with=prefix)
+        async for blob in blobs:
+            relpath = blob.name[len(prefix):]
+            local_path = os.path.join(destination, *relpath.split("/"))
+            if self.config.get("sync", False):
+                yield container, blob.name, local_path, blob
+            else:
+                yield container, blob.name, local_path
+
+    async def _copy_tree(self, src_service: BlobServiceClient, src_container: str, src_prefix: str,
+                         dst_service: BlobServiceClient, dst_container: str, dst_prefix: str):
+        src_prefix = src_prefix.rstrip("/") + "/" if src_prefix else ""
+        container_client = src_service.get_container_client(src_container)
+        async for blob in container_client.list_blobs(name_starts_with=src_prefix):
+            relpath = blob.name[len(src_prefix):]
+            yield (
+                src_service.get_blob_client(container=src_container, blob=blob.name),
+                dst_service.get_blob_client(
+                    container=dst_container, blob=posixpath.join(dst_prefix, relpath) if dst_prefix else relpath),
+                blob.size
+            )
+
+    async def _run_pool(self, items, transfer):
+        failures = await transfer_pool(
+            items,
+            transfer,
+            max_concurrency=self.config.get("max_file_concurrency", DEFAULT_MAX_FILE_CONCURRENCY),
+            max_retries=self.config.get("max_retries", DEFAULT_MAX_RETRIES)
+        )
+        if self.manifest:
+            self.manifest.save()
+        if failures:
+            for item, e in failures:
+                logging.error(f"[AzureBlob] Failed to transfer {item}: {e}")
+            raise WorkflowExecutionException(
+                f"Failed to transfer {len(failures)} files, first error: {failures[0][1]}")
+
+    async def _run_operations(self, operations: list[dict]) -> dict:
+        # The whole manifest is expanded lazily into one bounded pool, sharing the connector client
+        validate_operations(operations)
+        results: list[dict] = []
+        start = time.perf_counter()
+        failures = await transfer_pool(
+            self._operation_items(operations, results),
+            self._run_operation,
+            max_concurrency=self.config.get("max_file_concurrency", DEFAULT_MAX_FILE_CONCURRENCY),
+            max_retries=self.config.get("max_retries", DEFAULT_MAX_RETRIES)
+        )
+        if self.manifest:
+            self.manifest.save()
+        for (result, *_), e in failures:
+            for item in result if isinstance(result, list) else [result]:
+                item.update(status="failed", error=str(e))
+        seconds = time.perf_counter() - start
+        size = sum(result.get("bytes", 0) for result in results)
+        failed = sum(1 for result in results if result["status"] == "failed")
+        for result in results:
+            if result["status"] == "failed":
+                logging.error(f"[AzureBlob] Failed to {result['action']} {result['container']}/"
+                              f"{result.get('blob_name', '')}: {result['error']}")
+        logging.info(f"[AzureBlob] Ran {len(results)} operations ({failed} failed), "
+                     f"{size} bytes in {seconds:.1f}s")
+        return {
+            "results": results,
+            "completed": len(results) - failed,
+            "failed": failed,
+            "bytes": size,
+            "seconds": seconds,
+            "throughput": size / seconds if seconds else 0.0
+        }
+
+    async def _operation_items(self, operations: list[dict], results: list):
+        pending = collections.defaultdict(list)
+
+        def _result(action, container, blob_name, **kwargs):
+            result = {"action": action, "container": container, "blob_name": blob_name, "status": "pending", **kwargs}
+            results.append(result)
+            return result
+
+        for operation in operations:
+            action = operation["action"]
+            if action == "upload":
+                container = operation.get("container", self.config.get("container"))
+                async for local_path, blob_name in self._local_matches(
+                        operation["local_path"], operation.get("blob_name", "")):
+                    yield _result(action, container, blob_name, local_path=local_path), action, local_path
+                continue
+            containers = operation.get("container", self.config.get("container"))
+            multiple = "pattern" in operation or has_glob(containers)
+            async for container in match_containers(self.client, containers):
+                async for blob_name, relpath, size in self._remote_matches(container, operation):
+                    # Matches in several containers are kept apart by a container directory
+                    if has_glob(containers):
+                        relpath = posixpath.join(container, relpath)
+                    if action in BATCH_OPERATIONS and self.batch_supported:
+                        key = (container, action, operation.get("tier"))
+                        pending[key].append(_result(action, container, blob_name))
+                        if len(pending[key]) == BATCH_SIZE:
+                            yield pending.pop(key), "batch", *key
+                    elif action in BATCH_OPERATIONS:
+                        yield _result(action, container, blob_name), action, operation.get("tier")
+                    elif action == "read":
+                        yield _result(action, container, blob_name), action, operation
+                    elif action == "download":
+                        local_path = operation["local_path"]
+                        if multiple:
+                            local_path = os.path.join(local_path, *relpath.split("/"))
+                        yield _result(action, container, blob_name, local_path=local_path), action, local_path
+                    else:
+                        destination = join_name(operation["destination"], relpath) if multiple else \
+                            operation["destination"]
+                        yield (_result(action, container, blob_name, destination=destination), action,
+                               operation.get("destination_container", container), destination, size)
+        for key, batch in pending.items():
+            yield batch, "batch", *key
+
+    async def _local_matches(self, local_path: str, prefix: str):
+        if has_glob(local_path):
+            paths = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: sorted(glob.glob(local_path, recursive=True)))
+            for path in paths:
+                async for match in self._local_matches(path, join_name(prefix, os.path.basename(path))):
+                    yield match
+        elif os.path.isdir(local_path):
+            async for path in walk_local(local_path):
+                yield path, join_name(prefix, os.path.relpath(path, local_path).replace(os.sep, "/"))
+        else:
+            yield local_path, prefix or os.path.basename(local_path)
+
+    async def _remote_matches(self, container: str, operation: dict):
+        if pattern := operation.get("pattern"):
+            async for match in match_blobs(self.client.get_container_client(container), pattern):
+                yield match
+        else:
+            yield operation["blob_name"], posixpath.basename(operation["blob_name"]), None
+
+    async def _run_operation(self, result, action: str, *args):
+        if action == "batch":
+            await self._run_batch(result, *args)
+            return
+        container, blob_name = result["container"], result["blob_name"]
+        if action == "upload":
+            await self._upload_blob(args[0], container, blob_name)
+            result["bytes"] = os.path.getsize(args[0])
+        elif action == "download":
+            if parent := os.path.dirname(args[0]):
+                os.makedirs(parent, exist_ok=True)
+            await self._download_blob(container, blob_name, args[0])
+            result["bytes"] = os.path.getsize(args[0])
+        elif action == "read":
+            operation = args[0]
+            content = await self._read_blob(
+                container,
+                blob_name,
+                operation.get("encoding", "utf-8"),
+                offset=operation.get("offset"),
+                length=operation.get("length"),
+                start_line=operation.get("start_line"),
+                end_line=operation.get("end_line")
+            )
+            result.update(content=content, bytes=len(content))
+        elif action == "copy":
+            dst_container, destination, size = args
+            src_client = self.client.get_blob_client(container=container, blob=blob_name)
+            if size is None:
+                size = (await src_client.get_blob_properties()).size
+            dst_service, dst_container, dst_name = self._parse_remote(destination) if destination.startswith(
+                ("https://", "http://")) else (self.client, dst_container, destination)
+            await self._copy_blob(src_client, dst_service.get_blob_client(container=dst_container, blob=dst_name),
+                                  size)
+            result["bytes"] = size
+        elif action == "delete":
+            await self.client.get_blob_client(container=container, blob=blob_name).delete_blob()
+            self._indexed_write(container, blob_name, exists=False)
+        else:
+            await self.client.get_blob_client(
+                container=container, blob=blob_name).set_standard_blob_tier(args[0])
+            self._indexed_write(container, blob_name)
+        result["status"] = "completed"
+
+    async def _run_batch(self, results: list, container: str, action: str, tier: str | None):
+        # Up to BATCH_SIZE deletes or tier changes travel in one request, with one status per blob
+        container_client = self.client.get_container_client(container)
+        names = [result["blob_name"] for result in results]
+        try:
+            if action == "delete":
+                responses = await container_client.delete_blobs(*names, raise_on_any_failure=False)
+            else:
+                # The tier of set_tier operations is required by validate_operations
+                responses = await container_client.set_standard_blob_tier_blobs(
+                    cast(str, tier), *names, raise_on_any_failure=False)
+            statuses = [response.status_code async for response in responses]
+        except HttpResponseError as e:
+            # Some accounts and emulators do not accept batch requests: blobs are then handled one by one
+            if self.batch_supported:
+                logging.warning(f"[AzureBlob] Blob batch API unavailable ({e}), falling back to single requests")
+            self.batch_supported = False
+            for result in results:
+                try:
+                    await with_retries(self._run_operation, result, action, tier,
+                                       max_retries=self.config.get("max_retries", DEFAULT_MAX_RETRIES))
+                except Exception as e:
+                    result.update(status="failed", error=str(e))
+            return
+        for result, status in zip(results, statuses):
+            if 200 <= status < 300:
+                result["status"] = "completed"
+                self._indexed_write(container, result["blob_name"], exists=action != "delete")
+            else:
+                result.update(status="failed", error=f"HTTP {status}")
+
+    async def _upload_pack(self, source: str, container: str, prefix: str, pack_cfg: dict):
+        # The tree is streamed as one tar archive, optionally compressed, in place of one blob per file
+        index: dict[str, list[int]] = {}
+        block_size = self.config.get("block_size", DEFAULT_BLOCK_SIZE)
+        blocks = tar_blocks(source, block_size, index)
+        kwargs: dict[str, Any] = {}
+        if codec := self.config.get("compression"):
+            metadata: dict[str, str] = {}
+
+            async def _measured(source_blocks):
+                size = 0
+                async for block in source_blocks:
+                    size += len(block)
+                    yield block
+                # Committed with the block list, once the whole archive has been read
+                metadata[ORIGINAL_SIZE_METADATA] = str(size)
+
+            blocks = compress_blocks(_measured(blocks), codec, block_size, self.config.get("compression_level"))
+            kwargs = {"content_settings": ContentSettings(content_encoding=codec), "metadata": metadata}
+        try:
+            await upload_blocks(
+                self.client.get_blob_client(container=container, blob=archive_name(prefix)),
+                blocks,
+                max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+                **kwargs
+            )
+            index_client = self.client.get_blob_client(container=container, blob=index_name(prefix))
+            # Offsets address the archive bytes, so compressed archives have no index
+            self._indexed_write(container, archive_name(prefix))
+            if pack_cfg.get("index", True) and not codec:
+                await index_client.upload_blob(json.dumps(index).encode("utf-8"), overwrite=True)
+                self._indexed_write(container, index_name(prefix))
+            else:
+                try:
+                    await index_client.delete_blob()
+                except ResourceNotFoundError:
+                    pass
+                self._indexed_write(container, index_name(prefix), exists=False)
+        except Exception as e:
+            raise WorkflowExecutionException(f"Upload of packed directory {source} failed: {e}") from e
+        logging.info(f"Packed {len(index)} files of {source} into {container}/{archive_name(prefix)}")
+
+    async def _download_pack(self, container: str, prefix: str, destination: str) -> bool:
+        blob_client = self.client.get_blob_client(container=container, blob=archive_name(prefix))
+        try:
+            stream = await blob_client.download_blob(
+                max_concurrency=self.config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY), decompress=False)
+        except ResourceNotFoundError:
+            return False
+        chunks = stream.chunks()
+        if codec := content_codec(stream.properties):
+            chunks = decompress_chunks(chunks, codec)
+        try:
+            os.makedirs(destination, exist_ok=True)
+            await extract_tar(chunks, destination)
+        except Exception as e:
+            raise WorkflowExecutionException(f"Extraction of {container}/{archive_name(prefix)} failed: {e}") from e
+        logging.info(f"Extracted {container}/{archive_name(prefix)} to {destination}")
+        return True
+
+    async def _extract_member(self, container: str, blob_name: str, local_path: str) -> bool:
+        # The nearest packed ancestor holds the file, read with a range request through its index
+        parts = blob_name.strip("/").split("/")
+        for depth in range(len(parts) - 1, -1, -1):
+            prefix, member = "/".join(parts[:depth]), "/".join(parts[depth:])
+            try:
+                stream = await self.client.get_blob_client(
+                    container=container, blob=index_name(prefix)).download_blob()
+            except ResourceNotFoundError:
+                continue
+            index = json.loads(await stream.readall())
+            if member not in index:
+                return False
+            offset, size = index[member]
+            os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+            if size:
+                stream = await self.client.get_blob_client(
+                    container=container, blob=archive_name(prefix)).download_blob(
+                    offset=offset, length=size, decompress=False)
+                await write_chunks(stream.chunks(), local_path)
+            else:
+                async with aiofiles.open(local_path, "wb"):
+                    pass
+            logging.info(f"Extracted {member} of {container}/{archive_name(prefix)} to {local_path}")
+            return True
+        return False
+
+    async def _download_file(self, container: str, blob_name: str, local_path: str, properties=_UNKNOWN):
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        await self._download_blob(container, blob_name, local_path, properties)
+
+    async def _copy_blob(self, src_client, dst_client, size: int):
+        try:
+            if size <= self.config.get("copy_from_url_max_size", DEFAULT_COPY_FROM_URL_MAX_SIZE):
+                # Put Blob From URL completes synchronously on the service side
+                if self.credential is not None and hasattr(self.credential, "get_token"):
+                    token = await self.credential.get_token(STORAGE_SCOPE)
+                    await dst_client.upload_blob_from_url(
+                        src_client.url, overwrite=True, source_authorization=f"Bearer {token.token}")
+                else:
+                    await dst_client.upload_blob_from_url(await self._source_sas_url(src_client), overwrite=True)
+            else:
+                if src_client.account_name == dst_client.account_name:
+                    source_url = src_client.url
+                else:
+                    source_url = await self._source_sas_url(src_client)
+                copy = await dst_client.start_copy_from_url(source_url)
+                if copy["copy_status"] != "success":
+                    await self._wait_for_copy(dst_client)
+            if self.index is not None and dst_client.account_name == self.client.account_name:
+                self._indexed_write(dst_client.container_name, dst_client.blob_name)
+            logging.info(f"Copied {src_client.url} to {dst_client.url}")
+        except Exception as e:
+            raise WorkflowExecutionException(f"Copy failed: {e}") from e
+
+    async def _wait_for_copy(self, dst_client):
+        # The next poll is scheduled when the copy is expected to end, given the observed rate
+        delay = COPY_POLL_MIN
+        last = None
+        while True:
+            properties = await dst_client.get_blob_properties()
+            copy = properties.copy
+            if copy.status == "success":
+                return
+            if copy.status != "pending":
+                raise WorkflowExecutionException(f"Copy {copy.status}: {copy.status_description}")
+            copied, total = (int(v) for v in copy.progress.split("/")) if copy.progress else (0, 0)
+            now = time.monotonic()
+            if last is not None and copied > last[0]:
+                rate = (copied - last[0]) / (now - last[1])
+                delay = min(COPY_POLL_MAX, max(COPY_POLL_MIN, (total - copied) / rate))
+            else:
+                delay = min(COPY_POLL_MAX, delay * 2)
+            last = (copied, now)
+            await asyncio.sleep(delay)
+
+    async def _source_sas_url(self, src_client) -> str:
+        # Asynchronous copies across accounts need a source readable by the destination service
+        return await self.sas_url(src_client, expiry=timedelta(hours=1))
+
+    async def _delegation_key(self, account_url: str, account_name: str, expires_on: datetime):
+        now = datetime.now(timezone.utc)
+        key, expiry = self._delegation_keys.get(account_name, (None, now))
+        if key is None or expiry - expires_on < timedelta(minutes=10):
+            expiry = max(now + timedelta(hours=1), expires_on + timedelta(minutes=10))
+            key = await self._service_client(account_url).get_user_delegation_key(now - timedelta(minutes=5), expiry)
+            self._delegation_keys[account_name] = (key, expiry)
+        return key
+
+    async def sas_url(self, client, expiry: timedelta, permission: str = "r") -> str:
+        # Read-only URL for a blob or, given a container client, for the whole container. Signed with the
+        # account key when configured, otherwise with a user delegation key of the connector credential
+        if sas_token := self.config.get("sas_token"):
+            return f"{client.url}?{sas_token.lstrip('?')}"
+        expires_on = datetime.now(timezone.utc) + expiry
+        is_blob = getattr(client, "blob_name", None) is not None
+        kwargs = {
+            "account_name": client.account_name,
+            "container_name": client.container_name,
+            "expiry": expires_on
+        }
+        if account_key := self.config.get("account_key"):
+            kwargs["account_key"] = account_key
+        else:
+            url = urlparse(client.url)
+            kwargs["user_delegation_key"] = await self._delegation_key(
+                f"{url.scheme}://{url.netloc}", client.account_name, expires_on)
+        if is_blob:
+            sas_token = generate_blob_sas(
+                blob_name=client.blob_name, permission=BlobSasPermissions.from_string(permission), **kwargs)
+        else:
+            sas_token = generate_container_sas(permission=ContainerSasPermissions.from_string(permission), **kwargs)
+        return f"{client.url}?{sas_token}"
 
     async def get_available_locations(self) -> dict:
         return {}
 
-    async def get_stream_reader(self, location: ExecutionLocation, command: list[str]):
-        return None
+    async def get_stream_reader(self, location: ExecutionLocation, src: str) -> ChunkStreamContextManager:
+        container, blob_name = self._remote_path(src)
+        return ChunkStreamContextManager(self.iter_blob(container, blob_name))
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError
+
+from azure_streamflow.compression import compressed_encoding, content_codec, original_size
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "streamflow-azure", "blobs")
+DEFAULT_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+_caches: dict[str, BlobCache] = {}
+
+
+class BlobCache:
+    # On-disk read-through cache of whole blobs, revalidated with If-None-Match and evicted in LRU order.
+    # Instances are shared by directory, so that all connectors of a process coordinate on the same files
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self.index_path = os.path.join(directory, "index.json")
+        self.entries: collections.OrderedDict[str, dict] = collections.OrderedDict()
+        self.locks: dict[str, asyncio.Lock] = {}
+        # Entries being read are pinned, and never evicted under their readers
+        self.readers: collections.Counter[str] = collections.Counter()
+        self.size = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "evictions": 0,
+            "bytes_served": 0,
+            "bytes_fetched": 0
+        }
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path) as f:
+                for key, entry in json.load(f):
+                    if os.path.exists(self._path(key)):
+                        self.entries[key] = entry
+                        self.size += entry["size"]
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def get(cls, directory: str = DEFAULT_CACHE_DIRECTORY, max_size: int = DEFAULT_CACHE_SIZE) -> BlobCache:
+        directory = os.path.abspath(directory)
+        if directory not in _caches:
+            _caches[directory] = cls(directory, max_size)
+        else:
+            _caches[directory].max_size = min(_caches[directory].max_size, max_size)
+        return _caches[directory]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _key(blob_client) -> str:
+        return f"{blob_client.account_name}/{blob_client.container_name}/{blob_client.blob_name}"
+
+    def encoding(self, blob_client) -> str | None:
+        return self.entries.get(self._key(blob_client), {}).get("encoding")
+
+    def original_size(self, blob_client) -> int | None:
+        # Unknown for blobs compressed by other tools
+        entry = self.entries[self._key(blob_client)]
+        return entry.get("original_size", None if "encoding" in entry else entry["size"])
+
+    @contextlib.asynccontextmanager
+    async def open(self, blob_client):
+        key = self._key(blob_client)
+        self.readers[key] += 1
+        try:
+            yield await self.fetch(blob_client)
+        finally:
+            self.readers[key] -= 1
+            if self.readers[key] <= 0:
+                del self.readers[key]
+            if self.size > self.max_size:
+                self._evict()
+                self.save()
+
+    async def fetch(self, blob_client) -> str:
+        key = self._key(blob_client)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            path = self._path(key)
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.stats["revalidations"] += 1
+                try:
+                    stream = await blob_client.download_blob(
+                        etag=entry["etag"], match_condition=MatchConditions.IfModified, decompress=False)
+                except HttpResponseError as e:
+                    if e.status_code != 304:
+                        raise
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["bytes_served"] += entry["size"]
+                    return path
+            else:
+                stream = await blob_client.download_blob(decompress=False)
+            self.stats["misses"] += 1
+            tmp_path = f"{path}.{id(stream)}.tmp"
+            loop = asyncio.get_running_loop()
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for chunk in stream.chunks():
+                        await loop.run_in_executor(None, f.write, chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                raise
+            if entry is not None:
+                self.size -= entry["size"]
+            self.entries[key] = {"etag": stream.properties.etag, "size": size}
+            # Compressed blobs are cached as stored and decoded when read
+            if codec := compressed_encoding(stream.properties):
+                self.entries[key].update(encoding=codec, original_size=original_size(stream.properties))
+            elif codec := content_codec(stream.properties):
+                self.entries[key]["encoding"] = codec
+            self.entries.move_to_end(key)
+            self.size += size
+            self.stats["bytes_fetched"] += size
+            self.stats["bytes_served"] += size
+            self._evict(keep=key)
+            self.save()
+            return path
+
+    def _evict(self, keep: str | None = None):
+        for key in list(self.entries):
+            if self.size <= self.max_size:
+                break
+            if key == keep or key in self.readers or (key in self.locks and self.locks[key].locked()):
+                continue
+            entry = self.entries.pop(key)
+            self.size -= entry["size"]
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            logging.debug(f"Evicted {key} from blob cache")
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp_path, self.index_path)
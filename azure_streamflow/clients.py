@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from typing import Any, Callable
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+from azure_streamflow.governor import ConcurrencyGovernor, GovernedTransport
+
+CONNECTION_LIMIT = 200
+CONNECTION_LIMIT_PER_HOST = 100
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+_registries: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+class ClientRegistry:
+    # Reference-counted Azure credentials and clients shared by all connectors running on an event loop.
+    # Clients are keyed by endpoint and credential identity and send requests through one aiohttp session.
+    # Requests to an account go through its concurrency governor, whatever the credential
+    def __init__(self):
+        self.entries: dict[tuple, list] = {}
+        self.governors: dict[tuple, ConcurrencyGovernor] = {}
+
+    @classmethod
+    def get(cls) -> ClientRegistry:
+        loop = asyncio.get_running_loop()
+        if loop not in _registries:
+            _registries[loop] = cls()
+        return _registries[loop]
+
+    def _acquire(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        if key not in self.entries:
+            self.entries[key] = [factory(), 0]
+        self.entries[key][1] += 1
+        return self.entries[key][0]
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        logging.debug("[AzureClients] Opening shared HTTP session")
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                use_dns_cache=True
+            ),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            # Like the transports created by the SDKs, bodies are decoded by the pipeline when asked to
+            auto_decompress=False,
+            trust_env=True
+        )
+
+    def credential(self, identity: tuple, factory: Callable[[], Any]) -> Any:
+        return self._acquire(("credential", *identity), factory)
+
+    def governor(self, kind: str, endpoint: str) -> ConcurrencyGovernor:
+        key = (kind, endpoint.rstrip("/"))
+        if key not in self.governors:
+            self.governors[key] = ConcurrencyGovernor(f"{kind}:{endpoint.rstrip('/')}")
+        return self.governors[key]
+
+    def client(self, kind: str, endpoint: str, identity: tuple, factory: Callable[[GovernedTransport], Any]) -> Any:
+        def _create():
+            session = self._acquire(("session",), self._create_session)
+            return factory(GovernedTransport(
+                AioHttpTransport(session=session, session_owner=False), self.governor(kind, endpoint)))
+
+        return self._acquire((kind, endpoint.rstrip("/"), *identity), _create)
+
+    async def _release(self, key: tuple):
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.entries[key]
+            # Key and SAS credentials hold no resources
+            if hasattr(entry[0], "close"):
+                await entry[0].close()
+            if key[0] not in ("credential", "session"):
+                await self._release(("session",))
+
+    async def release_credential(self, identity: tuple):
+        await self._release(("credential", *identity))
+
+    async def release_client(self, kind: str, endpoint: str, identity: tuple):
+        await self._release((kind, endpoint.rstrip("/"), *identity))
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import zlib
+from typing import AsyncIterator
+
+import aiofiles
+from streamflow.core.exception import WorkflowDefinitionException
+
+CODECS = ("gzip", "zstd")
+# Content encodings of blobs written by other tools, which downloads decode as the SDK used to
+HTTP_ENCODINGS = ("gzip", "deflate")
+DEFAULT_LEVEL = {"gzip": 6, "zstd": 3}
+ORIGINAL_SIZE_METADATA = "streamflow_size"
+ORIGINAL_MD5_METADATA = "streamflow_md5"
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise WorkflowDefinitionException(
+            "The zstd compression requires the zstandard package, install streamflow-azure[zstd]") from e
+    return zstandard
+
+
+def check_codec(codec: str):
+    # Rejects a configuration that could not compress or read its blobs before any transfer starts
+    if codec not in CODECS:
+        raise WorkflowDefinitionException(f"Unknown compression codec: {codec}")
+    if codec == "zstd":
+        _zstandard()
+
+
+def compressor(codec: str, level: int | None = None):
+    level = DEFAULT_LEVEL[codec] if level is None else level
+    if codec == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if codec == "zstd":
+        return _zstandard().ZstdCompressor(level=level).compressobj()
+    raise WorkflowDefinitionException(f"Unknown compression codec: {codec}")
+
+
+def decompressor(codec: str):
+    if codec == "gzip":
+        return zlib.decompressobj(31)
+    if codec == "deflate":
+        # Either zlib or gzip framed, as clients send both
+        return zlib.decompressobj(47)
+    if codec == "zstd":
+        return _zstandard().ZstdDecompressor().decompressobj()
+    raise WorkflowDefinitionException(f"Unknown compression codec: {codec}")
+
+
+def compressed_encoding(properties) -> str | None:
+    # Blobs compressed by this plugin, which carry their original size and can be read by range
+    content_settings = getattr(properties, "content_settings", None)
+    encoding = getattr(content_settings, "content_encoding", None)
+    metadata = getattr(properties, "metadata", None) or {}
+    return encoding if encoding in CODECS and ORIGINAL_SIZE_METADATA in metadata else None
+
+
+def foreign_encoding(properties) -> str | None:
+    # Compressed blobs without the original size, whose decoded size is only known once read
+    content_settings = getattr(properties, "content_settings", None)
+    encoding = getattr(content_settings, "content_encoding", None)
+    return encoding if encoding in HTTP_ENCODINGS and not compressed_encoding(properties) else None
+
+
+def content_codec(properties) -> str | None:
+    return compressed_encoding(properties) or foreign_encoding(properties)
+
+
+def original_size(properties) -> int:
+    if compressed_encoding(properties):
+        return int(properties.metadata[ORIGINAL_SIZE_METADATA])
+    return properties.size
+
+
+async def compress_blocks(source: AsyncIterator[bytes], codec: str, block_size: int,
+                          level: int | None = None) -> AsyncIterator[bytes]:
+    # Compression runs in a worker thread, one input block at a time, and the output is cut into
+    # blocks of block_size again
+    loop = asyncio.get_running_loop()
+    compress = compressor(codec, level)
+    buffer = bytearray()
+    async for data in source:
+        buffer.extend(await loop.run_in_executor(None, compress.compress, data))
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    buffer.extend(await loop.run_in_executor(None, compress.flush))
+    for offset in range(0, len(buffer), block_size):
+        yield bytes(buffer[offset:offset + block_size])
+
+
+async def decompress_chunks(chunks: AsyncIterator[bytes], codec: str) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    decompress = decompressor(codec)
+    async for chunk in chunks:
+        if data := await loop.run_in_executor(None, decompress.decompress, chunk):
+            yield data
+    if hasattr(decompress, "flush") and (data := decompress.flush()):
+        yield data
+
+
+async def _aiter(items: list[bytes]) -> AsyncIterator[bytes]:
+    for item in items:
+        yield item
+
+
+async def slice_chunks(chunks: AsyncIterator[bytes], offset: int | None = None,
+                       length: int | None = None) -> AsyncIterator[bytes]:
+    # Ranges of a compressed blob address the compressed bytes, so they are applied after decoding.
+    # A negative offset counts from the end, which is only known once the last chunk is decoded
+    if offset is not None and offset < 0:
+        tail = bytearray()
+        async for chunk in chunks:
+            tail.extend(chunk)
+            del tail[:max(0, len(tail) + offset)]
+        chunks, offset = _aiter([bytes(tail)]), 0
+    skip = offset or 0
+    remaining = length
+    async for chunk in chunks:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        chunk, skip = chunk[skip:], 0
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if chunk:
+            yield chunk
+        if remaining == 0:
+            break
+
+
+async def write_chunks(chunks: AsyncIterator[bytes], local_path: str) -> int:
+    size = 0
+    async with aiofiles.open(local_path, "wb") as f:
+        async for chunk in chunks:
+            await f.write(chunk)
+            size += len(chunk)
+    return size
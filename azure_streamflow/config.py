@@ -2,10 +2,13 @@ import os
 
 class AzureConfig:
     def __init__(self, config: dict):
+        self.config = config
         self.batch_account_url = config.get("batch_account_url") or os.environ.get("AZURE_BATCH_ACCOUNT_URL")
         self.client_id = config.get("client_id") or os.environ.get("AZURE_CLIENT_ID")
         self.client_secret = config.get("client_secret") or os.environ.get("AZURE_CLIENT_SECRET")
         self.tenant_id = config.get("tenant_id") or os.environ.get("AZURE_TENANT_ID")
+        self.managed_identity = config.get("managed_identity")
+        self.subscription_id = config.get("subscription_id") or os.environ.get("AZURE_SUBSCRIPTION_ID")
 
         self.validate()
 
@@ -13,12 +16,14 @@ class AzureConfig:
         missing = []
         if not self.batch_account_url:
             missing.append("batch_account_url")
-        if not self.client_id:
-            missing.append("client_id")
-        if not self.client_secret:
-            missing.append("client_secret")
-        if not self.tenant_id:
-            missing.append("tenant_id")
+        # A managed identity replaces the service principal secret
+        if not self.managed_identity:
+            if not self.client_id:
+                missing.append("client_id")
+            if not self.client_secret:
+                missing.append("client_secret")
+            if not self.tenant_id:
+                missing.append("tenant_id")
         if missing:
             raise ValueError(f"Missing configuration values: {', '.join(missing)}")
 
@@ -28,6 +33,8 @@ class AzureConfig:
             "client_id": self.client_id,
             "client_secret": self.client_secret,
             "tenant_id": self.tenant_id,
+            "managed_identity": self.managed_identity,
+            "subscription_id": self.subscription_id,
         }
 
     def __str__(self):
@@ -1,6 +1,18 @@
+import asyncio
 import logging
+from azure.core.exceptions import HttpResponseError
 from azure.batch.aio import BatchClient
 from azure.identity.aio import DefaultAzureCredential
+from azure_streamflow.clients import ClientRegistry
+from azure_streamflow.credentials import select_credential
+from azure_streamflow.metrics import client_options
+from azure_streamflow.nodes import NodeMonitor
+from azure_streamflow.poller import TaskStatePoller
+from azure_streamflow.pools import NODE_AGENT_SKU_ID, WarmPools
+from azure_streamflow.submission import TaskSubmissionQueue
+
+MAX_RESIZE_ATTEMPTS = 3
+RESIZE_RETRY = 5.0
 
 
 class AzureExecutor:
@@ -8,18 +20,35 @@ class AzureExecutor:
         self.config = config
         self.credentials: DefaultAzureCredential | None = None
         self.batch_client: BatchClient | None = None
+        self.credential_identity: tuple | None = None
+        self.registry: ClientRegistry | None = None
+        self.submission_queue = TaskSubmissionQueue(self)
+        self.pollers: dict[str, TaskStatePoller] = {}
+        self.warm_pools = WarmPools(self)
+        self.node_monitors: dict[str, NodeMonitor] = {}
 
     async def initialize(self):
-        self.credentials = DefaultAzureCredential()
-        self.batch_client = BatchClient(
-            endpoint=self.config.batch_account_url,  # <-- CORRETTO QUI
-            credential=self.credentials
+        self.registry = ClientRegistry.get()
+        self.credential_identity, credential_factory = select_credential(
+            {**self.config.config, **self.config.as_dict()}, DefaultAzureCredential)
+        self.credentials = self.registry.credential(self.credential_identity, credential_factory)
+        self.batch_client = self.registry.client(
+            "batch",
+            self.config.batch_account_url,
+            self.credential_identity,
+            lambda transport: BatchClient(
+                endpoint=self.config.batch_account_url,
+                credential=self.credentials,
+                transport=transport,
+                **client_options("batch")
+            )
         )
         logging.info(f"[AzureExecutor] Initialized with endpoint: {self.config.batch_account_url}")
 
-    async def create_pool(self, pool_id, vm_size, node_count, publisher, offer, sku):
+    async def create_pool(self, pool_id, vm_size, node_count, publisher, offer, sku, metadata=None,
+                          task_slots_per_node=1):
         logging.info(f"[AzureExecutor] Creating pool {pool_id}")
-        await self.batch_client.pool.add({
+        pool = {
             'id': pool_id,
             'vm_size': vm_size,
             'virtual_machine_configuration': {
@@ -28,10 +57,14 @@ class AzureExecutor:
                     'offer': offer,
                     'sku': sku
                 },
-                'node_agent_sku_id': 'batch.node.ubuntu 18.04'
+                'node_agent_sku_id': NODE_AGENT_SKU_ID
             },
-            'target_dedicated_nodes': node_count
-        })
+            'target_dedicated_nodes': node_count,
+            'task_slots_per_node': task_slots_per_node
+        }
+        if metadata:
+            pool['metadata'] = [{'name': k, 'value': v} for k, v in metadata.items()]
+        await self.batch_client.pool.add(pool)
         logging.info(f"[AzureExecutor] Pool {pool_id} created successfully")
 
     async def submit_job(self, job_id, pool_id):
@@ -44,8 +77,7 @@ class AzureExecutor:
         })
         logging.info(f"[AzureExecutor] Job {job_id} submitted successfully")
 
-    async def submit_task(self, job_id, task_id, command_line, resource_files=None):
-        logging.info(f"[AzureExecutor] Submitting task {task_id} to job {job_id}")
+    def _task_spec(self, task_id, command_line, resource_files=None, output_files=None):
         task = {
             'id': task_id,
             'command_line': command_line,
@@ -53,16 +85,59 @@ class AzureExecutor:
 
         if resource_files:
             task['resource_files'] = resource_files
+        if output_files:
+            task['output_files'] = output_files
+        return task
 
+    async def submit_task(self, job_id, task_id, command_line, resource_files=None):
+        logging.info(f"[AzureExecutor] Submitting task {task_id} to job {job_id}")
+        task = self._task_spec(task_id, command_line, resource_files)
         await self.batch_client.task.add(job_id, task)
         logging.info(f"[AzureExecutor] Task {task_id} submitted successfully")
 
+    async def enqueue_task(self, job_id, task_id, command_line, resource_files=None, output_files=None):
+        # Tasks are grouped with the ones submitted concurrently into add-collection calls
+        logging.debug(f"[AzureExecutor] Queueing task {task_id} for job {job_id}")
+        task = self._task_spec(task_id, command_line, resource_files, output_files)
+        return await self.submission_queue.submit(job_id, task)
+
     async def monitor_job(self, job_id):
         logging.info(f"[AzureExecutor] Monitoring job: {job_id}")
         job_status = await self.batch_client.job.get(job_id)
         logging.info(f"[AzureExecutor] Job {job_id} status: {job_status.state}")
         return job_status.state
 
+    def task_poller(self, job_id) -> TaskStatePoller:
+        if job_id not in self.pollers:
+            self.pollers[job_id] = TaskStatePoller(self, job_id)
+        return self.pollers[job_id]
+
+    def node_monitor(self, pool_id) -> NodeMonitor:
+        if pool_id not in self.node_monitors:
+            self.node_monitors[pool_id] = NodeMonitor(self, pool_id)
+        return self.node_monitors[pool_id]
+
+    async def resize_pool(self, pool_id, node_count):
+        logging.info(f"[AzureExecutor] Resizing pool {pool_id} to {node_count} nodes")
+        for attempt in range(MAX_RESIZE_ATTEMPTS):
+            try:
+                await self.batch_client.pool.resize(pool_id, {
+                    'target_dedicated_nodes': node_count,
+                    'node_deallocation_option': 'taskcompletion'
+                })
+                return
+            except HttpResponseError as e:
+                # A pool cannot be resized while a previous resize is in progress
+                if e.status_code != 409 or attempt == MAX_RESIZE_ATTEMPTS - 1:
+                    raise
+                await self.batch_client.pool.stop_resize(pool_id)
+                await asyncio.sleep(RESIZE_RETRY)
+
+    @property
+    def pending_tasks(self) -> int:
+        # Tasks waiting for submission plus the submitted ones that did not complete yet
+        return self.submission_queue.depth + sum(poller.active for poller in self.pollers.values())
+
     async def delete_pool(self, pool_id):
         logging.info(f"[AzureExecutor] Deleting pool: {pool_id}")
         await self.batch_client.pool.delete(pool_id)
@@ -70,7 +145,17 @@ class AzureExecutor:
 
     async def close(self):
         logging.info("[AzureExecutor] Closing resources...")
-        if self.batch_client:
-            await self.batch_client.close()
-        if self.credentials:
-            await self.credentials.close()
+        await self.submission_queue.close()
+        for poller in self.pollers.values():
+            await poller.close()
+        self.pollers = {}
+        for monitor in self.node_monitors.values():
+            await monitor.close()
+        self.node_monitors = {}
+        if self.registry:
+            if self.batch_client:
+                await self.registry.release_client("batch", self.config.batch_account_url, self.credential_identity)
+            if self.credentials:
+                await self.registry.release_credential(self.credential_identity)
+        self.batch_client = None
+        self.credentials = None
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from azure.core.pipeline.transport import AsyncHttpTransport
+
+from azure_streamflow.metrics import THROTTLE_STATUSES, instrumentation
+
+INITIAL_WINDOW = 16
+MIN_WINDOW = 1
+MAX_WINDOW = 100
+DECREASE_FACTOR = 0.5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+def retry_after(headers) -> float | None:
+    if value := headers.get("x-ms-retry-after-ms") or headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if value := headers.get("Retry-After"):
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class ConcurrencyGovernor:
+    # Shared limit on the requests in flight to one account. The window grows by one request per window
+    # of successful requests and is cut by DECREASE_FACTOR on throttling, once per throttling episode:
+    # requests sent before the last cut do not cut it again. Throttling also pauses every sender until
+    # the Retry-After interval, or a jittered exponential backoff, has elapsed
+    def __init__(self, name: str, initial: float = INITIAL_WINDOW, minimum: float = MIN_WINDOW,
+                 maximum: float = MAX_WINDOW):
+        self.name = name
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttles = 0
+        self.condition: asyncio.Condition | None = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Created on first use, inside the running event loop
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def acquire(self) -> float:
+        condition = self._condition()
+        async with condition:
+            while True:
+                if (delay := self.paused_until - time.monotonic()) > 0:
+                    condition.release()
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        await condition.acquire()
+                elif self.in_flight < max(self.minimum, int(self.window)):
+                    self.in_flight += 1
+                    return time.monotonic()
+                else:
+                    await condition.wait()
+
+    async def release(self, started: float, throttled: bool = False, delay: float | None = None):
+        condition = self._condition()
+        async with condition:
+            self.in_flight -= 1
+            if throttled:
+                self._throttled(started, delay)
+            else:
+                self.throttles = 0
+                self.window = min(self.maximum, self.window + 1 / self.window)
+            instrumentation().gauge("azure_concurrency_window", self.window, account=self.name)
+            condition.notify_all()
+
+    def _throttled(self, started: float, delay: float | None):
+        now = time.monotonic()
+        if started >= self.last_decrease:
+            self.window = max(self.minimum, self.window * DECREASE_FACTOR)
+            self.last_decrease = now
+            self.throttles += 1
+            logging.debug(f"[AzureGovernor] Throttled by {self.name}, window reduced to {self.window:.1f}")
+        if delay is None:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.throttles - 1)) * (0.5 + random.random() / 2)
+        self.paused_until = max(self.paused_until, now + delay)
+
+
+class GovernedTransport(AsyncHttpTransport):
+    # Sends every attempt of every request of a client through the governor of its account
+    def __init__(self, transport: AsyncHttpTransport, governor: ConcurrencyGovernor):
+        self.transport = transport
+        self.governor = governor
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    async def send(self, request, **kwargs):
+        started = await self.governor.acquire()
+        throttled, delay = False, None
+        try:
+            response = await self.transport.send(request, **kwargs)
+            if response.status_code in THROTTLE_STATUSES:
+                throttled, delay = True, retry_after(response.headers)
+            return response
+        finally:
+            await self.governor.release(started, throttled, delay)
+
+    async def open(self):
+        await self.transport.open()
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.transport.__aexit__(*args)
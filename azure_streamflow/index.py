@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import posixpath
+import time
+from typing import Any
+
+from azure.storage.blob.aio import BlobPrefix
+
+DEFAULT_INDEX_TTL = 30.0
+# Returned for names outside every fresh listing, which need a request of their own
+UNKNOWN = object()
+
+
+def _ancestors(name: str) -> list[str]:
+    # Directories holding the name, from the container root down to its parent
+    directories: list[str] = []
+    directory = posixpath.dirname(name)
+    while directory:
+        directories.insert(0, directory)
+        directory = posixpath.dirname(directory)
+    return ["", *directories]
+
+
+class _Listing:
+    # Blobs below a prefix, either the whole subtree (deep) or one level with the child prefixes (shallow).
+    # Blobs are counted per directory, so that emptied directories stop being reported
+    def __init__(self, prefix: str, blobs: dict, prefixes: set, deep: bool, loaded_at: float):
+        self.prefix = prefix
+        self.blobs: dict[str, Any] = {}
+        self.prefixes = prefixes
+        self.deep = deep
+        self.loaded_at = loaded_at
+        self.counts: collections.Counter[str] = collections.Counter()
+        for name, properties in blobs.items():
+            self.set(name, properties)
+
+    def covers(self, name: str) -> bool:
+        return self.deep or posixpath.dirname(name) == self.prefix
+
+    def set(self, name: str, properties):
+        present = self.blobs.get(name) is not None
+        self.blobs[name] = properties
+        if present != (properties is not None):
+            delta = 1 if properties is not None else -1
+            for directory in _ancestors(name):
+                self.counts[directory] += delta
+                if self.counts[directory] <= 0:
+                    del self.counts[directory]
+
+    def has_directory(self, directory: str) -> bool:
+        return (self.counts[directory] > 0 or directory in self.prefixes
+                or (bool(self.prefixes) and directory in (self.prefix, *_ancestors(self.prefix))))
+
+    def entries(self, prefix: str) -> dict:
+        start = prefix + "/" if prefix else ""
+        return {name: properties for name, properties in self.blobs.items()
+                if name.startswith(start) and properties is not None}
+
+
+class PrefixIndex:
+    # In-memory index of blob properties, built from paged listings of prefixes, so that existence and
+    # property lookups cost one request per page instead of one per blob. Listings expire after a TTL,
+    # and the writes of this connector update them in place
+    def __init__(self, ttl: float = DEFAULT_INDEX_TTL):
+        self.ttl = ttl
+        self.listings: dict[tuple[str, str], _Listing] = {}
+        self.loading: dict[tuple[str, str, bool], asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "listings": 0}
+
+    def _fresh(self, container: str, prefix: str) -> _Listing | None:
+        if (listing := self.listings.get((container, prefix))) is not None:
+            if time.monotonic() - listing.loaded_at < self.ttl:
+                return listing
+            del self.listings[(container, prefix)]
+        return None
+
+    def _listing(self, container: str, name: str) -> _Listing | None:
+        # The broadest fresh listing covering the name answers for it
+        for prefix in _ancestors(name):
+            if (listing := self._fresh(container, prefix)) is not None and listing.covers(name):
+                return listing
+        return None
+
+    def covers(self, container: str, name: str) -> bool:
+        return self._listing(container, name) is not None
+
+    def lookup(self, container: str, name: str):
+        listing = self._listing(container, name)
+        properties = UNKNOWN if listing is None else listing.blobs.get(name)
+        self.stats["misses" if properties is UNKNOWN else "hits"] += 1
+        return properties
+
+    def is_directory(self, container: str, name: str):
+        directory = name.strip("/")
+        for prefix in [*_ancestors(directory), directory] if directory else [""]:
+            listing = self._fresh(container, prefix)
+            if listing is not None and (listing.deep or prefix in (directory, posixpath.dirname(directory))):
+                return listing.has_directory(directory)
+        return UNKNOWN
+
+    def entries(self, container: str, prefix: str) -> dict | None:
+        prefix = prefix.strip("/")
+        for candidate in [*_ancestors(prefix), prefix] if prefix else [""]:
+            if (listing := self._fresh(container, candidate)) is not None and listing.deep:
+                return listing.entries(prefix)
+        return None
+
+    async def load(self, container_client, container: str, prefix: str, deep: bool = False) -> _Listing:
+        prefix = prefix.strip("/")
+        key = (container, prefix, deep)
+        if key not in self.loading:
+            self.loading[key] = asyncio.ensure_future(self._load(container_client, container, prefix, deep))
+        try:
+            return await asyncio.shield(self.loading[key])
+        finally:
+            if key in self.loading and self.loading[key].done():
+                del self.loading[key]
+
+    async def _load(self, container_client, container: str, prefix: str, deep: bool) -> _Listing:
+        start = prefix + "/" if prefix else ""
+        blobs, prefixes = {}, set()
+        if deep:
+            async for blob in container_client.list_blobs(name_starts_with=start, include=["metadata"]):
+                blobs[blob.name] = blob
+        else:
+            async for item in container_client.walk_blobs(name_starts_with=start, include=["metadata"],
+                                                          delimiter="/"):
+                if isinstance(item, BlobPrefix):
+                    prefixes.add(item.name.rstrip("/"))
+                else:
+                    blobs[item.name] = item
+        # Freshness starts once the last page has arrived, however long the listing took
+        listing = _Listing(prefix, blobs, prefixes, deep, time.monotonic())
+        current = self._fresh(container, prefix)
+        if deep or current is None or not current.deep:
+            self.listings[(container, prefix)] = listing
+        self.stats["listings"] += 1
+        logging.debug(f"[AzureBlob] Indexed {len(blobs)} blobs and {len(prefixes)} prefixes of {container}/{prefix}")
+        return listing
+
+    def _updated(self, container: str, name: str, properties, removed: bool = False):
+        for prefix in _ancestors(name):
+            if (listing := self.listings.get((container, prefix))) is None:
+                continue
+            if listing.covers(name):
+                listing.set(name, properties)
+            elif properties is not None:
+                listing.prefixes.add(posixpath.join(prefix, name[len(prefix):].lstrip("/").split("/")[0]))
+            elif removed:
+                # Whether the child prefix still holds other blobs is unknown to a shallow listing
+                del self.listings[(container, prefix)]
+
+    def put(self, container: str, name: str, properties):
+        self._updated(container, name, properties)
+
+    def invalidate(self, container: str, name: str):
+        # The blob exists, with properties that the next lookup fetches again
+        self._updated(container, name, UNKNOWN)
+
+    def remove(self, container: str, name: str):
+        self._updated(container, name, None, removed=True)
@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import os
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Mapping
+from urllib.parse import parse_qs, urlparse
+
+from aiohttp import web
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from streamflow.core.exception import WorkflowDefinitionException
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(4 ** i * 1024 for i in range(11))
+THROUGHPUT_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(-4, 12))
+SPAN_HISTORY = 1024
+# Batch throttles with 429, Storage with 503 ServerBusy
+THROTTLE_STATUSES = (429, 503)
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("azure_streamflow_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "end")
+
+    def __init__(self, name: str, parent: Span | None, attributes: dict):
+        self.name = name
+        self.trace_id: str = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id: str = uuid.uuid4().hex[:16]
+        self.parent_id: str | None = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: float | None = None
+
+
+class Instrumentation:
+    # No-op instrumentation, used unless metrics are configured. Subclasses record latency histograms,
+    # counters and gauges identified by a name and a set of labels
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def increment(self, name: str, value: float = 1, **labels):
+        pass
+
+    def gauge(self, name: str, value: float, **labels):
+        pass
+
+    def start_span(self, name: str, attributes: dict) -> Any:
+        return None
+
+    def end_span(self, span: Any, error: BaseException | None):
+        pass
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        # Spans opened while another span is active become its children, so that a StreamFlow step is
+        # tied to the Azure calls it causes
+        span = self.start_span(name, attributes)
+        token = _current_span.set(span) if isinstance(span, Span) else None
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span, None)
+        finally:
+            if token is not None:
+                _current_span.reset(token)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    async def close(self):
+        pass
+
+
+class MetricsRecorder(Instrumentation):
+    # In-memory metrics with a Prometheus text exporter. Histograms use fixed buckets, chosen by name
+    def __init__(self):
+        self.histograms: dict[tuple, list] = {}
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+        self.spans: deque[Span] = deque(maxlen=SPAN_HISTORY)
+
+    @staticmethod
+    def _key(name: str, labels: Mapping[str, Any]) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        if name.endswith("_bytes"):
+            buckets = BYTES_BUCKETS
+        elif name.endswith("_bytes_per_second"):
+            buckets = THROUGHPUT_BUCKETS
+        else:
+            buckets = LATENCY_BUCKETS
+        histogram = self.histograms.setdefault(self._key(name, labels), [buckets, [0] * (len(buckets) + 1), 0.0, 0])
+        histogram[1][bisect_left(buckets, value)] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def start_span(self, name: str, attributes: dict) -> Span:
+        return Span(name, _current_span.get(), attributes)
+
+    def end_span(self, span: Span, error: BaseException | None):
+        span.end = time.time()
+        if error is not None:
+            span.attributes["error"] = type(error).__name__
+        self.spans.append(span)
+        self.observe("azure_span_seconds", span.end - span.start, span=span.name)
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = "") -> str:
+        rendered = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            rendered.append(extra)
+        return "{" + ",".join(rendered) + "}" if rendered else ""
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(metrics.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {value}")
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (buckets, counts, total, count) in sorted(self.histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    bucket_labels = self._labels(labels, 'le="' + str(bound) + '"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {total}")
+                lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter(MetricsRecorder):
+    # Serves the metrics on an HTTP port and/or writes them to a file for the node_exporter textfile collector
+    def __init__(self, port: int | None = None, path: str | None = None):
+        super().__init__()
+        self.port = port
+        self.path = path
+        self.runner = None
+
+    async def start(self):
+        if self.port is not None and self.runner is None:
+            async def handle(_request):
+                return web.Response(text=self.prometheus_text(), content_type="text/plain", charset="utf-8")
+
+            app = web.Application()
+            app.router.add_get("/metrics", handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, port=self.port).start()
+            logging.info(f"[AzureMetrics] Serving Prometheus metrics on port {self.port}")
+
+    def write(self):
+        if self.path:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.path)
+
+    async def close(self):
+        self.write()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    # Forwards metrics and spans to the globally configured OpenTelemetry providers
+    def __init__(self):
+        try:
+            from opentelemetry import context, metrics, trace
+        except ImportError as e:
+            raise WorkflowDefinitionException(
+                "The opentelemetry exporter requires the opentelemetry-api package") from e
+        self.context = context
+        self.trace = trace
+        self.meter = metrics.get_meter("azure_streamflow")
+        self.tracer = trace.get_tracer("azure_streamflow")
+        self.instruments: dict[str, Any] = {}
+        self.gauges: dict[tuple, float] = {}
+
+    def _instrument(self, name: str, factory):
+        if name not in self.instruments:
+            self.instruments[name] = factory(name)
+        return self.instruments[name]
+
+    def observe(self, name: str, value: float, **labels):
+        self._instrument(name, self.meter.create_histogram).record(value, attributes=labels)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        self._instrument(name, self.meter.create_counter).add(value, attributes=labels)
+
+    def gauge(self, name: str, value: float, **labels):
+        # Reported as the change since the last value, OpenTelemetry gauges being asynchronous
+        key = MetricsRecorder._key(name, labels)
+        self._instrument(name, self.meter.create_up_down_counter).add(
+            value - self.gauges.get(key, 0), attributes=labels)
+        self.gauges[key] = value
+
+    def start_span(self, name: str, attributes: dict) -> Any:
+        return self.tracer.start_span(name, attributes={k: str(v) for k, v in attributes.items()})
+
+    def end_span(self, span: Any, error: BaseException | None):
+        if error is not None:
+            span.record_exception(error)
+        span.end()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        with self.tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attributes.items()}) as span:
+            yield span
+
+
+_instrumentation: dict[str, Any] = {"current": Instrumentation(), "users": 0}
+
+
+def instrumentation() -> Instrumentation:
+    return _instrumentation["current"]
+
+
+def set_instrumentation(value: Instrumentation | None):
+    _instrumentation["current"] = value or Instrumentation()
+
+
+async def configure_instrumentation(config: Mapping[str, Any] | None) -> Instrumentation:
+    # Metrics are process-wide: the first connector configuring them wins, and the exporter is closed
+    # when the last connector configuring them releases it
+    current = instrumentation()
+    if not config:
+        return current
+    _instrumentation["users"] += 1
+    if type(current) is not Instrumentation:
+        return current
+    exporter = config.get("exporter", "prometheus")
+    if exporter == "prometheus":
+        current = PrometheusExporter(port=config.get("port"), path=config.get("path"))
+        await current.start()
+    elif exporter == "opentelemetry":
+        current = OpenTelemetryInstrumentation()
+    else:
+        raise WorkflowDefinitionException(f"Unknown metrics exporter: {exporter}")
+    set_instrumentation(current)
+    return current
+
+
+async def release_instrumentation():
+    _instrumentation["users"] = max(0, _instrumentation["users"] - 1)
+    if _instrumentation["users"] == 0:
+        current = instrumentation()
+        set_instrumentation(None)
+        await current.close()
+
+
+def traced(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with instrumentation().span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_transfer(direction: str, local_path: str, start: float):
+    current = instrumentation()
+    # Saves a stat per file when metrics are disabled
+    if type(current) is Instrumentation:
+        return
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(local_path)
+    current.observe("azure_blob_transfer_bytes", size, direction=direction)
+    current.observe("azure_blob_transfer_seconds", seconds, direction=direction)
+    if seconds > 0:
+        current.observe("azure_blob_transfer_bytes_per_second", size / seconds, direction=direction)
+
+
+def _operation(service: str, method: str, url: str) -> str:
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split("/") if s]
+    if service == "blob":
+        query = parse_qs(parsed.query)
+        if not segments:
+            resource = "account"
+        else:
+            resource = "container" if len(segments) == 1 or "restype" in query else "blob"
+        return f"{method} {resource}" + (f" {query['comp'][0]}" if "comp" in query else "")
+    # Batch paths alternate collections and identifiers, e.g. /jobs/{id}/tasks/{id}
+    return f"{method} /" + "/".join(s if i % 2 == 0 else "{id}" for i, s in enumerate(segments))
+
+
+class RequestMetricsPolicy(SansIOHTTPPolicy):
+    # Per-retry pipeline policy timing every HTTP attempt made by an Azure client, with the throttling
+    # responses and the retries counted separately
+    def __init__(self, service: str):
+        self.service = service
+
+    def on_request(self, request):
+        context = request.context
+        context["azure_streamflow_start"] = time.perf_counter()
+        # SAS tokens in the query string must not end up in traces
+        context["azure_streamflow_span"] = instrumentation().start_span(
+            f"{self.service} {_operation(self.service, request.http_request.method, request.http_request.url)}",
+            {"url": request.http_request.url.split("?")[0]})
+        attempts = context.get("azure_streamflow_attempts", 0)
+        context["azure_streamflow_attempts"] = attempts + 1
+        if attempts:
+            instrumentation().increment("azure_retries_total", service=self.service, component="sdk")
+
+    def _record(self, request, status: int | str):
+        current = instrumentation()
+        operation = _operation(self.service, request.http_request.method, request.http_request.url)
+        current.observe("azure_request_seconds",
+                        time.perf_counter() - request.context.get("azure_streamflow_start", time.perf_counter()),
+                        service=self.service, operation=operation)
+        if status in THROTTLE_STATUSES:
+            current.increment("azure_throttled_total", service=self.service, operation=operation)
+        if isinstance(status, str) or status >= 400:
+            current.increment("azure_request_errors_total", service=self.service, operation=operation,
+                              status=status)
+        if (span := request.context.get("azure_streamflow_span")) is not None:
+            if isinstance(span, Span):
+                span.attributes["status"] = status
+            current.end_span(span, None)
+
+    def on_response(self, request, response):
+        self._record(request, response.http_response.status_code)
+
+    def on_exception(self, request):
+        self._record(request, "error")
+
+
+def client_options(service: str) -> dict:
+    # Storage clients build their own pipeline and only accept request and response hooks
+    policy = RequestMetricsPolicy(service)
+    if service == "blob":
+        return {"raw_request_hook": policy.on_request,
+                "raw_response_hook": lambda response: policy.on_response(response, response)}
+    return {"per_retry_policies": [policy]}
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import re
+from typing import Any
+
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.metrics import instrumentation
+
+NODE_POLL_MIN = 2.0
+NODE_POLL_MAX = 30.0
+NODE_POLL_BACKOFF = 1.5
+READY_STATES = {"idle", "running"}
+FAILED_STATES = {"unusable", "starttaskfailed"}
+# Seconds to wait for the first ready node of a pool
+DEFAULT_READY_TIMEOUT = 1800.0
+
+
+# Cores and memory (MiB) of the VM sizes of each subscription and region, as listed by the service
+_vm_sizes: dict[tuple[str, str], dict[str, tuple[float, float]]] = {}
+
+# Memory per vCPU, in GiB, of the general purpose, compute, memory and storage optimized families
+MEMORY_PER_CORE = {"A": 2, "B": 4, "D": 4, "DC": 4, "E": 8, "EC": 8, "F": 2, "FX": 21, "G": 14, "H": 7,
+                   "HB": 4, "HC": 8, "L": 8, "M": 14, "NC": 7, "ND": 14, "NV": 7}
+# Families of the first generation (v1, v2) with a different ratio
+LEGACY_MEMORY_PER_CORE = {"D": 3.5}
+_VM_SIZE = re.compile(r"^(?:standard_|basic_)?([a-z]+?)(\d+)(?:-(\d+))?[a-z]*(?:_v(\d+))?", re.IGNORECASE)
+
+
+async def supported_vm_sizes(credential, subscription_id: str, location: str) -> dict[str, tuple[float, float]]:
+    # Listed once per process, sizes do not change while a workflow runs
+    key = (subscription_id, location.lower())
+    if key not in _vm_sizes:
+        from azure.mgmt.batch.aio import BatchManagementClient
+        from azure.mgmt.batch.models import SkuCapability
+
+        sizes: dict[str, tuple[float, float]] = {}
+        async with BatchManagementClient(credential, subscription_id) as client:
+            async for sku in client.location.list_supported_virtual_machine_skus(location):
+                listed: list[SkuCapability] = sku.capabilities or []
+                capabilities = {c.name: c.value for c in listed}
+                if sku.name and "vCPUs" in capabilities and "MemoryGB" in capabilities:
+                    sizes[sku.name.lower()] = (float(capabilities["vCPUs"]), float(capabilities["MemoryGB"]) * 1024)
+        _vm_sizes[key] = sizes
+    return _vm_sizes[key]
+
+
+def vm_size_hardware(vm_size: str) -> tuple[float, float] | None:
+    # An estimate of the cores and memory (MiB) of a VM size from its name, for when the service cannot
+    # be asked: the number after the family is the vCPU count, or the constrained count after a dash,
+    # and memory scales with vCPUs within a family. Burstable and memory-dense sizes do not follow it
+    if (match := _VM_SIZE.match(vm_size)) is None:
+        return None
+    family, cores, constrained, version = match.groups()
+    family = family.upper()
+    if family not in MEMORY_PER_CORE:
+        family = family[0]
+    if family not in MEMORY_PER_CORE:
+        return None
+    per_core: float = MEMORY_PER_CORE[family]
+    if int(version or 1) < 3:
+        per_core = LEGACY_MEMORY_PER_CORE.get(family, per_core)
+    return float(constrained or cores), float(int(cores) * per_core * 1024)
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+def _seconds(start, end) -> float | None:
+    if start is None or end is None:
+        return None
+    return (end - start).total_seconds()
+
+
+class NodeMonitor:
+    # Follows the compute nodes of a pool while it grows, so that tasks can be dispatched as soon as
+    # the first node is ready instead of waiting for the whole pool. Nodes that fail to boot are
+    # removed and the pool is resized back to its previous target
+    def __init__(self, executor, pool_id: str):
+        self.executor = executor
+        self.pool_id = pool_id
+        self.nodes: dict[str, str] = {}
+        self.addresses: dict[str, str] = {}
+        self.version = 0
+        self.ready = asyncio.Event()
+        # Set once a node is ready or every node has failed before any was
+        self.settled = asyncio.Event()
+        self.error: str | None = None
+        self.replaced: set[str] = set()
+        self.restore_target: int | None = None
+        self.stats: dict[str, Any] = {"boot_latencies": {}, "start_task_latencies": {}, "replaced": 0}
+        self.task: asyncio.Task | None = None
+
+    @property
+    def ready_nodes(self) -> int:
+        return sum(1 for state in self.nodes.values() if state in READY_STATES)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def wait_ready(self, timeout: float | None = DEFAULT_READY_TIMEOUT):
+        self.start()
+        try:
+            await asyncio.wait_for(self.settled.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise WorkflowExecutionException(
+                f"No node of pool {self.pool_id} became ready within {timeout:.0f}s") from None
+        if not self.ready.is_set():
+            raise WorkflowExecutionException(self.error)
+
+    async def _run(self):
+        delay = NODE_POLL_MIN
+        while True:
+            try:
+                changed = await self.poll()
+            except Exception as e:
+                logging.warning(f"[AzureExecutor] Failed to list the nodes of pool {self.pool_id}: {e}")
+                changed = False
+            delay = NODE_POLL_MIN if changed else min(NODE_POLL_MAX, delay * NODE_POLL_BACKOFF)
+            await asyncio.sleep(delay)
+
+    async def poll(self) -> bool:
+        changed = False
+        failed = []
+        seen = set()
+        async for node in self.executor.batch_client.compute_node.list(self.pool_id, compute_node_list_options={
+            "select": "id,state,stateTransitionTime,allocationTime,startTaskInfo,ipAddress"
+        }):
+            seen.add(node.id)
+            state = str(_value(node.state))
+            if self.nodes.get(node.id) == state:
+                continue
+            changed = True
+            self.nodes[node.id] = state
+            if address := getattr(node, "ip_address", None):
+                self.addresses[node.id] = address
+            if state in READY_STATES and node.id not in self.stats["boot_latencies"]:
+                self._record_ready(node)
+            elif state in FAILED_STATES and node.id not in self.replaced:
+                failed.append(node.id)
+        for node_id in set(self.nodes) - seen:
+            changed = True
+            del self.nodes[node_id]
+            self.addresses.pop(node_id, None)
+        if changed:
+            self.version += 1
+        if self.ready_nodes and not self.ready.is_set():
+            logging.info(f"[AzureExecutor] First node of pool {self.pool_id} is ready, dispatching tasks")
+            self.ready.set()
+            self.settled.set()
+        elif not self.ready.is_set():
+            # Replacements keep booting in the background, but waiters are not held while no node can run
+            if self.nodes and all(state in FAILED_STATES for state in self.nodes.values()):
+                self.error = (f"Every node of pool {self.pool_id} is unusable: "
+                              + ", ".join(f"{node_id} ({state})" for node_id, state in sorted(self.nodes.items())))
+                self.settled.set()
+            else:
+                self.settled.clear()
+        if failed:
+            await self._replace(failed)
+        if self.restore_target is not None:
+            await self._restore()
+        return changed
+
+    def _record_ready(self, node):
+        boot = _seconds(getattr(node, "allocation_time", None), getattr(node, "state_transition_time", None))
+        start_task_info = getattr(node, "start_task_info", None)
+        start_task = _seconds(getattr(start_task_info, "start_time", None),
+                              getattr(start_task_info, "end_time", None))
+        self.stats["boot_latencies"][node.id] = boot
+        if boot is not None:
+            instrumentation().observe("azure_node_boot_seconds", boot, pool=self.pool_id)
+        if start_task is not None:
+            self.stats["start_task_latencies"][node.id] = start_task
+            instrumentation().observe("azure_node_start_task_seconds", start_task, pool=self.pool_id)
+        logging.info(f"[AzureExecutor] Node {node.id} of pool {self.pool_id} ready"
+                     + (f" after {boot:.0f}s" if boot is not None else "")
+                     + (f" (start task {start_task:.0f}s)" if start_task is not None else ""))
+
+    async def _replace(self, node_ids: list[str]):
+        pool = await self.executor.batch_client.pool.get(self.pool_id)
+        try:
+            await self.executor.batch_client.pool.remove_nodes(self.pool_id, {
+                "node_list": node_ids,
+                "node_deallocation_option": "requeue"
+            })
+        except HttpResponseError as e:
+            # Retried at the next poll, the pool may still be resizing
+            logging.warning(f"[AzureExecutor] Failed to remove nodes {', '.join(node_ids)}: {e}")
+            for node_id in node_ids:
+                self.nodes.pop(node_id, None)
+            return
+        logging.warning(f"[AzureExecutor] Replacing failed nodes {', '.join(node_ids)} of pool {self.pool_id}")
+        self.replaced.update(node_ids)
+        self.stats["replaced"] += len(node_ids)
+        instrumentation().increment("azure_nodes_replaced_total", len(node_ids), pool=self.pool_id)
+        # An autoscale formula restores the pool size by itself
+        if not getattr(pool, "enable_auto_scale", False):
+            self.restore_target = max(self.restore_target or 0, pool.target_dedicated_nodes or 0)
+
+    async def _restore(self):
+        pool = await self.executor.batch_client.pool.get(self.pool_id)
+        if str(_value(pool.allocation_state)) != "steady":
+            return
+        if (pool.target_dedicated_nodes or 0) < self.restore_target:
+            await self.executor.resize_pool(self.pool_id, self.restore_target)
+        self.restore_target = None
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import posixpath
+import re
+from fnmatch import fnmatchcase
+from typing import AsyncIterator
+
+from streamflow.core.exception import WorkflowDefinitionException
+
+OPERATIONS = ("upload", "download", "read", "delete", "copy", "set_tier")
+BATCH_OPERATIONS = ("delete", "set_tier")
+# The Blob batch API accepts at most 256 subrequests per call
+BATCH_SIZE = 256
+_GLOB = re.compile(r"[*?\[]")
+
+
+def has_glob(pattern: str) -> bool:
+    return _GLOB.search(pattern) is not None
+
+
+def literal_prefix(pattern: str) -> str:
+    # Listings are narrowed server-side to the part of the pattern before its first wildcard
+    match = _GLOB.search(pattern)
+    return pattern[:match.start()] if match else pattern
+
+
+def validate_operations(operations: list[dict]):
+    for position, operation in enumerate(operations):
+        action = operation.get("action")
+        if action not in OPERATIONS:
+            raise WorkflowDefinitionException(f"Invalid blob operation {position}: {action}")
+        if action == "upload" and "local_path" not in operation:
+            raise WorkflowDefinitionException(f"Blob operation {position} ({action}) requires local_path")
+        if action != "upload" and "blob_name" not in operation and "pattern" not in operation:
+            raise WorkflowDefinitionException(f"Blob operation {position} ({action}) requires blob_name or pattern")
+        if action == "download" and "local_path" not in operation:
+            raise WorkflowDefinitionException(f"Blob operation {position} ({action}) requires local_path")
+        if action == "copy" and "destination" not in operation:
+            raise WorkflowDefinitionException(f"Blob operation {position} ({action}) requires destination")
+        if action == "set_tier" and "tier" not in operation:
+            raise WorkflowDefinitionException(f"Blob operation {position} ({action}) requires tier")
+
+
+async def match_containers(service_client, container: str) -> AsyncIterator[str]:
+    if not has_glob(container):
+        yield container
+        return
+    async for item in service_client.list_containers(name_starts_with=literal_prefix(container)):
+        if fnmatchcase(item.name, container):
+            yield item.name
+
+
+async def match_blobs(container_client, pattern: str) -> AsyncIterator[tuple[str, str, int]]:
+    # Yields the name, the path relative to the last directory before the first wildcard, and the size
+    prefix = literal_prefix(pattern)
+    base = prefix[:prefix.rfind("/") + 1]
+    async for blob in container_client.list_blobs(name_starts_with=prefix):
+        if fnmatchcase(blob.name, pattern):
+            yield blob.name, blob.name[len(base):], blob.size
+
+
+def join_name(prefix: str, relpath: str) -> str:
+    return posixpath.join(prefix, relpath) if prefix else relpath
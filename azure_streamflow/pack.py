@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import posixpath
+import tarfile
+from typing import AsyncIterator
+
+PACK_ARCHIVE = ".streamflow-pack.tar"
+PACK_INDEX = ".streamflow-pack.index.json"
+DEFAULT_PACK_MIN_FILES = 64
+DEFAULT_PACK_MAX_AVERAGE_SIZE = 1024 * 1024
+QUEUE_SIZE = 4
+
+
+def tree_stats(root: str) -> tuple[int, int]:
+    files, size = 0, 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                files += 1
+                size += os.path.getsize(path)
+    return files, size
+
+
+async def should_pack(root: str, min_files: int = DEFAULT_PACK_MIN_FILES,
+                      max_average_size: int = DEFAULT_PACK_MAX_AVERAGE_SIZE) -> bool:
+    # Many small files are bound by per-request latency, a few large ones by bandwidth
+    files, size = await asyncio.get_running_loop().run_in_executor(None, tree_stats, root)
+    return files >= min_files and size <= max_average_size * files
+
+
+def archive_name(prefix: str) -> str:
+    return posixpath.join(prefix, PACK_ARCHIVE) if prefix else PACK_ARCHIVE
+
+
+def index_name(prefix: str) -> str:
+    return posixpath.join(prefix, PACK_INDEX) if prefix else PACK_INDEX
+
+
+class _BlockWriter(io.RawIOBase):
+    # File object written by tarfile in a worker thread, handing fixed-size blocks to the event loop
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, block_size: int):
+        super().__init__()
+        self.queue = queue
+        self.loop = loop
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.aborted = False
+
+    def writable(self) -> bool:
+        return True
+
+    def _put(self, item):
+        if self.aborted:
+            raise OSError("Archive upload aborted")
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.block_size:
+            self._put(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def flush_blocks(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+class _BlockReader(io.RawIOBase):
+    # File object read by tarfile in a worker thread, fed with the chunks of a download
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self.queue = queue
+        self.loop = loop
+        self.buffer = bytearray()
+        self.eof = False
+        self.aborted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buffer and not self.eof:
+            item = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop).result()
+            if self.aborted:
+                raise OSError("Archive download aborted")
+            if isinstance(item, BaseException):
+                raise OSError(f"Archive download failed: {item}")
+            if item is None:
+                self.eof = True
+            else:
+                self.buffer.extend(item)
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        del self.buffer[:size]
+        return size
+
+
+def _write_tar(root: str, writer: _BlockWriter, index: dict):
+    # Members are added in a stable order. The data offset of each file is recorded, so that a single
+    # member can be read with a range request
+    try:
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for directory, dirnames, names in os.walk(root):
+                dirnames.sort()
+                for name in sorted(names):
+                    path = os.path.join(directory, name)
+                    if not os.path.isfile(path):
+                        continue
+                    arcname = os.path.relpath(path, root).replace(os.sep, "/")
+                    tarinfo = tar.gettarinfo(path, arcname)
+                    with open(path, "rb") as f:
+                        tar.addfile(tarinfo, f)
+                    index[arcname] = [tar.offset - -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE,
+                                      tarinfo.size]
+        writer.flush_blocks()
+    finally:
+        # The end of the stream, or the failure raised by the producer, is then seen by the consumer
+        if not writer.aborted:
+            writer._put(None)
+
+
+async def tar_blocks(root: str, block_size: int, index: dict) -> AsyncIterator[bytes]:
+    # The archive is produced by a worker thread while it is uploaded, without a temporary file
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=QUEUE_SIZE)
+    writer = _BlockWriter(queue, loop, block_size)
+    producer = loop.run_in_executor(None, _write_tar, root, writer, index)
+    try:
+        while (block := await queue.get()) is not None:
+            yield block
+        await producer
+    finally:
+        if not producer.done():
+            # Unblock the worker, which stops at its next write
+            writer.aborted = True
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait([producer], timeout=0.01)
+
+
+def _extract_tar(reader: _BlockReader, destination: str):
+    with tarfile.open(fileobj=reader, mode="r|") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(destination, filter="data")
+        else:
+            root = os.path.realpath(destination)
+            for member in tar:
+                target = os.path.realpath(os.path.join(destination, member.name))
+                if os.path.commonpath([root, target]) != root or not (member.isfile() or member.isdir()):
+                    raise tarfile.TarError(f"Refusing to extract {member.name}")
+                tar.extract(member, destination)
+
+
+async def extract_tar(chunks: AsyncIterator[bytes], destination: str):
+    # Members are written while the rest of the archive is still downloading
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=QUEUE_SIZE)
+    reader = _BlockReader(queue, loop)
+
+    async def _pump():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+            raise
+        await queue.put(None)
+
+    pump = asyncio.ensure_future(_pump())
+    try:
+        await loop.run_in_executor(None, _extract_tar, reader, destination)
+    finally:
+        if not pump.done():
+            reader.aborted = True
+            pump.cancel()
+            try:
+                queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+        await asyncio.gather(pump, return_exceptions=True)
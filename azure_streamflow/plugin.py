@@ -1,9 +1,49 @@
+from __future__ import annotations
+
+import importlib
+from functools import lru_cache
+
+from importlib_resources import files
 from streamflow.ext.plugin import StreamFlowPlugin
-from azure_streamflow.batch_connector import AzureBatchConnector
-from azure_streamflow.blob_connector import AzureBlobConnector
+
+
+@lru_cache(maxsize=None)
+def load_schema(name: str) -> str:
+    return files("azure_streamflow.schemas").joinpath(name).read_text("utf-8")
+
+
+class LazyConnector:
+    # Registered in place of a connector class, so that the Azure SDKs are only imported when a
+    # deployment instantiates the connector, not whenever StreamFlow loads its plugins
+    module: str
+    name: str
+    schema: str
+
+    @classmethod
+    def get_schema(cls) -> str:
+        return load_schema(cls.schema)
+
+    @classmethod
+    def load(cls) -> type:
+        return getattr(importlib.import_module(cls.module), cls.name)
+
+    def __new__(cls, *args, **kwargs):
+        return cls.load()(*args, **kwargs)
+
+
+class AzureBatchConnectorType(LazyConnector):
+    module = "azure_streamflow.batch_connector"
+    name = "AzureBatchConnector"
+    schema = "azure_bacth.json"
+
+
+class AzureBlobConnectorType(LazyConnector):
+    module = "azure_streamflow.blob_connector"
+    name = "AzureBlobConnector"
+    schema = "azure_blob.json"
 
 
 class AzureStreamFlowPlugin(StreamFlowPlugin):
     def register(self) -> None:
-        self.register_connector("eu.across.azure.batch", AzureBatchConnector)
-        self.register_connector("eu.across.azure.blob", AzureBlobConnector)
\ No newline at end of file
+        self.register_connector("eu.across.azure.batch", AzureBatchConnectorType)
+        self.register_connector("eu.across.azure.blob", AzureBlobConnectorType)
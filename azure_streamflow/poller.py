@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from datetime import datetime, timedelta
+
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.metrics import instrumentation
+
+POLL_MIN = 1.0
+POLL_MAX = 30.0
+POLL_BACKOFF = 1.5
+TERMINAL_STATES = {"completed"}
+# Tasks whose transition is recorded just before a poll may be listed by the next one
+TRANSITION_OVERLAP = timedelta(seconds=5)
+# Polls after which a task never listed is looked up on its own, and its waiters fail if it does not exist
+MISSING_POLLS = 5
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+class TaskState:
+    __slots__ = ("state", "exit_code")
+
+    def __init__(self, state: str, exit_code: int | None = None):
+        self.state = state
+        self.exit_code = exit_code
+
+    @property
+    def terminal(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+
+class TaskStatePoller:
+    # One polling loop per job, shared by every task of the job. Each poll lists only the tasks
+    # whose state changed since the previous one, so the request rate does not grow with the number
+    # of tasks in flight, and backs off while nothing changes
+    def __init__(self, executor, job_id: str):
+        self.executor = executor
+        self.job_id = job_id
+        self.states: dict[str, TaskState] = {}
+        self.waiters: dict[str, list[asyncio.Future]] = {}
+        self.watched: set[str] = set()
+        self.missing: dict[str, int] = {}
+        self.since: datetime | None = None
+        self.requests = 0
+        self.wakeup: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+
+    def watch(self, task_id: str):
+        if task_id not in self.watched:
+            self.watched.add(task_id)
+            if self.wakeup is None:
+                self.wakeup = asyncio.Event()
+            self.wakeup.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    def state(self, task_id: str) -> TaskState | None:
+        return self.states.get(task_id)
+
+    async def wait(self, task_id: str) -> TaskState:
+        self.watch(task_id)
+        if (state := self.states.get(task_id)) is not None and state.terminal:
+            return state
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(task_id, []).append(future)
+        return await future
+
+    @property
+    def active(self) -> int:
+        return sum(1 for t in self.watched if not (s := self.states.get(t)) or not s.terminal)
+
+    def _pending(self) -> bool:
+        return any(not (s := self.states.get(t)) or not s.terminal for t in self.watched)
+
+    async def _run(self):
+        delay = POLL_MIN
+        while self._pending():
+            self.wakeup.clear()
+            try:
+                changed = await self.poll()
+            except Exception as e:
+                logging.warning(f"[AzureExecutor] Failed to poll tasks of job {self.job_id}: {e}")
+                changed = False
+            if not self._pending():
+                break
+            delay = POLL_MIN if changed else min(POLL_MAX, delay * POLL_BACKOFF)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+                delay = POLL_MIN
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> bool:
+        options = {"select": "id,state,stateTransitionTime,executionInfo"}
+        if self.since is not None:
+            since = (self.since - TRANSITION_OVERLAP).strftime("%Y-%m-%dT%H:%M:%SZ")
+            options["filter"] = f"stateTransitionTime ge DateTime'{since}'"
+        self.requests += 1
+        changed = False
+        async for task in self.executor.batch_client.task.list(self.job_id, task_list_options=options):
+            changed = self._record(task) or changed
+            if (transition := getattr(task, "state_transition_time", None)) is not None:
+                if self.since is None or transition > self.since:
+                    self.since = transition
+        # Tasks deleted, or changed before the window of the filter, are not listed
+        for task_id in [t for t in self.watched if t not in self.states]:
+            self.missing[task_id] = self.missing.get(task_id, 0) + 1
+            if self.missing[task_id] >= MISSING_POLLS:
+                changed = await self._lookup(task_id) or changed
+        instrumentation().gauge("azure_active_tasks", self.active, job=self.job_id)
+        return changed
+
+    def _record(self, task) -> bool:
+        execution_info = getattr(task, "execution_info", None)
+        state = TaskState(str(_value(task.state)), getattr(execution_info, "exit_code", None))
+        previous = self.states.get(task.id)
+        self.states[task.id] = state
+        self.missing.pop(task.id, None)
+        if state.terminal:
+            for waiter in self.waiters.pop(task.id, []):
+                if not waiter.done():
+                    waiter.set_result(state)
+        return previous is None or previous.state != state.state
+
+    async def _lookup(self, task_id: str) -> bool:
+        self.missing.pop(task_id, None)
+        self.requests += 1
+        try:
+            task = await self.executor.batch_client.task.get(self.job_id, task_id)
+        except HttpResponseError as e:
+            if e.status_code != 404:
+                raise
+            logging.warning(f"[AzureExecutor] Task {task_id} not found in job {self.job_id}")
+            self.watched.discard(task_id)
+            for waiter in self.waiters.pop(task_id, []):
+                if not waiter.done():
+                    waiter.set_exception(WorkflowExecutionException(f"Task {task_id} not found in job {self.job_id}"))
+            return True
+        return self._record(task)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        for waiters in self.waiters.values():
+            for waiter in waiters:
+                waiter.cancel()
+        self.waiters = {}
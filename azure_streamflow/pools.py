@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.exception import WorkflowExecutionException
+
+FINGERPRINT_METADATA = "streamflow_fingerprint"
+USERS_METADATA = "streamflow_users"
+NODE_AGENT_SKU_ID = "batch.node.ubuntu 18.04"
+MAX_LEASE_ATTEMPTS = 10
+AUTOSCALE_EVALUATION_INTERVAL = timedelta(minutes=5)
+
+
+def pool_fingerprint(vm_size: str, publisher: str, offer: str, sku: str,
+                     node_agent_sku_id: str = NODE_AGENT_SKU_ID, task_slots_per_node: int = 1) -> str:
+    spec = {
+        "vm_size": vm_size.lower(),
+        "image": [publisher, offer, sku],
+        "node_agent_sku_id": node_agent_sku_id,
+        "task_slots_per_node": task_slots_per_node
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def idle_formula(node_count: int, idle_timeout: int) -> str:
+    # Keep the nodes while tasks were pending or running in the last idle_timeout minutes
+    return (
+        f"$samples = $PendingTasks.GetSamplePercent(TimeInterval_Minute * {idle_timeout});\n"
+        f"$pending = $samples < 70 ? 1 : max($PendingTasks.GetSample(TimeInterval_Minute * {idle_timeout}));\n"
+        f"$TargetDedicatedNodes = $pending > 0 ? {node_count} : 0;\n"
+        f"$NodeDeallocationOption = taskcompletion;"
+    )
+
+
+def _metadata(pool) -> dict[str, str]:
+    return {item.name: item.value for item in (getattr(pool, "metadata", None) or [])}
+
+
+class WarmPools:
+    # Pools tagged with the fingerprint of their VM configuration are attached to by any workflow
+    # asking for the same configuration. A users counter in the pool metadata, updated with ETag
+    # preconditions, tells the last workflow that it can scale the pool down
+    def __init__(self, executor):
+        self.executor = executor
+
+    @property
+    def pool(self):
+        return self.executor.batch_client.pool
+
+    async def _find(self, pool_id: str, fingerprint: str):
+        candidates = []
+        async for pool in self.pool.list(pool_list_options={
+            "filter": "state eq 'active'",
+            "select": "id,eTag,metadata,targetDedicatedNodes,allocationState,enableAutoScale"
+        }):
+            if _metadata(pool).get(FINGERPRINT_METADATA) == fingerprint:
+                candidates.append(pool)
+        # The configured pool is preferred when it is compatible
+        candidates.sort(key=lambda p: p.id != pool_id)
+        return candidates[0] if candidates else None
+
+    async def _update_users(self, pool_id: str, delta: int):
+        for _ in range(MAX_LEASE_ATTEMPTS):
+            pool = await self.pool.get(pool_id)
+            metadata = _metadata(pool)
+            users = max(0, int(metadata.get(USERS_METADATA, 0)) + delta)
+            metadata[USERS_METADATA] = str(users)
+            try:
+                await self.pool.patch(
+                    pool_id,
+                    {"metadata": [{"name": k, "value": v} for k, v in metadata.items()]},
+                    pool_patch_options={"if_match": pool.e_tag}
+                )
+                return pool, users
+            except HttpResponseError as e:
+                if e.status_code != 412:
+                    raise
+                logging.debug(f"[AzureExecutor] Pool {pool_id} changed concurrently, retrying lease update")
+        raise WorkflowExecutionException(f"Failed to update the users of pool {pool_id}: too many concurrent updates")
+
+    async def acquire(self, pool_id: str, vm_size: str, node_count: int,
+                      publisher: str, offer: str, sku: str, task_slots_per_node: int = 1) -> str:
+        fingerprint = pool_fingerprint(vm_size, publisher, offer, sku, task_slots_per_node=task_slots_per_node)
+        for _ in range(MAX_LEASE_ATTEMPTS):
+            if (pool := await self._find(pool_id, fingerprint)) is None:
+                # An incompatible pool may already own the configured identifier
+                try:
+                    await self.pool.get(pool_id)
+                    new_pool_id = f"{pool_id}-{fingerprint[:8]}"
+                except HttpResponseError as e:
+                    if e.status_code != 404:
+                        raise
+                    new_pool_id = pool_id
+                try:
+                    await self.executor.create_pool(
+                        new_pool_id, vm_size, node_count, publisher, offer, sku,
+                        metadata={FINGERPRINT_METADATA: fingerprint, USERS_METADATA: "1"},
+                        task_slots_per_node=task_slots_per_node)
+                    return new_pool_id
+                except HttpResponseError as e:
+                    # Another workflow created it in the meantime
+                    if e.status_code != 409:
+                        raise
+                    continue
+            try:
+                pool, users = await self._update_users(pool.id, 1)
+            except HttpResponseError as e:
+                if e.status_code == 404:
+                    continue
+                raise
+            logging.info(f"[AzureExecutor] Attaching to warm pool {pool.id} ({users} users)")
+            if getattr(pool, "enable_auto_scale", False):
+                await self.pool.disable_auto_scale(pool.id)
+            if (pool.target_dedicated_nodes or 0) < node_count:
+                await self.executor.resize_pool(pool.id, node_count)
+            return pool.id
+        raise WorkflowExecutionException(f"Failed to acquire a pool compatible with {pool_id}")
+
+    async def release(self, pool_id: str, idle_timeout: int | None = None):
+        pool, users = await self._update_users(pool_id, -1)
+        if users > 0:
+            logging.info(f"[AzureExecutor] Leaving pool {pool_id} to its other {users} users")
+            return
+        if idle_timeout:
+            logging.info(f"[AzureExecutor] Pool {pool_id} will scale down after {idle_timeout} idle minutes")
+            await self.pool.enable_auto_scale(pool_id, {
+                "auto_scale_formula": idle_formula(pool.target_dedicated_nodes or 0, idle_timeout),
+                "auto_scale_evaluation_interval": AUTOSCALE_EVALUATION_INTERVAL
+            })
+        else:
+            logging.info(f"[AzureExecutor] Scaling pool {pool_id} down to zero nodes")
+            if getattr(pool, "enable_auto_scale", False):
+                await self.pool.disable_auto_scale(pool_id)
+            await self.executor.resize_pool(pool_id, 0)
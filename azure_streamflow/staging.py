@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import posixpath
+import re
+from datetime import timedelta
+
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.transfer import walk_local
+
+DEFAULT_STAGING_PREFIX = "streamflow-staging"
+DEFAULT_OUTPUT_PREFIX = "streamflow-outputs"
+DEFAULT_SAS_EXPIRY = 120
+# Output URLs must stay valid until the task completes
+DEFAULT_OUTPUT_SAS_EXPIRY = 1440
+WILDCARDS = set("*?[")
+# Characters around a path in a command line, so that /data/in does not match /data/input
+_BEFORE = r"(?<![^\s'\"=:,;(])"
+_AFTER = r"(?![^\s'\"/=:,;)|&<>])"
+
+
+class StagedInput:
+    __slots__ = ("blob_name", "is_directory")
+
+    def __init__(self, blob_name: str, is_directory: bool):
+        self.blob_name = blob_name
+        self.is_directory = is_directory
+
+
+def _pattern_base(pattern: str) -> str:
+    parts: list[str] = []
+    for part in pattern.strip("/").split("/"):
+        if WILDCARDS & set(part):
+            return "/".join(parts)
+        parts.append(part)
+    return "/".join(parts)
+
+
+class BlobStager:
+    # Uploads task inputs to a Blob container under content-addressed names, so that an input shared
+    # by many tasks is uploaded once, and turns them into Batch resource files with short-lived SAS URLs.
+    # Task outputs go the other way, uploaded by the nodes to the same container
+    def __init__(self, blob_connector, prefix: str = DEFAULT_STAGING_PREFIX,
+                 sas_expiry: int = DEFAULT_SAS_EXPIRY, output_prefix: str = DEFAULT_OUTPUT_PREFIX,
+                 output_sas_expiry: int = DEFAULT_OUTPUT_SAS_EXPIRY):
+        self.blob_connector = blob_connector
+        self.prefix = prefix.strip("/")
+        self.sas_expiry = timedelta(minutes=sas_expiry)
+        self.output_prefix = output_prefix.strip("/")
+        self.output_sas_expiry = timedelta(minutes=output_sas_expiry)
+        self.staged: dict[str, asyncio.Future] = {}
+        # Inputs staged since the last task was prepared, each one is attached to the task that uses it
+        self.inputs: dict[str, StagedInput] = {}
+
+    @property
+    def container(self) -> str:
+        return self.blob_connector.config["container"]
+
+    async def _digest(self, local_path: str) -> str:
+        manifest = self.blob_connector._sync_manifest()
+        if not os.path.isdir(local_path):
+            return (await manifest.md5(local_path)).hex()
+        # A directory is identified by the names and contents of its files
+        digest = hashlib.sha256()
+        entries = []
+        async for path in walk_local(local_path):
+            entries.append((os.path.relpath(path, local_path).replace(os.sep, "/"), path))
+        for relpath, path in sorted(entries):
+            digest.update(f"{relpath}\0{(await manifest.md5(path)).hex()}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    async def _upload(self, local_path: str, blob_name: str):
+        if os.path.isdir(local_path):
+            await self.blob_connector.copy_local_to_remote(local_path, blob_name, None)
+        elif not await self.blob_connector._is_blob(self.container, blob_name):
+            await self.blob_connector._upload_blob(local_path, self.container, blob_name)
+        else:
+            logging.debug(f"[AzureBatch] {local_path} is already staged as {blob_name}")
+
+    async def stage(self, local_path: str, destination: str) -> StagedInput:
+        digest = await self._digest(local_path)
+        is_directory = os.path.isdir(local_path)
+        blob_name = posixpath.join(self.prefix, digest) + ("/" if is_directory else "")
+        if blob_name not in self.staged:
+            self.staged[blob_name] = asyncio.ensure_future(self._upload(local_path, blob_name))
+        try:
+            await self.staged[blob_name]
+        except Exception:
+            # A later attempt uploads it again
+            self.staged.pop(blob_name, None)
+            raise
+        self.inputs[destination] = StagedInput(blob_name, is_directory)
+        return self.inputs[destination]
+
+    async def stage_remote(self, blob_name: str, destination: str) -> StagedInput:
+        # A blob of the staging container, e.g. a task output, is attached as it is
+        if await self.blob_connector._is_blob(self.container, blob_name):
+            self.inputs[destination] = StagedInput(blob_name, False)
+        elif await self.blob_connector._is_directory(self.container, blob_name):
+            self.inputs[destination] = StagedInput(blob_name.rstrip("/") + "/", True)
+        else:
+            raise WorkflowExecutionException(f"No blob or directory at {self.container}/{blob_name}")
+        return self.inputs[destination]
+
+    @staticmethod
+    def task_path(destination: str, staged: StagedInput) -> str:
+        # Batch downloads resource files relative to the task working directory, and keeps the blob
+        # names of container-level resource files below their file path
+        file_path = destination.lstrip("/")
+        return posixpath.join(file_path, staged.blob_name.rstrip("/")) if staged.is_directory else file_path
+
+    async def resource_file(self, destination: str, staged: StagedInput) -> dict:
+        service_client = self.blob_connector.blob_service_client
+        if staged.is_directory:
+            return {
+                "storage_container_url": await self.blob_connector.sas_url(
+                    service_client.get_container_client(self.container), self.sas_expiry, permission="rl"),
+                "blob_prefix": staged.blob_name,
+                "file_path": destination.lstrip("/")
+            }
+        return {
+            "http_url": await self.blob_connector.sas_url(
+                service_client.get_blob_client(container=self.container, blob=staged.blob_name), self.sas_expiry),
+            "file_path": destination.lstrip("/")
+        }
+
+    async def prepare(self, command: str) -> tuple[str, list[dict]]:
+        # Attach the inputs referenced by the command and point it to where Batch puts them. Paths match
+        # whole, longest first, and in a single pass so that rewritten paths are not matched again
+        if not self.inputs:
+            return command, []
+        destinations = sorted(self.inputs, key=len, reverse=True)
+        pattern = re.compile(_BEFORE + "(" + "|".join(map(re.escape, destinations)) + ")" + _AFTER)
+        used = {match.group(1) for match in pattern.finditer(command)}
+        attached = {destination: self.inputs.pop(destination) for destination in destinations if destination in used}
+        resource_files = [await self.resource_file(destination, staged) for destination, staged in attached.items()]
+        command = pattern.sub(lambda match: self.task_path(match.group(1), attached[match.group(1)]), command)
+        return command, resource_files
+
+    def output_blob(self, task_id: str, path: str = "") -> str:
+        return posixpath.join(self.output_prefix, task_id, path.strip("/"))
+
+    async def output_files(self, task_id: str, patterns: list[str]) -> list[dict]:
+        # Nodes upload the matching files when the task completes. Files matched by a wildcard keep their
+        # path below the non-wildcard base of the pattern, which is kept in the blob name
+        container_url = await self.blob_connector.sas_url(
+            self.blob_connector.blob_service_client.get_container_client(self.container),
+            self.output_sas_expiry, permission="cw")
+        output_files = []
+        for pattern in patterns:
+            path = _pattern_base(pattern) if WILDCARDS & set(pattern) else pattern
+            output_files.append({
+                "file_pattern": pattern,
+                "destination": {"container": {"container_url": container_url, "path": self.output_blob(task_id, path)}},
+                "upload_options": {"upload_condition": "taskcompletion"}
+            })
+        return output_files
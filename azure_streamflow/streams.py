@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator
+
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.data import StreamWrapper, StreamWrapperContextManager
+from streamflow.core.exception import WorkflowExecutionException
+
+OUTPUT_POLL_MIN = 0.5
+OUTPUT_POLL_MAX = 10.0
+
+
+class ChunkStreamReader(StreamWrapper):
+    # Read-only stream over an asynchronous iterator of byte chunks
+    def __init__(self, stream: AsyncIterator[bytes]):
+        super().__init__(stream)
+        self.buffer = bytearray()
+        self.eof = False
+
+    async def read(self, size: int | None = None):
+        while not self.eof and (size is None or len(self.buffer) < size):
+            try:
+                self.buffer.extend(await self.stream.__anext__())
+            except StopAsyncIteration:
+                self.eof = True
+            if size is not None and self.buffer:
+                break
+        size = len(self.buffer) if size is None else min(size, len(self.buffer))
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def write(self, data):
+        raise WorkflowExecutionException("Azure output streams are read-only")
+
+    async def close(self):
+        if hasattr(self.stream, "aclose"):
+            await self.stream.aclose()
+
+
+class ChunkStreamContextManager(StreamWrapperContextManager):
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self.reader = ChunkStreamReader(stream)
+
+    async def __aenter__(self) -> ChunkStreamReader:
+        return self.reader
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.reader.close()
+
+
+async def follow_task_file(executor, job_id: str, task_id: str, file_path: str) -> AsyncIterator[bytes]:
+    # Range-reads a file of a running task from the offset reached so far, until the task completes
+    # and the file has been read to its end
+    poller = executor.task_poller(job_id)
+    poller.watch(task_id)
+    offset = 0
+    delay = OUTPUT_POLL_MIN
+    while True:
+        state = poller.state(task_id)
+        # The state is read before the range, so that the final bytes are not missed
+        terminal = state is not None and state.terminal
+        received = 0
+        try:
+            data = await executor.batch_client.file.get_from_task(
+                job_id, task_id, file_path, file_get_from_task_options={"ocp_range": f"bytes={offset}-"})
+            async for chunk in data:
+                received += len(chunk)
+                yield chunk
+        except HttpResponseError as e:
+            # Nothing written past the offset yet, or the file does not exist yet
+            if e.status_code not in (404, 416):
+                raise
+        offset += received
+        if terminal and not received:
+            return
+        delay = OUTPUT_POLL_MIN if received else min(OUTPUT_POLL_MAX, delay * 2)
+        if not received:
+            await asyncio.sleep(delay)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.metrics import instrumentation
+
+MAX_TASKS_PER_COLLECTION = 100
+SUBMIT_WINDOW = 0.05
+MAX_PARALLEL_COLLECTIONS = 4
+MAX_SUBMIT_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+
+def _status(result) -> str:
+    status = getattr(result, "status", None)
+    return str(getattr(status, "value", status)).lower()
+
+
+def _error_code(result) -> str | None:
+    return getattr(getattr(result, "error", None), "code", None)
+
+
+class TaskSubmissionQueue:
+    # Coalesces tasks submitted within a short window into add-collection calls of up to
+    # MAX_TASKS_PER_COLLECTION tasks. Only the entries that failed on the server side are retried
+    def __init__(self, executor, window: float = SUBMIT_WINDOW,
+                 max_parallel: int = MAX_PARALLEL_COLLECTIONS, max_retries: int = MAX_SUBMIT_RETRIES):
+        self.executor = executor
+        self.window = window
+        self.max_retries = max_retries
+        self.buffers: dict[str, list[tuple[dict, asyncio.Future]]] = {}
+        self.timers: dict[str, asyncio.Task] = {}
+        self.in_flight: set[asyncio.Task] = set()
+        self.semaphore: asyncio.Semaphore | None = None
+        self.max_parallel = max_parallel
+
+    @property
+    def depth(self) -> int:
+        return sum(len(buffer) for buffer in self.buffers.values())
+
+    async def submit(self, job_id: str, task: dict):
+        future = asyncio.get_running_loop().create_future()
+        buffer = self.buffers.setdefault(job_id, [])
+        buffer.append((task, future))
+        instrumentation().gauge("azure_submission_queue_depth", self.depth)
+        if len(buffer) >= MAX_TASKS_PER_COLLECTION:
+            self._dispatch(job_id)
+        elif job_id not in self.timers:
+            self.timers[job_id] = asyncio.ensure_future(self._flush_after_window(job_id))
+        return await future
+
+    async def _flush_after_window(self, job_id: str):
+        await asyncio.sleep(self.window)
+        self.timers.pop(job_id, None)
+        while self.buffers.get(job_id):
+            self._dispatch(job_id)
+
+    def _dispatch(self, job_id: str):
+        buffer = self.buffers[job_id]
+        entries, self.buffers[job_id] = buffer[:MAX_TASKS_PER_COLLECTION], buffer[MAX_TASKS_PER_COLLECTION:]
+        task = asyncio.ensure_future(self._send(job_id, entries))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        instrumentation().gauge("azure_submission_queue_depth", self.depth)
+
+    async def _send(self, job_id: str, entries: list[tuple[dict, asyncio.Future]], attempt: int = 0):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_parallel)
+        try:
+            async with self.semaphore:
+                result = await self.executor.batch_client.task.add_collection(job_id, [t for t, _ in entries])
+        except HttpResponseError as e:
+            if e.status_code == 413 and len(entries) > 1:
+                # The request body limit is hit before the task limit with large command lines
+                half = len(entries) // 2
+                await asyncio.gather(self._send(job_id, entries[:half], attempt),
+                                     self._send(job_id, entries[half:], attempt))
+                return
+            await self._retry_or_fail(job_id, entries, attempt, e)
+            return
+        except Exception as e:
+            await self._retry_or_fail(job_id, entries, attempt, e)
+            return
+        futures = {t["id"]: (t, f) for t, f in entries}
+        retry = []
+        for task_result in result.value:
+            # Unknown or repeated ids are ignored, the tasks without a result are handled below
+            if (entry := futures.pop(task_result.task_id, None)) is None:
+                logging.warning(f"[AzureExecutor] Unexpected result for task {task_result.task_id} of job {job_id}")
+                continue
+            task, future = entry
+            status = _status(task_result)
+            if future.done():
+                continue
+            # A resent collection may have been added before the connection failed: task ids are unique
+            # to each run, so an existing task is the one added by the earlier attempt
+            if status == "success" or (attempt and _error_code(task_result) == "TaskExists"):
+                future.set_result(task_result)
+            elif status == "servererror" and attempt < self.max_retries:
+                retry.append((task, future))
+            else:
+                error = getattr(task_result, "error", None)
+                future.set_exception(WorkflowExecutionException(
+                    f"Failed to add task {task_result.task_id}: {getattr(error, 'message', error)}"))
+        # Tasks missing from the response were not processed and must be sent again
+        for task, future in futures.values():
+            if attempt < self.max_retries:
+                retry.append((task, future))
+            elif not future.done():
+                future.set_exception(WorkflowExecutionException(f"Task {task['id']} was not added"))
+        logging.info(f"[AzureExecutor] Submitted {len(entries) - len(retry)} tasks to job {job_id}")
+        if retry:
+            logging.warning(f"[AzureExecutor] Retrying {len(retry)} tasks of job {job_id}")
+            instrumentation().increment("azure_retries_total", len(retry), service="batch", component="submission")
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt) * (1 + random.random()))
+            await self._send(job_id, retry, attempt + 1)
+
+    async def _retry_or_fail(self, job_id: str, entries: list, attempt: int, error: Exception):
+        if attempt < self.max_retries:
+            logging.warning(f"[AzureExecutor] Task collection for job {job_id} failed, retrying: {error}")
+            instrumentation().increment("azure_retries_total", len(entries), service="batch", component="submission")
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt) * (1 + random.random()))
+            await self._send(job_id, entries, attempt + 1)
+        else:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(WorkflowExecutionException(f"Failed to add task collection: {error}"))
+
+    async def close(self):
+        for job_id in list(self.timers):
+            self.timers.pop(job_id).cancel()
+            while self.buffers.get(job_id):
+                self._dispatch(job_id)
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from azure_streamflow.compression import ORIGINAL_MD5_METADATA, original_size
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.expanduser("~"), ".cache", "streamflow-azure", "manifest.json")
+MTIME_METADATA = "streamflow_mtime"
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def md5_file(path: str) -> bytes:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        while data := f.read(HASH_BUFFER_SIZE):
+            digest.update(data)
+    return digest.digest()
+
+
+class SyncManifest:
+    # Content hashes of local files, keyed by absolute path and invalidated by size and mtime changes
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH, max_workers: int | None = None):
+        self.path = path
+        self.entries: dict[str, dict] | None = None
+        self.dirty = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="streamflow-azure-hash")
+        self.pending: dict[str, asyncio.Future] = {}
+
+    def _load(self) -> dict[str, dict]:
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    async def md5(self, local_path: str, stat: os.stat_result | None = None) -> bytes:
+        entries = self._load()
+        local_path = os.path.abspath(local_path)
+        stat = stat or os.stat(local_path)
+        entry = entries.get(local_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return bytes.fromhex(entry["md5"])
+        if local_path not in self.pending:
+            loop = asyncio.get_running_loop()
+            self.pending[local_path] = loop.run_in_executor(self.executor, md5_file, local_path)
+        try:
+            digest = await self.pending[local_path]
+        finally:
+            self.pending.pop(local_path, None)
+        self.record(local_path, digest, stat)
+        return digest
+
+    def record(self, local_path: str, digest: bytes, stat: os.stat_result | None = None):
+        entries = self._load()
+        local_path = os.path.abspath(local_path)
+        stat = stat or os.stat(local_path)
+        entries[local_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": digest.hex()}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        logging.debug(f"Saved sync manifest with {len(self.entries)} entries to {self.path}")
+
+    def close(self):
+        self.save()
+        self.executor.shutdown(wait=False)
+
+
+def remote_md5(properties) -> bytes | None:
+    # Compressed blobs carry the hash of the original content in their metadata
+    metadata = getattr(properties, "metadata", None) or {}
+    if digest := metadata.get(ORIGINAL_MD5_METADATA):
+        return bytes.fromhex(digest)
+    content_settings = getattr(properties, "content_settings", None)
+    content_md5 = getattr(content_settings, "content_md5", None)
+    return bytes(content_md5) if content_md5 else None
+
+
+async def is_unchanged(manifest: SyncManifest, local_path: str, properties) -> bool:
+    if properties is None or not os.path.isfile(local_path):
+        return False
+    stat = os.stat(local_path)
+    if stat.st_size != original_size(properties):
+        return False
+    metadata = getattr(properties, "metadata", None) or {}
+    if (digest := remote_md5(properties)) is None:
+        return False
+    # A blob uploaded from this very file version is trusted without re-hashing it
+    if metadata.get(MTIME_METADATA) == str(stat.st_mtime_ns):
+        return True
+    return await manifest.md5(local_path, stat) == digest
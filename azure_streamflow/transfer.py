@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import random
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+
+import aiofiles
+import aiohttp
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from azure.storage.blob import BlobBlock
+
+from azure_streamflow.metrics import instrumentation
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_FILE_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# Request timeout, throttling and server side errors
+TRANSIENT_STATUSES = (408, 429)
+
+
+def block_id(index: int) -> str:
+    # Block ids must all have the same length within a blob
+    return f"{index:08d}"
+
+
+async def read_blocks(local_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> AsyncIterator[bytes]:
+    async with aiofiles.open(local_path, "rb") as f:
+        while True:
+            data = await f.read(block_size)
+            if not data:
+                break
+            yield data
+
+
+def _failure(task: asyncio.Future) -> BaseException | None:
+    # Cancelled tasks raise from exception(), their cancellation is handled by whoever cancelled them
+    return task.exception() if task.done() and not task.cancelled() else None
+
+
+async def upload_blocks(blob_client, source: AsyncIterator[bytes],
+                        max_concurrency: int = DEFAULT_MAX_CONCURRENCY, **kwargs) -> int:
+    # A slot is acquired before pulling the next block from the source, so at most
+    # `max_concurrency` blocks are held in memory at any time
+    semaphore = asyncio.Semaphore(max_concurrency)
+    block_ids: list[str] = []
+    tasks: list[asyncio.Task] = []
+    size = 0
+
+    async def _stage(current_id: str, data: bytes):
+        try:
+            await blob_client.stage_block(block_id=current_id, data=data)
+        finally:
+            semaphore.release()
+
+    try:
+        while True:
+            await semaphore.acquire()
+            for task in tasks:
+                if (exc := _failure(task)) is not None:
+                    semaphore.release()
+                    raise exc
+            try:
+                data = await source.__anext__()
+            except StopAsyncIteration:
+                semaphore.release()
+                break
+            current_id = block_id(len(block_ids))
+            block_ids.append(current_id)
+            size += len(data)
+            tasks.append(asyncio.ensure_future(_stage(current_id, data)))
+            del data
+            tasks = [t for t in tasks if not t.done() or _failure(t) is not None]
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    await blob_client.commit_block_list([BlobBlock(block_id=i) for i in block_ids], **kwargs)
+    logging.debug(f"Committed {len(block_ids)} blocks ({size} bytes)")
+    return size
+
+
+def _preallocate(fd: int, size: int):
+    if hasattr(os, "posix_fallocate") and size > 0:
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def _load_progress(progress_path: str, etag: str, size: int, block_size: int) -> set:
+    try:
+        with open(progress_path) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if (progress.get("etag"), progress.get("size"), progress.get("block_size")) != (etag, size, block_size):
+        return set()
+    return set(progress.get("completed", []))
+
+
+def _save_progress(progress_path: str, etag: str, size: int, block_size: int, completed: set,
+                   fd: int | None = None):
+    # Ranges are only recorded once their data has reached the disk
+    if fd is not None:
+        getattr(os, "fdatasync", os.fsync)(fd)
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"etag": etag, "size": size, "block_size": block_size, "completed": sorted(completed)}, f)
+    os.replace(tmp_path, progress_path)
+
+
+async def download_ranges(blob_client, local_path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                          max_concurrency: int = DEFAULT_MAX_CONCURRENCY, properties=None) -> int:
+    # Ranges are written in place as soon as they arrive. Completed ranges are tracked in a
+    # side file, so that an interrupted download of the same blob version can be resumed
+    if properties is None:
+        properties = await blob_client.get_blob_properties()
+    size, etag = properties.size, properties.etag
+    progress_path = local_path + ".sfpart"
+    completed = set()
+    if os.path.exists(local_path) and os.path.getsize(local_path) == size:
+        completed = _load_progress(progress_path, etag, size, block_size)
+    pending = [i for i in range(-(-size // block_size)) if i not in completed]
+    loop = asyncio.get_running_loop()
+    lock = asyncio.Lock()
+    # Writes run in a dedicated executor, so that none is still running when the file is closed
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    fd = os.open(local_path, os.O_RDWR | os.O_CREAT)
+    try:
+        if not completed:
+            os.ftruncate(fd, 0)
+            _preallocate(fd, size)
+
+        async def _fetch(index: int):
+            offset = index * block_size
+            stream = await blob_client.download_blob(
+                offset=offset,
+                length=min(block_size, size - offset),
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified
+            )
+            async for chunk in stream.chunks():
+                await loop.run_in_executor(executor, os.pwrite, fd, chunk, offset)
+                offset += len(chunk)
+            async with lock:
+                completed.add(index)
+                await loop.run_in_executor(
+                    executor, _save_progress, progress_path, etag, size, block_size, set(completed), fd)
+
+        async def _worker():
+            while pending:
+                await _fetch(pending.pop(0))
+
+        workers = [asyncio.ensure_future(_worker()) for _ in range(min(max_concurrency, len(pending)))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            raise
+        await loop.run_in_executor(executor, os.fsync, fd)
+    finally:
+        # Cancelled workers may leave writes running in the executor threads
+        executor.shutdown(wait=True)
+        os.close(fd)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    logging.debug(f"Downloaded {size} bytes in {-(-size // block_size)} ranges")
+    return size
+
+
+async def walk_local(root: str) -> AsyncIterator[str]:
+    # Directories are scanned one at a time, so that the full tree is never materialized
+    loop = asyncio.get_running_loop()
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        entries = await loop.run_in_executor(None, lambda: list(os.scandir(directory)))
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file():
+                yield entry.path
+
+
+def is_transient(error: BaseException | None) -> bool:
+    # Missing blobs, denied requests and local file errors fail the same way on every attempt. Transfers
+    # wrap their errors in WorkflowExecutionException, so the cause is what is classified
+    while error is not None:
+        if isinstance(error, HttpResponseError):
+            return error.status_code in TRANSIENT_STATUSES or (error.status_code or 0) >= 500
+        if isinstance(error, (ServiceRequestError, ServiceResponseError, aiohttp.ClientError,
+                              asyncio.TimeoutError, ConnectionError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+async def with_retries(transfer: Callable[..., Awaitable[Any]], *args, max_retries: int = DEFAULT_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            return await transfer(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_transient(e):
+                raise
+            delay = RETRY_BACKOFF * (2 ** attempt) * (1 + random.random())
+            logging.warning(f"Transfer attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            instrumentation().increment("azure_retries_total", service="blob", component="transfer")
+            await asyncio.sleep(delay)
+
+
+async def transfer_pool(items: AsyncIterable | Iterable, transfer: Callable[..., Awaitable[Any]],
+                        max_concurrency: int = DEFAULT_MAX_FILE_CONCURRENCY,
+                        max_retries: int = DEFAULT_MAX_RETRIES) -> list[tuple[Any, Exception]]:
+    # Items are pulled lazily through a bounded queue, so that producers never run far ahead
+    # of the workers. Failed items are retried and collected instead of aborting the pool
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    failures: list[tuple[Any, Exception]] = []
+    done = object()
+
+    async def _worker():
+        while (item := await queue.get()) is not done:
+            try:
+                await with_retries(transfer, *item, max_retries=max_retries)
+            except Exception as e:
+                failures.append((item, e))
+
+    workers = [asyncio.ensure_future(_worker()) for _ in range(max_concurrency)]
+    try:
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await queue.put(item)
+        else:
+            for item in items:
+                await queue.put(item)
+        for _ in workers:
+            await queue.put(done)
+        await asyncio.gather(*workers)
+    except BaseException:
+        for worker in workers:
+            worker.cancel()
+        raise
+    return failures
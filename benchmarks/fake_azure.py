@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from types import SimpleNamespace
+from urllib.parse import unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+from azure.core.exceptions import HttpResponseError
+
+CHUNK_SIZE = 256 * 1024
+
+
+class FakeBlobStorage:
+    # Minimal in-memory Blob REST endpoint, enough for the block blob operations used by the connector.
+    # Latency is added to every request, bandwidth throttles request and response bodies, and a fraction
+    # of the requests is throttled to exercise the retry paths. Storage throttles with 503 ServerBusy,
+    # while other Azure services answer 429. An account limit throttles the requests beyond a number
+    # of concurrent ones, like a storage account past its scalability targets
+    def __init__(self, latency: float = 0.0, bandwidth: float | None = None, throttle_rate: float = 0.0,
+                 throttle_status: int = 503, retry_after: float = 0.0, account_limit: int = 0, seed: int = 0):
+        self.latency = latency
+        self.account_limit = account_limit
+        self.in_flight = 0
+        self.throttle_status = throttle_status
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.blobs: dict[tuple[str, str], dict] = {}
+        self.blocks: dict[tuple[str, str], dict[str, bytes]] = {}
+        self.requests = 0
+        self.throttled = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3, middlewares=[self.middleware])
+        app.router.add_route("*", "/{account}/{container}", self.container)
+        app.router.add_route("*", "/{account}/{container}/{blob:.+}", self.blob)
+        return app
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if (self.throttle_rate and self.random.random() < self.throttle_rate) or (
+                    self.account_limit and self.in_flight > self.account_limit):
+                self.throttled += 1
+                await request.read()
+                return web.Response(status=self.throttle_status, headers={
+                    **self._headers(), "Retry-After": str(self.retry_after), "x-ms-error-code": "ServerBusy"})
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    def _headers(self) -> dict:
+        return {"x-ms-request-id": str(uuid.uuid4()), "x-ms-version": "2021-08-06", "Date": formatdate(usegmt=True)}
+
+    async def _body(self, request: web.Request) -> bytes:
+        body = await request.read()
+        if self.bandwidth:
+            await asyncio.sleep(len(body) / self.bandwidth)
+        return body
+
+    def _store(self, key: tuple[str, str], data: bytes, request: web.Request) -> web.Response:
+        etag = f'"0x{uuid.uuid4().hex[:16].upper()}"'
+        self.blobs[key] = {
+            "data": data,
+            "etag": etag,
+            "last_modified": formatdate(usegmt=True),
+            "content_md5": request.headers.get("x-ms-blob-content-md5"),
+            "content_encoding": request.headers.get("x-ms-blob-content-encoding"),
+            "metadata": {k[len("x-ms-meta-"):]: v for k, v in request.headers.items()
+                         if k.lower().startswith("x-ms-meta-")}
+        }
+        return web.Response(status=201, headers={
+            **self._headers(), "ETag": etag, "Last-Modified": self.blobs[key]["last_modified"],
+            "Content-MD5": base64.b64encode(hashlib.md5(data).digest()).decode(), "x-ms-request-server-encrypted": "true"
+        })
+
+    def _properties(self, blob: dict) -> dict:
+        headers = {
+            **self._headers(), "ETag": blob["etag"], "Last-Modified": blob["last_modified"],
+            "x-ms-blob-type": "BlockBlob", "Content-Type": "application/octet-stream", "Accept-Ranges": "bytes",
+            **{f"x-ms-meta-{k}": v for k, v in blob["metadata"].items()}
+        }
+        if blob["content_md5"]:
+            headers["Content-MD5"] = blob["content_md5"]
+        if blob.get("content_encoding"):
+            headers["Content-Encoding"] = blob["content_encoding"]
+        return headers
+
+    async def container(self, request: web.Request) -> web.Response:
+        container = request.match_info["container"]
+        if request.method == "PUT":
+            return web.Response(status=201, headers=self._headers())
+        if request.method == "POST":
+            # Blob batch requests are not emulated, as in Azurite: clients fall back to single requests
+            return web.Response(status=400, headers={**self._headers(), "x-ms-error-code": "FeatureNotSupported"})
+        prefix = request.query.get("prefix", "")
+        delimiter = request.query.get("delimiter")
+        entries = []
+        prefixes = set()
+        for (name_container, name), blob in sorted(self.blobs.items()):
+            if name_container == container and name.startswith(prefix):
+                if delimiter and delimiter in name[len(prefix):]:
+                    child = name[:name.index(delimiter, len(prefix)) + len(delimiter)]
+                    if child not in prefixes:
+                        prefixes.add(child)
+                        entries.append(f"<BlobPrefix><Name>{escape(child)}</Name></BlobPrefix>")
+                    continue
+                metadata = "".join(f"<{k}>{escape(v)}</{k}>" for k, v in blob["metadata"].items())
+                md5 = f"<Content-MD5>{blob['content_md5']}</Content-MD5>" if blob["content_md5"] else ""
+                entries.append(
+                    f"<Blob><Name>{escape(name)}</Name><Properties><Last-Modified>{blob['last_modified']}"
+                    f"</Last-Modified><Etag>{blob['etag']}</Etag><Content-Length>{len(blob['data'])}"
+                    f"</Content-Length><BlobType>BlockBlob</BlobType>{md5}</Properties>"
+                    f"<Metadata>{metadata}</Metadata></Blob>")
+        delimiter_element = f"<Delimiter>{escape(delimiter)}</Delimiter>" if delimiter else ""
+        body = (f'<?xml version="1.0" encoding="utf-8"?><EnumerationResults ContainerName="{container}">'
+                f"<Prefix>{escape(prefix)}</Prefix>{delimiter_element}<Blobs>{''.join(entries)}</Blobs>"
+                f"<NextMarker /></EnumerationResults>")
+        return web.Response(body=body.encode(), headers={**self._headers(), "Content-Type": "application/xml"})
+
+    async def blob(self, request: web.Request) -> web.StreamResponse:
+        key = (request.match_info["container"], request.match_info["blob"])
+        comp = request.query.get("comp")
+        if request.method == "PUT" and comp == "block":
+            self.blocks.setdefault(key, {})[request.query["blockid"]] = await self._body(request)
+            return web.Response(status=201, headers=self._headers())
+        if request.method == "PUT" and comp == "blocklist":
+            block_list = ElementTree.fromstring(await self._body(request))
+            staged = self.blocks.pop(key, {})
+            return self._store(key, b"".join(staged[element.text] for element in block_list), request)
+        if request.method == "PUT" and (source := request.headers.get("x-ms-copy-source")):
+            # Synchronous copy from a URL of this account, the SAS token is not checked
+            _, container, name = unquote(urlparse(source).path).lstrip("/").split("/", 2)
+            if (container, name) not in self.blobs:
+                return web.Response(status=404, headers={**self._headers(), "x-ms-error-code": "CannotVerifyCopySource"})
+            return self._store(key, self.blobs[(container, name)]["data"], request)
+        if request.method == "PUT" and comp != "tier":
+            return self._store(key, await self._body(request), request)
+        blob = self.blobs.get(key)
+        if blob is None:
+            return web.Response(status=404, headers={**self._headers(), "x-ms-error-code": "BlobNotFound"})
+        if request.method == "PUT":
+            blob["tier"] = request.headers["x-ms-access-tier"]
+            return web.Response(status=200, headers=self._headers())
+        if request.method == "DELETE":
+            del self.blobs[key]
+            return web.Response(status=202, headers=self._headers())
+        if request.method == "HEAD":
+            return web.Response(headers={**self._properties(blob), "Content-Length": str(len(blob["data"]))})
+        data = blob["data"]
+        headers = self._properties(blob)
+        status = 200
+        if header := request.headers.get("x-ms-range") or request.headers.get("Range"):
+            start, _, end = header.split("=", 1)[1].partition("-")
+            start, end = int(start), min(int(end) if end else len(data) - 1, len(data) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+            status = 206
+        response = web.StreamResponse(status=status, headers={**headers, "Content-Length": str(len(data))})
+        await response.prepare(request)
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+
+class FakeBatchService:
+    # In-process stand-in for the Batch operation groups used by the executor, with the same latency
+    # and throttling knobs as the Blob fake. Tasks complete after a fixed run time
+    def __init__(self, latency: float = 0.0, throttle_rate: float = 0.0, task_duration: float = 0.0,
+                 seed: int = 0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.task_duration = task_duration
+        self.random = random.Random(seed)
+        self.tasks: dict[str, dict] = {}
+        self.requests = {"add_collection": 0, "list": 0}
+        self.throttled = 0
+        self.task = self
+        self.pool = self
+        self.job = self
+
+    async def close(self):
+        pass
+
+    async def _request(self, operation: str):
+        self.requests[operation] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            self.throttled += 1
+            error = HttpResponseError(message="Too many requests")
+            error.status_code = 429
+            raise error
+
+    async def add_collection(self, job_id: str, tasks: list[dict]):
+        await self._request("add_collection")
+        now = asyncio.get_running_loop().time()
+        for task in tasks:
+            self.tasks[task["id"]] = {"added": now}
+        return SimpleNamespace(value=[SimpleNamespace(task_id=t["id"], status="success") for t in tasks])
+
+    def list(self, job_id: str, task_list_options=None):
+        async def iterate():
+            await self._request("list")
+            now = asyncio.get_running_loop().time()
+            epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            for task_id, task in list(self.tasks.items()):
+                done = now - task["added"] >= self.task_duration
+                yield SimpleNamespace(
+                    id=task_id, state="completed" if done else "running",
+                    execution_info=SimpleNamespace(exit_code=0 if done else None),
+                    state_transition_time=epoch + timedelta(seconds=now if done else task["added"]))
+        return iterate()
+
+
+async def start_blob_server(storage: FakeBlobStorage, host: str = "127.0.0.1") -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(storage.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/devstoreaccount1"
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+from azure.storage.blob.aio import BlobServiceClient, ExponentialRetry
+
+import azure_streamflow.blob_connector
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.config import AzureConfig
+from azure_streamflow.executor import AzureExecutor
+from benchmarks.fake_azure import FakeBatchService, FakeBlobStorage, start_blob_server
+
+MIB = 1024 * 1024
+ACCOUNT_NAME = "devstoreaccount1"
+ACCOUNT_KEY = base64.b64encode(b"streamflow-azure-benchmark-key").decode()
+SCENARIOS = ["upload", "download", "small_files", "submit", "poll"]
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MIB if sys.platform == "darwin" else peak / 1024
+
+
+def _blob_connector(account_url: str, args) -> AzureBlobConnector:
+    return AzureBlobConnector({
+        "blob_account_url": account_url,
+        "account_name": ACCOUNT_NAME,
+        "account_key": ACCOUNT_KEY,
+        "container": "bench",
+        "chunked_upload": True,
+        "parallel_download": True,
+        "block_size": args.block_size * MIB,
+        "max_concurrency": args.concurrency,
+        "max_file_concurrency": args.file_concurrency
+    })
+
+
+async def _with_blob_server(args, scenario):
+    storage = FakeBlobStorage(latency=args.latency, bandwidth=args.bandwidth * MIB if args.bandwidth else None,
+                              throttle_rate=args.throttle_rate, throttle_status=args.throttle_status,
+                              account_limit=args.account_limit)
+    runner, account_url = await start_blob_server(storage)
+    connector = _blob_connector(account_url, args)
+    await connector.setup()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = await scenario(connector, storage, workdir)
+    finally:
+        await connector.close()
+        await runner.cleanup()
+    return {**result, "requests": storage.requests, "throttled": storage.throttled}
+
+
+async def bench_upload(args):
+    async def scenario(connector, storage, workdir):
+        path = os.path.join(workdir, "large.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(MIB))
+        start = time.perf_counter()
+        await connector._upload_blob(path, "bench", "large.bin")
+        elapsed = time.perf_counter() - start
+        return {"bytes": args.size * MIB, "seconds": elapsed, "mb_per_s": args.size / elapsed}
+    return await _with_blob_server(args, scenario)
+
+
+async def bench_download(args):
+    async def scenario(connector, storage, workdir):
+        storage.blobs[("bench", "large.bin")] = {
+            "data": os.urandom(args.size * MIB), "etag": '"0x1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+            "content_md5": None, "metadata": {}}
+        start = time.perf_counter()
+        await connector._download_blob("bench", "large.bin", os.path.join(workdir, "large.bin"))
+        elapsed = time.perf_counter() - start
+        return {"bytes": args.size * MIB, "seconds": elapsed, "mb_per_s": args.size / elapsed}
+    return await _with_blob_server(args, scenario)
+
+
+async def bench_small_files(args):
+    async def scenario(connector, storage, workdir):
+        source = os.path.join(workdir, "source")
+        for i in range(args.files):
+            directory = os.path.join(source, f"d{i % 16}")
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"f{i}"), "wb") as f:
+                f.write(os.urandom(args.file_size))
+        start = time.perf_counter()
+        await connector.copy_local_to_remote(source, "tree", None)
+        upload = time.perf_counter() - start
+        start = time.perf_counter()
+        await connector.copy_remote_to_local("tree", os.path.join(workdir, "copy"), None)
+        download = time.perf_counter() - start
+        return {"files": args.files, "upload_ops_per_s": args.files / upload,
+                "download_ops_per_s": args.files / download}
+    return await _with_blob_server(args, scenario)
+
+
+def _executor(service: FakeBatchService) -> AzureExecutor:
+    executor = AzureExecutor(AzureConfig({
+        "batch_account_url": "https://bench.region.batch.azure.com",
+        "managed_identity": True
+    }))
+    executor.batch_client = service
+    return executor
+
+
+async def bench_submit(args):
+    service = FakeBatchService(latency=args.latency, throttle_rate=args.throttle_rate)
+    executor = _executor(service)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(executor.enqueue_task("bench", f"task-{i}", "true") for i in range(args.tasks)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    await executor.close()
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    return {"tasks": args.tasks, "failed": failed, "seconds": elapsed, "tasks_per_s": args.tasks / elapsed,
+            "requests": service.requests["add_collection"], "throttled": service.throttled}
+
+
+async def bench_poll(args):
+    service = FakeBatchService(latency=args.latency, throttle_rate=args.throttle_rate,
+                               task_duration=args.task_duration)
+    executor = _executor(service)
+    await asyncio.gather(*(executor.enqueue_task("bench", f"task-{i}", "true") for i in range(args.tasks)))
+    poller = executor.task_poller("bench")
+    start = time.perf_counter()
+    await asyncio.gather(*(poller.wait(f"task-{i}") for i in range(args.tasks)))
+    elapsed = time.perf_counter() - start
+    await executor.close()
+    return {"tasks": args.tasks, "seconds": elapsed, "poll_requests": service.requests["list"],
+            "poll_requests_per_task": service.requests["list"] / args.tasks, "throttled": service.throttled}
+
+
+def run_child(args):
+    # Storage retries back off for seconds by default, too long for injected throttling
+    azure_streamflow.blob_connector.BlobServiceClient = partial(
+        BlobServiceClient, retry_policy=ExponentialRetry(initial_backoff=0.05, increment_base=2, retry_total=10))
+    start = time.perf_counter()
+    result = asyncio.run(globals()[f"bench_{args.scenario}"](args))
+    result["wall_seconds"] = time.perf_counter() - start
+    result["peak_rss_mib"] = _peak_rss_mib()
+    print(json.dumps(result))
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the Azure connectors against local stand-ins")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run, can be repeated (default: all)")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds added to every request")
+    parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s per request body, 0 for unlimited")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests throttled")
+    parser.add_argument("--throttle-status", type=int, default=503,
+                        help="Status of throttled Blob requests, Batch requests are always throttled with 429")
+    parser.add_argument("--account-limit", type=int, default=0,
+                        help="Concurrent Blob requests beyond which requests are throttled, 0 for no limit")
+    parser.add_argument("--size", type=int, default=64, help="MiB transferred by upload and download")
+    parser.add_argument("--block-size", type=int, default=4, help="Block size in MiB")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent blocks per file")
+    parser.add_argument("--file-concurrency", type=int, default=8, help="Concurrent files in directory transfers")
+    parser.add_argument("--files", type=int, default=500, help="Files of the small_files scenario")
+    parser.add_argument("--file-size", type=int, default=4096, help="Bytes per small file")
+    parser.add_argument("--tasks", type=int, default=1000, help="Tasks of the submit and poll scenarios")
+    parser.add_argument("--task-duration", type=float, default=2.0, help="Seconds each task runs in poll")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        args.scenario = args.scenario[0]
+        run_child(args)
+        return
+    # Every scenario runs in its own process, so that the peak RSS is its own
+    parameters = {k: v for k, v in vars(args).items() if k not in ("scenario", "output", "child")}
+    passthrough = [f"--{k.replace('_', '-')}={v}" for k, v in parameters.items()]
+    results = {}
+    for scenario in args.scenario or SCENARIOS:
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--child", f"--scenario={scenario}", *passthrough],
+            capture_output=True, text=True)
+        if process.returncode != 0:
+            results[scenario] = {"error": process.stderr.strip().splitlines()[-1:]}
+        else:
+            results[scenario] = json.loads(process.stdout.strip().splitlines()[-1])
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import pytest
+
+from azure_streamflow.config import AzureConfig
+
+
+@pytest.fixture
+def mock_config():
+    return AzureConfig({
+        "batch_account_url": "https://test-batch-account.region.batch.azure.com",
+        "client_id": "fake-client-id",
+        "client_secret": "fake-client-secret",
+        "tenant_id": "fake-tenant-id"
+    })
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from azure_streamflow.autoscale import PoolAutoscaler, autoscale_formula
+
+
+def test_autoscale_formula():
+    formula = autoscale_formula(1, 20, tasks_per_node=4, scale_down_delay=10)
+    assert "$PendingTasks.GetSample(TimeInterval_Minute * 10)" in formula
+    assert "($pending + 3) / 4" in formula
+    assert formula.splitlines()[-2] == "$TargetDedicatedNodes = max(1, min(20, max($up, $hold)));"
+
+
+@pytest.mark.asyncio
+async def test_connector_autoscaler_decisions():
+    executor = SimpleNamespace(pending_tasks=0, resize_pool=AsyncMock())
+    autoscaler = PoolAutoscaler(executor, "testpool", {
+        "mode": "connector", "min_nodes": 1, "max_nodes": 8, "tasks_per_node": 2, "scale_down_delay": 1})
+    autoscaler.target = 2
+
+    executor.pending_tasks = 9
+    assert (await autoscaler.step(now=0))["target"] == 5
+    executor.pending_tasks = 100
+    assert (await autoscaler.step(now=10))["target"] == 8
+    # A dip shorter than the scale down delay keeps the nodes
+    executor.pending_tasks = 0
+    assert (await autoscaler.step(now=20))["reason"] == "scale down delayed"
+    assert (await autoscaler.step(now=50))["target"] == 8
+    assert (await autoscaler.step(now=81))["target"] == 1
+
+    assert [c.args for c in executor.resize_pool.await_args_list] == [
+        ("testpool", 5), ("testpool", 8), ("testpool", 1)]
+    assert [d["reason"] for d in autoscaler.history] == [
+        "scale up", "scale up", "scale down delayed", "scale down delayed", "scale down"]
+
+
+@pytest.mark.asyncio
+async def test_formula_autoscaler_records_runs():
+    pool = SimpleNamespace(current_dedicated_nodes=2, target_dedicated_nodes=4, auto_scale_run=SimpleNamespace(
+        timestamp="2024-01-01T00:00:00Z", results="$TargetDedicatedNodes=4", error=None))
+    executor = SimpleNamespace(pending_tasks=7, batch_client=MagicMock())
+    executor.batch_client.pool.get = AsyncMock(return_value=pool)
+    autoscaler = PoolAutoscaler(executor, "testpool", {"max_nodes": 8})
+
+    decision = await autoscaler.record_run()
+    assert decision["results"] == "$TargetDedicatedNodes=4"
+    assert decision["pending"] == 7
+    assert await autoscaler.record_run() is None
+    assert len(autoscaler.history) == 1
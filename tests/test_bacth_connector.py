@@ -1,18 +1,12 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
+from azure.core.exceptions import HttpResponseError
 from azure_streamflow.executor import AzureExecutor
-from azure_streamflow.config import AzureConfig
+from streamflow.core.exception import WorkflowExecutionException
 
 
-@pytest.fixture
-def mock_config():
-    return AzureConfig({
-        "batch_account_url": "https://test-batch-account.region.batch.azure.com",
-        "client_id": "fake-client-id",
-        "client_secret": "fake-client-secret",
-        "tenant_id": "fake-tenant-id"
-    })
-
 @pytest.mark.asyncio
 @patch('azure_streamflow.executor.BatchClient', autospec=True)
 @patch('azure_streamflow.executor.DefaultAzureCredential')
@@ -105,4 +99,188 @@ async def test_delete_pool(mock_credentials, mock_batch_client_class, mock_confi
     await executor.initialize()
     await executor.delete_pool("testpool")
 
-    mock_batch_client_instance.pool.delete.assert_awaited_once_with("testpool")
\ No newline at end of file
+    mock_batch_client_instance.pool.delete.assert_awaited_once_with("testpool")
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.submission.RETRY_BACKOFF', 0)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_enqueue_task_batches_collections(mock_credentials, mock_batch_client_class, mock_config):
+    attempts = {}
+    calls = []
+
+    async def add_collection(job_id, tasks):
+        calls.append([t['id'] for t in tasks])
+        results = []
+        for t in tasks:
+            attempts[t['id']] = attempts.get(t['id'], 0) + 1
+            if t['id'] == 'bad':
+                status = 'clientError'
+            elif t['id'].endswith('7') and attempts[t['id']] == 1:
+                status = 'serverError'
+            else:
+                status = 'success'
+            results.append(MagicMock(task_id=t['id'], status=status))
+        return MagicMock(value=results)
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.task = MagicMock()
+    mock_batch_client_instance.task.add_collection = AsyncMock(side_effect=add_collection)
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    task_ids = [f"task-{i}" for i in range(250)]
+    results = await asyncio.gather(
+        *(executor.enqueue_task("testjob", task_id, "echo") for task_id in task_ids + ['bad']),
+        return_exceptions=True)
+    await executor.close()
+
+    assert [r.task_id for r in results[:-1]] == task_ids
+    assert isinstance(results[-1], WorkflowExecutionException)
+    collections = [c for c in calls if len(c) > 10]
+    retries = [c for c in calls if len(c) <= 10]
+    assert sorted(len(c) for c in collections) == [51, 100, 100]
+    assert sorted(t for c in retries for t in c) == sorted(t for t in task_ids if t.endswith('7'))
+    assert len(retries) == 3
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.submission.RETRY_BACKOFF', 0)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_enqueue_task_resent_after_connection_error(mock_credentials, mock_batch_client_class, mock_config):
+    added = set()
+
+    async def add_collection(job_id, tasks):
+        results = []
+        for t in tasks:
+            if t['id'] in added:
+                results.append(MagicMock(task_id=t['id'], status='clientError', error=MagicMock(code='TaskExists')))
+            else:
+                added.add(t['id'])
+                results.append(MagicMock(task_id=t['id'], status='success'))
+        if all(r.status == 'success' for r in results):
+            # The tasks are added, but the response is lost
+            raise ConnectionResetError("Connection reset by peer")
+        return MagicMock(value=results)
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.task.add_collection = AsyncMock(side_effect=add_collection)
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    results = await asyncio.gather(*(executor.enqueue_task("testjob", f"task-{i}", "echo") for i in range(5)))
+    await executor.close()
+
+    assert [r.task_id for r in results] == [f"task-{i}" for i in range(5)]
+    assert mock_batch_client_instance.task.add_collection.await_count == 2
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.submission.RETRY_BACKOFF', 0)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_enqueue_task_ignores_unexpected_results(mock_credentials, mock_batch_client_class, mock_config):
+    async def add_collection(job_id, tasks):
+        # The first task is reported twice, along with an unknown one, and the others are missing
+        first = tasks[0]['id']
+        return MagicMock(value=[MagicMock(task_id=task_id, status='success') for task_id in (first, first, 'other')])
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.task.add_collection = AsyncMock(side_effect=add_collection)
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    results = await asyncio.wait_for(asyncio.gather(
+        *(executor.enqueue_task("testjob", f"task-{i}", "echo") for i in range(6)), return_exceptions=True), 5)
+    await executor.close()
+
+    # Every retry adds one more task, the ones left after the last retry fail
+    assert [r.task_id for r in results[:4]] == ["task-0", "task-1", "task-2", "task-3"]
+    assert all(isinstance(r, WorkflowExecutionException) for r in results[4:])
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.poller.POLL_MIN', 0.01)
+@patch('azure_streamflow.poller.POLL_MAX', 0.02)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.poller.MISSING_POLLS', 100)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_task_poller_shared_across_tasks(mock_credentials, mock_batch_client_class, mock_config):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    completed = []
+    options_seen = []
+
+    def list_tasks(job_id, task_list_options=None):
+        options_seen.append(task_list_options)
+        # One more task completes at every poll
+        completed.append(len(completed))
+
+        async def tasks():
+            for i in completed:
+                yield MagicMock(id=f"task-{i}", state='completed', execution_info=MagicMock(exit_code=i % 2),
+                                state_transition_time=base + timedelta(seconds=i))
+        return tasks()
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.task = MagicMock()
+    mock_batch_client_instance.task.list = MagicMock(side_effect=list_tasks)
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    poller = executor.task_poller("testjob")
+    states = await asyncio.gather(*(poller.wait(f"task-{i}") for i in range(20)))
+
+    assert [s.exit_code for s in states] == [i % 2 for i in range(20)]
+    assert executor.task_poller("testjob") is poller
+    assert poller.requests == len(options_seen) <= 21
+    assert options_seen[0] == {"select": "id,state,stateTransitionTime,executionInfo"}
+    assert options_seen[-1]["filter"].startswith("stateTransitionTime ge DateTime'2024-01-01T00:00:")
+    assert poller.task.done()
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.poller.POLL_MIN', 0.01)
+@patch('azure_streamflow.poller.POLL_MAX', 0.02)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_task_poller_fails_missing_tasks(mock_credentials, mock_batch_client_class, mock_config):
+    def list_tasks(job_id, task_list_options=None):
+        async def tasks():
+            return
+            yield
+        return tasks()
+
+    async def get_task(job_id, task_id):
+        if task_id == "deleted":
+            error = HttpResponseError(message="The specified task does not exist")
+            error.status_code = 404
+            raise error
+        return MagicMock(id=task_id, state='completed', execution_info=MagicMock(exit_code=0))
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.task.list = MagicMock(side_effect=list_tasks)
+    mock_batch_client_instance.task.get = AsyncMock(side_effect=get_task)
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    poller = executor.task_poller("testjob")
+    # A task skipped by the listings is looked up once, a deleted one fails its waiters
+    old, deleted = await asyncio.wait_for(
+        asyncio.gather(poller.wait("old"), poller.wait("deleted"), return_exceptions=True), 5)
+    assert old.exit_code == 0
+    assert isinstance(deleted, WorkflowExecutionException) and "deleted" in str(deleted)
+    assert mock_batch_client_instance.task.get.await_count == 2
+
+    poller.watch("pending")
+    await poller.close()
+    assert poller.task is None
+    await executor.close()
@@ -0,0 +1,25 @@
+from argparse import Namespace
+
+import pytest
+
+from benchmarks.run import bench_download, bench_poll, bench_small_files, bench_submit, bench_upload
+
+
+@pytest.fixture
+def args():
+    return Namespace(latency=0.0, bandwidth=0, throttle_rate=0.0, throttle_status=503, account_limit=0, size=2,
+                     block_size=1, concurrency=2, file_concurrency=4, files=20, file_size=128, tasks=50,
+                     task_duration=0.0)
+
+
+@pytest.mark.asyncio
+async def test_blob_benchmarks_run(args):
+    assert (await bench_upload(args))["bytes"] == 2 * 1024 * 1024
+    assert (await bench_download(args))["mb_per_s"] > 0
+    assert (await bench_small_files(args))["files"] == 20
+
+
+@pytest.mark.asyncio
+async def test_batch_benchmarks_run(args):
+    assert (await bench_submit(args))["failed"] == 0
+    assert (await bench_poll(args))["poll_requests"] >= 1
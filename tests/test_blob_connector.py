@@ -1,6 +1,21 @@
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
+from azure.core.exceptions import ClientAuthenticationError, HttpResponseError, ResourceNotFoundError
+from streamflow.core.exception import WorkflowExecutionException
 from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.sync import md5_file
+from azure_streamflow.transfer import download_ranges, upload_blocks, with_retries
+
+
+async def _async_iter(items):
+    for item in items:
+        yield item
 
 
 @pytest.mark.asyncio
@@ -95,7 +110,7 @@ async def test_read_returns_content(mock_blob_service_client_cls, mock_credentia
 
     # Mock Blob client
     mock_stream = MagicMock()
-    mock_stream.readall = AsyncMock(return_value=b"hello world")
+    mock_stream.chunks = MagicMock(return_value=_async_iter([b"hello world"]))
 
     mock_blob_client = MagicMock()
     mock_blob_client.download_blob = AsyncMock(return_value=mock_stream)
@@ -118,7 +133,7 @@ async def test_read_returns_content(mock_blob_service_client_cls, mock_credentia
         container="my-container", blob="path/to/file.txt"
     )
     mock_blob_client.download_blob.assert_awaited_once()
-    mock_stream.readall.assert_awaited_once()
+    mock_stream.chunks.assert_called_once()
     mock_bsc_instance.close.assert_awaited_once()
     mock_credential.close.assert_awaited_once()
 
@@ -144,7 +159,7 @@ async def test_read_uses_custom_encoding(mock_blob_service_client_cls, mock_cred
     mock_credential_cls.return_value = mock_credential
 
     mock_stream = MagicMock()
-    mock_stream.readall = AsyncMock(return_value=data)
+    mock_stream.chunks = MagicMock(return_value=_async_iter([data]))
 
     mock_blob_client = MagicMock()
     mock_blob_client.download_blob = AsyncMock(return_value=mock_stream)
@@ -167,7 +182,7 @@ async def test_read_uses_custom_encoding(mock_blob_service_client_cls, mock_cred
         container="my-container", blob="file.txt"
     )
     mock_blob_client.download_blob.assert_awaited_once()
-    mock_stream.readall.assert_awaited_once()
+    mock_stream.chunks.assert_called_once()
 
 @pytest.mark.asyncio
 @patch("azure_streamflow.blob_connector.DefaultAzureCredential")
@@ -217,7 +232,7 @@ async def test_blob_read_returns_content(mock_blob_service_client_class, mock_cr
     mock_blob_service_client_class.return_value = mock_blob_service
 
     mock_stream = MagicMock()
-    mock_stream.readall = AsyncMock(return_value=b"hello world")
+    mock_stream.chunks = MagicMock(return_value=_async_iter([b"hello world"]))
 
     mock_blob_client = MagicMock()
     mock_blob_client.download_blob = AsyncMock(return_value=mock_stream)
@@ -244,7 +259,7 @@ async def test_blob_read_returns_content(mock_blob_service_client_class, mock_cr
     assert result == "hello world"
     mock_blob_service.get_blob_client.assert_called_once_with(container="mycontainer", blob="myfile.txt")
     mock_blob_client.download_blob.assert_awaited_once()
-    mock_stream.readall.assert_awaited_once()
+    mock_stream.chunks.assert_called_once()
     mock_blob_service.close.assert_awaited_once()
     mock_credential_class.return_value.close.assert_awaited_once()
 
@@ -259,7 +274,7 @@ async def test_blob_read_uses_custom_encoding(mock_blob_service_client_class, mo
 
     data = "café".encode("latin-1")
     mock_stream = MagicMock()
-    mock_stream.readall = AsyncMock(return_value=data)
+    mock_stream.chunks = MagicMock(return_value=_async_iter([data]))
 
     mock_blob_client = MagicMock()
     mock_blob_client.download_blob = AsyncMock(return_value=mock_stream)
@@ -286,6 +301,468 @@ async def test_blob_read_uses_custom_encoding(mock_blob_service_client_class, mo
     assert result == "café"
     mock_blob_service.get_blob_client.assert_called_once_with(container="mycontainer", blob="myfile.txt")
     mock_blob_client.download_blob.assert_awaited_once()
-    mock_stream.readall.assert_awaited_once()
+    mock_stream.chunks.assert_called_once()
+
+
+class FakeBlockBlobClient:
+    def __init__(self):
+        self.blocks = {}
+        self.committed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def stage_block(self, block_id, data):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.blocks[block_id] = len(data)
+        self.in_flight -= 1
+
+    async def commit_block_list(self, block_list, **kwargs):
+        self.committed = [b.id for b in block_list]
+
+
+@pytest.mark.asyncio
+@patch("azure_streamflow.blob_connector.DefaultAzureCredential")
+@patch("azure_streamflow.blob_connector.BlobServiceClient")
+async def test_blob_chunked_upload_bounded_memory(mock_blob_service_client_class, mock_credential_class, tmp_path):
+    block_size = 1024 * 1024
+    file_size = 64 * block_size + 123
+    local_path = tmp_path / "large.bin"
+    with open(local_path, "wb") as f:
+        f.truncate(file_size)
+
+    fake_blob_client = FakeBlockBlobClient()
+    mock_blob_service = MagicMock()
+    mock_blob_service.close = AsyncMock()
+    mock_blob_service.get_blob_client.return_value = fake_blob_client
+    mock_blob_service_client_class.return_value = mock_blob_service
+    mock_credential_class.return_value.close = AsyncMock()
+
+    config = {
+        "blob_account_url": "https://dummy.blob.core.windows.net",
+        "action": "upload",
+        "container": "mycontainer",
+        "blob_name": "large.bin",
+        "local_path": str(local_path),
+        "chunked_upload": True,
+        "block_size": block_size,
+        "max_concurrency": 4
+    }
+
+    connector = AzureBlobConnector(config)
+    await connector.setup()
+    tracemalloc.start()
+    try:
+        result = await connector.run("echo", None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    await connector.close()
+
+    assert result == "upload completed"
+    assert len(fake_blob_client.committed) == 65
+    assert sum(fake_blob_client.blocks.values()) == file_size
+    assert fake_blob_client.max_in_flight <= 4
+    assert peak < 8 * block_size
+
+
+@pytest.mark.asyncio
+async def test_upload_blocks_raises_first_failure():
+    class FailingBlobClient(FakeBlockBlobClient):
+        async def stage_block(self, block_id, data):
+            if block_id == "00000002":
+                raise OSError("connection reset")
+            await super().stage_block(block_id, data)
+
+    async def source():
+        for _ in range(32):
+            yield b"x" * 16
+            await asyncio.sleep(0.001)
+
+    blob_client = FailingBlobClient()
+    with pytest.raises(OSError, match="connection reset"):
+        await upload_blocks(blob_client, source(), max_concurrency=2)
+    assert blob_client.committed == []
+
+
+class FakeRangeBlobClient:
+    def __init__(self, data, etag="0x1"):
+        self.data = data
+        self.etag = etag
+        self.requested = []
+
+    async def get_blob_properties(self):
+        return MagicMock(size=len(self.data), etag=self.etag)
+
+    async def download_blob(self, offset=None, length=None, **kwargs):
+        self.requested.append(offset)
+        payload = self.data[offset:offset + length]
+
+        async def chunks():
+            for i in range(0, len(payload), 1000):
+                await asyncio.sleep(0)
+                yield payload[i:i + 1000]
+
+        stream = MagicMock()
+        stream.chunks = chunks
+        return stream
+
+
+def _parallel_download_connector(fake_blob_client, local_path, block_size):
+    mock_blob_service = MagicMock()
+    mock_blob_service.close = AsyncMock()
+    mock_blob_service.get_blob_client.return_value = fake_blob_client
+    return mock_blob_service, {
+        "blob_account_url": "https://dummy.blob.core.windows.net",
+        "action": "download",
+        "container": "mycontainer",
+        "blob_name": "data.bin",
+        "local_path": str(local_path),
+        "parallel_download": True,
+        "block_size": block_size,
+        "max_concurrency": 3
+    }
+
+
+@pytest.mark.asyncio
+@patch("azure_streamflow.blob_connector.DefaultAzureCredential")
+@patch("azure_streamflow.blob_connector.BlobServiceClient")
+async def test_blob_parallel_download(mock_blob_service_client_class, mock_credential_class, tmp_path):
+    data = os.urandom(10 * 4096 + 17)
+    local_path = tmp_path / "data.bin"
+    fake_blob_client = FakeRangeBlobClient(data)
+    mock_blob_service, config = _parallel_download_connector(fake_blob_client, local_path, 4096)
+    mock_blob_service_client_class.return_value = mock_blob_service
+    mock_credential_class.return_value.close = AsyncMock()
+
+    connector = AzureBlobConnector(config)
+    await connector.setup()
+    result = await connector.run("echo", None)
+    await connector.close()
 
+    assert result == "download completed"
+    assert local_path.read_bytes() == data
+    assert sorted(fake_blob_client.requested) == [i * 4096 for i in range(11)]
+    assert not os.path.exists(str(local_path) + ".sfpart")
 
+
+@pytest.mark.asyncio
+@patch("azure_streamflow.blob_connector.DefaultAzureCredential")
+@patch("azure_streamflow.blob_connector.BlobServiceClient")
+async def test_blob_parallel_download_resume(mock_blob_service_client_class, mock_credential_class, tmp_path):
+    data = os.urandom(4 * 4096)
+    local_path = tmp_path / "data.bin"
+    local_path.write_bytes(data[:8192] + bytes(8192))
+    (tmp_path / "data.bin.sfpart").write_text(json.dumps(
+        {"etag": "0x1", "size": len(data), "block_size": 4096, "completed": [0, 1]}))
+    fake_blob_client = FakeRangeBlobClient(data)
+    mock_blob_service, config = _parallel_download_connector(fake_blob_client, local_path, 4096)
+    mock_blob_service_client_class.return_value = mock_blob_service
+    mock_credential_class.return_value.close = AsyncMock()
+
+    connector = AzureBlobConnector(config)
+    await connector.setup()
+    await connector.run("echo", None)
+    await connector.close()
+
+    assert local_path.read_bytes() == data
+    assert sorted(fake_blob_client.requested) == [8192, 12288]
+
+
+@pytest.mark.asyncio
+async def test_download_ranges_waits_for_writes_on_failure(tmp_path, monkeypatch):
+    data = os.urandom(4 * 4096)
+    writes = {"started": 0, "finished": 0}
+    pwrite = os.pwrite
+
+    def slow_pwrite(fd, chunk, offset):
+        writes["started"] += 1
+        time.sleep(0.05)
+        written = pwrite(fd, chunk, offset)
+        writes["finished"] += 1
+        return written
+
+    class FailingRangeBlobClient(FakeRangeBlobClient):
+        async def download_blob(self, offset=None, length=None, **kwargs):
+            if offset == 4096:
+                raise ConnectionResetError("reset")
+            return await super().download_blob(offset, length, **kwargs)
+
+    monkeypatch.setattr("azure_streamflow.transfer.os.pwrite", slow_pwrite)
+    with pytest.raises(ConnectionResetError):
+        await download_ranges(FailingRangeBlobClient(data), str(tmp_path / "data.bin"), block_size=4096,
+                              max_concurrency=4, properties=SimpleNamespace(size=len(data), etag="0x1"))
+    # No write is left running against the closed descriptor
+    assert writes["started"] > 0 and writes["finished"] == writes["started"]
+
+
+@pytest.mark.asyncio
+async def test_download_ranges_syncs_before_recording_progress(tmp_path, monkeypatch):
+    data = os.urandom(2 * 4096)
+    calls = []
+    sync = getattr(os, "fdatasync", os.fsync)
+    monkeypatch.setattr(f"azure_streamflow.transfer.os.{sync.__name__}",
+                        lambda fd: calls.append("sync") or sync(fd))
+    original = os.replace
+    monkeypatch.setattr("azure_streamflow.transfer.os.replace",
+                        lambda src, dst: calls.append("progress") or original(src, dst))
+    await download_ranges(FakeRangeBlobClient(data), str(tmp_path / "data.bin"), block_size=4096,
+                          max_concurrency=1, properties=SimpleNamespace(size=len(data), etag="0x1"))
+    assert calls[:4] == ["sync", "progress", "sync", "progress"]
+
+
+def _streaming_connector(data, chunk_size):
+    fake_blob_client = MagicMock()
+    fake_blob_client.get_blob_properties = AsyncMock(return_value=MagicMock(size=len(data)))
+
+    async def download_blob(offset=None, length=None, **kwargs):
+        start = offset or 0
+        payload = data[start:start + length if length is not None else None]
+        stream = MagicMock()
+        stream.chunks = lambda: _async_iter([payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)])
+        return stream
+
+    fake_blob_client.download_blob = download_blob
+    connector = AzureBlobConnector({"blob_account_url": "https://dummy.blob.core.windows.net"})
+    connector.blob_service_client = MagicMock()
+    connector.blob_service_client.get_blob_client.return_value = fake_blob_client
+    return connector
+
+
+@pytest.mark.asyncio
+async def test_blob_iter_decodes_split_characters():
+    text = "naïve café — ☕ ok\n" * 10
+    connector = _streaming_connector(text.encode("utf-8"), 3)
+
+    chunks = [chunk async for chunk in connector.iter_blob_text("c", "b", encoding="utf-8")]
+
+    assert "".join(chunks) == text
+    assert len(chunks) > 1
+
+
+@pytest.mark.asyncio
+async def test_blob_iter_lines_ranges():
+    text = "".join(f"line {i}\r\n" for i in range(20))
+    connector = _streaming_connector(text.encode("utf-8"), 7)
+
+    page = [line async for line in connector.iter_blob_lines("c", "b", start_line=5, end_line=8)]
+    tail = [line async for line in connector.iter_blob_lines("c", "b", start_line=-2)]
+    tail_bytes = [chunk async for chunk in connector.iter_blob("c", "b", offset=-9)]
+
+    assert page == ["line 5\r\n", "line 6\r\n", "line 7\r\n"]
+    assert tail == ["line 18\r\n", "line 19\r\n"]
+    assert b"".join(tail_bytes) == b"line 19\r\n"
+
+
+class FakeBlobService:
+    def __init__(self):
+        self.blobs = {}
+        self.failures = {}
+        self.pending_copies = {}
+        self.copies = []
+        self.uploads = []
+        self.properties = {}
+
+    def get_blob_client(self, container, blob):
+        return FakeBlob(self, container, blob)
+
+    def get_container_client(self, container):
+        service = self
+
+        class _Container:
+            async def list_blobs(self, name_starts_with="", include=None):
+                for (c, name), data in sorted(service.blobs.items()):
+                    if c == container and name.startswith(name_starts_with):
+                        yield SimpleNamespace(name=name, size=len(data), **service.properties.get((c, name), {}))
+
+        return _Container()
+
+
+class FakeBlob:
+    def __init__(self, service, container, blob):
+        self.service = service
+        self.key = (container, blob)
+        self.account_name = "dummy"
+        self.container_name = container
+        self.blob_name = blob
+        self.url = f"https://dummy.blob.core.windows.net/{container}/{blob}"
+
+    def _source(self, url):
+        container, _, blob = url.split("/", 3)[3].partition("/")
+        return self.service.blobs[(container, blob)]
+
+    async def upload_blob(self, data, overwrite=False, content_settings=None, metadata=None):
+        if self.service.failures.get(self.key, 0) > 0:
+            self.service.failures[self.key] -= 1
+            raise ConnectionError("injected failure")
+        self.service.uploads.append(self.key)
+        self.service.blobs[self.key] = bytes(data)
+        self.service.properties[self.key] = {"content_settings": content_settings, "metadata": metadata}
+
+    async def upload_blob_from_url(self, url, overwrite=False, source_authorization=None):
+        self.service.copies.append(("sync", self.key))
+        self.service.blobs[self.key] = self._source(url)
+
+    async def start_copy_from_url(self, url):
+        self.service.copies.append(("async", self.key))
+        self.service.pending_copies[self.key] = [self._source(url), 0]
+        return {"copy_id": "1", "copy_status": "pending"}
+
+    async def get_blob_properties(self):
+        if self.key in self.service.pending_copies:
+            data, copied = self.service.pending_copies[self.key]
+            copied = min(len(data), copied + 40)
+            self.service.pending_copies[self.key][1] = copied
+            if copied == len(data):
+                del self.service.pending_copies[self.key]
+                self.service.blobs[self.key] = data
+            return SimpleNamespace(size=len(data), copy=SimpleNamespace(
+                status="success" if copied == len(data) else "pending", progress=f"{copied}/{len(data)}"))
+        if self.key not in self.service.blobs:
+            raise ResourceNotFoundError("not found")
+        return SimpleNamespace(size=len(self.service.blobs[self.key]), **self.service.properties.get(self.key, {}))
+
+    async def download_blob(self, offset=None, length=None, **kwargs):
+        if self.key not in self.service.blobs:
+            raise ResourceNotFoundError("not found")
+        stream = MagicMock()
+        stream.readall = AsyncMock(return_value=self.service.blobs[self.key])
+        return stream
+
+
+@pytest.mark.asyncio
+async def test_blob_copy_directory_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr("azure_streamflow.transfer.RETRY_BACKOFF", 0)
+    source = tmp_path / "src"
+    for i in range(30):
+        path = source / f"d{i % 3}" / f"f{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"content {i}")
+
+    service = FakeBlobService()
+    service.failures[("mycontainer", "stage/d1/f4.txt")] = 2
+    connector = AzureBlobConnector({"container": "mycontainer", "max_file_concurrency": 4})
+    connector.blob_service_client = service
+
+    await connector.copy_local_to_remote(str(source), "/stage", None)
+    await connector.copy_remote_to_local("/stage", str(tmp_path / "dst"), None)
+
+    assert len(service.blobs) == 30
+    assert service.failures[("mycontainer", "stage/d1/f4.txt")] == 0
+    for i in range(30):
+        assert (tmp_path / "dst" / f"d{i % 3}" / f"f{i}.txt").read_text() == f"content {i}"
+
+
+@pytest.mark.asyncio
+async def test_blob_copy_directory_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr("azure_streamflow.transfer.RETRY_BACKOFF", 0)
+    for i in range(5):
+        (tmp_path / f"f{i}.txt").write_text("x")
+
+    service = FakeBlobService()
+    service.failures[("mycontainer", "out/f2.txt")] = 10
+    connector = AzureBlobConnector({"container": "mycontainer", "max_retries": 1})
+    connector.blob_service_client = service
+
+    with pytest.raises(WorkflowExecutionException, match="Failed to transfer 1 files"):
+        await connector.copy_local_to_remote(str(tmp_path), "out", None)
+    assert len(service.blobs) == 4
+
+
+@pytest.mark.asyncio
+async def test_blob_copy_remote_to_remote_server_side(monkeypatch):
+    monkeypatch.setattr("azure_streamflow.blob_connector.COPY_POLL_MIN", 0)
+    monkeypatch.setattr("azure_streamflow.blob_connector.COPY_POLL_MAX", 0)
+    service = FakeBlobService()
+    service.blobs[("mycontainer", "in/a.txt")] = b"a" * 10
+    service.blobs[("mycontainer", "in/sub/b.txt")] = b"b" * 10
+    service.blobs[("mycontainer", "in/large.bin")] = b"c" * 100
+    connector = AzureBlobConnector({
+        "blob_account_url": "https://dummy.blob.core.windows.net",
+        "container": "mycontainer",
+        "copy_from_url_max_size": 50
+    })
+    connector.blob_service_client = service
+    connector.credential = MagicMock()
+    connector.credential.get_token = AsyncMock(return_value=SimpleNamespace(token="token"))
+
+    await connector.copy_remote_to_remote("/in", "https://dummy.blob.core.windows.net/other/out", None)
+
+    assert service.blobs[("other", "out/a.txt")] == b"a" * 10
+    assert service.blobs[("other", "out/sub/b.txt")] == b"b" * 10
+    assert service.blobs[("other", "out/large.bin")] == b"c" * 100
+    assert sorted(service.copies) == [
+        ("async", ("other", "out/large.bin")),
+        ("sync", ("other", "out/a.txt")),
+        ("sync", ("other", "out/sub/b.txt"))
+    ]
+
+
+@pytest.mark.asyncio
+async def test_blob_sync_skips_unchanged_files(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    for i in range(10):
+        (source / f"f{i}.txt").write_text(f"content {i}")
+    service = FakeBlobService()
+    config = {"container": "mycontainer", "sync": True, "sync_manifest": str(tmp_path / "manifest.json")}
+    connector = AzureBlobConnector(config)
+    connector.blob_service_client = service
+
+    await connector.copy_local_to_remote(str(source), "stage", None)
+    await connector.copy_local_to_remote(str(source), "stage", None)
+    assert len(service.uploads) == 10
+
+    (source / "f3.txt").write_text("changed")
+    await connector.copy_local_to_remote(str(source), "stage", None)
+    assert service.uploads[10:] == [("mycontainer", "stage/f3.txt")]
+
+    await connector.copy_remote_to_local("stage", str(tmp_path / "dst"), None)
+    (tmp_path / "dst" / "f5.txt").write_text("content X")
+    with patch("azure_streamflow.sync.md5_file", wraps=md5_file) as mock_md5:
+        await connector.copy_remote_to_local("stage", str(tmp_path / "dst"), None)
+    assert [call.args[0] for call in mock_md5.call_args_list] == [str(tmp_path / "dst" / "f5.txt")]
+    assert (tmp_path / "dst" / "f5.txt").read_text() == "content 5"
+    assert (tmp_path / "dst" / "f3.txt").read_text() == "changed"
+    connector.manifest.close()
+    assert len(json.loads((tmp_path / "manifest.json").read_text())) == 20
+
+
+def _http_error(status):
+    error = HttpResponseError(message=f"HTTP {status}")
+    error.status_code = status
+    return error
+
+
+def _wrapped(error):
+    try:
+        raise WorkflowExecutionException(f"Upload failed: {error}") from error
+    except WorkflowExecutionException as e:
+        return e
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error,attempts", [
+    (_http_error(503), 3),
+    (_http_error(429), 3),
+    (ConnectionResetError("reset"), 3),
+    (_wrapped(asyncio.TimeoutError()), 3),
+    (ResourceNotFoundError("missing"), 1),
+    (ClientAuthenticationError("denied"), 1),
+    (_http_error(403), 1),
+    (FileNotFoundError("local.txt"), 1),
+    (_wrapped(PermissionError("local.txt")), 1),
+    (WorkflowExecutionException("invalid"), 1)
+])
+async def test_with_retries_only_retries_transient_errors(monkeypatch, error, attempts):
+    monkeypatch.setattr("azure_streamflow.transfer.RETRY_BACKOFF", 0)
+    calls = []
+
+    async def transfer():
+        calls.append(1)
+        raise error
+
+    with pytest.raises(type(error)):
+        await with_retries(transfer, max_retries=2)
+    assert len(calls) == attempts
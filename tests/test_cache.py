@@ -0,0 +1,104 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from azure.core.exceptions import HttpResponseError
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.cache import BlobCache
+
+
+class FakeCachedBlobClient:
+    def __init__(self, name, data, etag="0x1"):
+        self.account_name = "dummy"
+        self.container_name = "mycontainer"
+        self.blob_name = name
+        self.data = data
+        self.etag = etag
+        self.downloads = 0
+
+    async def download_blob(self, etag=None, match_condition=None, **kwargs):
+        if etag == self.etag:
+            raise HttpResponseError(response=SimpleNamespace(status_code=304, reason="Not Modified", headers={}))
+        self.downloads += 1
+        payload = self.data
+
+        async def chunks():
+            yield payload
+
+        stream = MagicMock()
+        stream.chunks = chunks
+        stream.properties = SimpleNamespace(etag=self.etag)
+        return stream
+
+
+@pytest.mark.asyncio
+async def test_cache_revalidates_with_etag(tmp_path):
+    blob_client = FakeCachedBlobClient("ref.txt", b"reference\ndata\n")
+    connector = AzureBlobConnector({"block_size": 4})
+    connector.blob_service_client = MagicMock()
+    connector.blob_service_client.get_blob_client.return_value = blob_client
+    connector.cache = BlobCache.get(str(tmp_path / "cache"))
+
+    first = "".join([chunk async for chunk in connector.iter_blob_text("mycontainer", "ref.txt", "utf-8")])
+    second = "".join([chunk async for chunk in connector.iter_blob_text("mycontainer", "ref.txt", "utf-8", offset=-5)])
+    blob_client.data, blob_client.etag = b"updated", "0x2"
+    third = "".join([chunk async for chunk in connector.iter_blob_text("mycontainer", "ref.txt", "utf-8")])
+
+    assert (first, second, third) == ("reference\ndata\n", "data\n", "updated")
+    assert blob_client.downloads == 2
+    assert connector.cache.stats["hits"] == 1
+    assert connector.cache.stats["misses"] == 2
+    assert connector.cache.stats["bytes_fetched"] == 22
+    assert BlobCache.get(str(tmp_path / "cache")) is connector.cache
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), max_size=25)
+    clients = {name: FakeCachedBlobClient(name, bytes(10)) for name in ("a", "b", "c")}
+
+    await cache.fetch(clients["a"])
+    await cache.fetch(clients["b"])
+    await cache.fetch(clients["a"])
+    await cache.fetch(clients["c"])
+
+    assert list(cache.entries) == ["dummy/mycontainer/a", "dummy/mycontainer/c"]
+    assert cache.stats["evictions"] == 1
+    assert cache.size == 20
+    reloaded = BlobCache(str(tmp_path / "cache"), max_size=25)
+    assert list(reloaded.entries) == ["dummy/mycontainer/a", "dummy/mycontainer/c"]
+
+
+@pytest.mark.asyncio
+async def test_cache_keeps_entries_being_read(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), max_size=15)
+    clients = {name: FakeCachedBlobClient(name, bytes(10)) for name in ("a", "b")}
+
+    async with cache.open(clients["a"]) as path:
+        # A concurrent fetch goes over the size limit, the pinned entry is not evicted
+        await cache.fetch(clients["b"])
+        assert "dummy/mycontainer/a" in cache.entries
+        with open(path, "rb") as f:
+            assert f.read() == bytes(10)
+    assert list(cache.entries) == ["dummy/mycontainer/b"]
+    assert cache.size == 10
+
+
+@pytest.mark.asyncio
+async def test_cache_removes_partial_downloads(tmp_path):
+    cache = BlobCache(str(tmp_path / "cache"), max_size=100)
+    blob_client = FakeCachedBlobClient("a", bytes(10))
+
+    async def download_blob(**kwargs):
+        async def chunks():
+            yield b"partial"
+            raise ConnectionResetError("reset")
+
+        stream = MagicMock()
+        stream.chunks = chunks
+        return stream
+
+    blob_client.download_blob = download_blob
+    with pytest.raises(ConnectionResetError):
+        await cache.fetch(blob_client)
+    assert [name for name in (tmp_path / "cache").iterdir() if name.suffix == ".tmp"] == []
+    assert cache.entries == {}
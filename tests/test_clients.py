@@ -0,0 +1,38 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.clients import ClientRegistry
+
+
+@pytest.mark.asyncio
+@patch("azure_streamflow.blob_connector.DefaultAzureCredential")
+@patch("azure_streamflow.blob_connector.BlobServiceClient")
+async def test_blob_connectors_share_clients(mock_blob_service_client_class, mock_credential_class):
+    mock_blob_service_client_class.side_effect = lambda **kwargs: MagicMock(close=AsyncMock())
+    mock_credential_class.side_effect = lambda: MagicMock(close=AsyncMock())
+    config = {"blob_account_url": "https://dummy.blob.core.windows.net", "container": "mycontainer"}
+    first, second = AzureBlobConnector(config), AzureBlobConnector(dict(config))
+    other = AzureBlobConnector({"blob_account_url": "https://other.blob.core.windows.net/"})
+
+    await first.setup()
+    await second.setup()
+    await other.setup()
+    shared_client, shared_credential = first.blob_service_client, first.credential
+    registry = ClientRegistry.get()
+
+    assert second.blob_service_client is shared_client
+    assert other.blob_service_client is not shared_client
+    assert second.credential is shared_credential is other.credential
+    assert mock_credential_class.call_count == 1
+    transports = [call.kwargs["transport"] for call in mock_blob_service_client_class.call_args_list]
+    assert transports[0].session is transports[1].session
+
+    await first.close()
+    shared_client.close.assert_not_awaited()
+    await second.close()
+    shared_client.close.assert_awaited_once()
+    shared_credential.credential.close.assert_not_awaited()
+    await other.close()
+    shared_credential.credential.close.assert_awaited_once()
+    assert registry.entries == {}
+    assert transports[0].session.closed
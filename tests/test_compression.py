@@ -0,0 +1,118 @@
+import base64
+import gzip
+import sys
+
+import pytest
+from streamflow.core.exception import WorkflowDefinitionException
+
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.compression import ORIGINAL_SIZE_METADATA, compress_blocks, decompress_chunks, slice_chunks
+from benchmarks.fake_azure import FakeBlobStorage, start_blob_server
+
+TEXT = b"".join(b"chr1\t%d\t.\tA\tG\t50\tPASS\tDP=%d\n" % (i, i % 97) for i in range(20000))
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def _collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.mark.asyncio
+async def test_codec_roundtrip():
+    source = _aiter([TEXT[i:i + 1000] for i in range(0, len(TEXT), 1000)])
+    blocks = [block async for block in compress_blocks(source, "gzip", block_size=4096)]
+    assert all(len(block) == 4096 for block in blocks[:-1])
+    assert gzip.decompress(b"".join(blocks)) == TEXT
+    assert await _collect(slice_chunks(decompress_chunks(_aiter(blocks), "gzip"), 100, 50)) == TEXT[100:150]
+
+
+@pytest.mark.asyncio
+async def test_zstd_roundtrip():
+    pytest.importorskip("zstandard")
+    blocks = [block async for block in compress_blocks(_aiter([TEXT]), "zstd", block_size=4096)]
+    assert await _collect(decompress_chunks(_aiter(blocks), "zstd")) == TEXT
+
+
+@pytest.mark.asyncio
+async def test_zstd_requires_package(monkeypatch):
+    # A None entry makes the import fail as if the package was not installed
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    connector = AzureBlobConnector({"blob_account_url": "https://dummy.blob.core.windows.net", "compression": "zstd"})
+    with pytest.raises(WorkflowDefinitionException, match="zstandard"):
+        await connector.setup()
+    assert connector.blob_service_client is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codec,parallel_download", [("gzip", False), ("gzip", True), ("zstd", True)])
+async def test_compressed_transfers(tmp_path, codec, parallel_download):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    storage = FakeBlobStorage()
+    runner, account_url = await start_blob_server(storage)
+    connector = AzureBlobConnector({
+        "blob_account_url": account_url,
+        "account_name": "devstoreaccount1",
+        "account_key": base64.b64encode(b"key").decode(),
+        "container": "data",
+        "compression": codec,
+        "block_size": 16 * 1024,
+        "parallel_download": parallel_download,
+        "sync": True,
+        "sync_manifest": str(tmp_path / "manifest.json")
+    })
+    await connector.setup()
+    try:
+        source = tmp_path / "calls.vcf"
+        source.write_bytes(TEXT)
+        await connector.copy_local_to_remote(str(source), "calls.vcf", None)
+        blob = storage.blobs[("data", "calls.vcf")]
+        assert blob["content_encoding"] == codec
+        assert blob["metadata"][ORIGINAL_SIZE_METADATA] == str(len(TEXT))
+        assert len(blob["data"]) < len(TEXT) / 4
+
+        # Unchanged files are not uploaded again
+        requests = storage.requests
+        await connector.copy_local_to_remote(str(source), "calls.vcf", None)
+        assert storage.requests == requests + 1
+
+        await connector.copy_remote_to_local("calls.vcf", str(tmp_path / "copy.vcf"), None)
+        assert (tmp_path / "copy.vcf").read_bytes() == TEXT
+        assert await _collect(connector.iter_blob("data", "calls.vcf", offset=1000, length=64)) == TEXT[1000:1064]
+        assert await _collect(connector.iter_blob("data", "calls.vcf", offset=-10)) == TEXT[-10:]
+    finally:
+        await connector.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("options", [{}, {"parallel_download": True}, {"cache": {}}])
+async def test_foreign_gzip_blobs_are_decoded(tmp_path, options):
+    # Written by another tool: a gzip Content-Encoding without the metadata of this plugin
+    storage = FakeBlobStorage()
+    storage.blobs[("data", "calls.vcf.gz")] = {
+        "data": gzip.compress(TEXT), "etag": '"0x1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+        "content_md5": None, "content_encoding": "gzip", "metadata": {}}
+    runner, account_url = await start_blob_server(storage)
+    if "cache" in options:
+        options = {"cache": {"directory": str(tmp_path / "cache")}}
+    connector = AzureBlobConnector({
+        "blob_account_url": account_url,
+        "account_name": "devstoreaccount1",
+        "account_key": base64.b64encode(b"key").decode(),
+        "container": "data",
+        **options
+    })
+    await connector.setup()
+    try:
+        await connector.copy_remote_to_local("calls.vcf.gz", str(tmp_path / "calls.vcf"), None)
+        assert (tmp_path / "calls.vcf").read_bytes() == TEXT
+        assert await _collect(connector.iter_blob("data", "calls.vcf.gz", offset=1000, length=64)) == TEXT[1000:1064]
+        assert await _collect(connector.iter_blob("data", "calls.vcf.gz", offset=-10)) == TEXT[-10:]
+    finally:
+        await connector.close()
+        await runner.cleanup()
@@ -0,0 +1,53 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from azure.core.credentials import AccessToken, AzureNamedKeyCredential, AzureSasCredential
+from azure_streamflow.credentials import RefreshingCredential, select_credential
+
+
+def test_select_credential_from_config():
+    default_factory = MagicMock()
+    account_url = "https://myaccount.blob.core.windows.net"
+
+    key_identity, key_factory = select_credential(
+        {"blob_account_url": account_url, "account_key": "a2V5"}, default_factory)
+    sas_identity, sas_factory = select_credential({"sas_token": "?sv=1&sig=x"}, default_factory)
+    sp_identity, _ = select_credential({"client_id": "c", "client_secret": "s", "tenant_id": "t"}, default_factory)
+    mi_identity, _ = select_credential({"managed_identity": "user-assigned-id"}, default_factory)
+    default_identity, _ = select_credential({"client_id": "c"}, default_factory)
+
+    assert key_identity == ("key", "myaccount")
+    assert isinstance(key_factory(), AzureNamedKeyCredential)
+    assert sas_identity[0] == "sas"
+    assert isinstance(sas_factory(), AzureSasCredential)
+    assert sp_identity == ("service_principal", "t", "c")
+    assert mi_identity == ("managed_identity", "user-assigned-id")
+    assert default_identity == ("default",)
+    default_factory.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_refreshing_credential_renews_in_background(monkeypatch):
+    monkeypatch.setattr("azure_streamflow.credentials.MIN_VALIDITY", 0)
+    inner = MagicMock()
+    inner.close = AsyncMock()
+    issued = []
+
+    async def get_token(*scopes, **kwargs):
+        issued.append(time.time())
+        return AccessToken(f"token-{len(issued)}", int(time.time()) + 2)
+
+    inner.get_token = get_token
+    credential = RefreshingCredential(inner, margin=1.5)
+
+    first = await credential.get_token("https://storage.azure.com/.default")
+    second = await credential.get_token("https://storage.azure.com/.default")
+    await asyncio.sleep(1.2)
+    third = await credential.get_token("https://storage.azure.com/.default")
+    await credential.close()
+
+    assert first.token == second.token == "token-1"
+    assert third.token == "token-2"
+    assert len(issued) == 2
+    inner.close.assert_awaited_once()
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from azure_streamflow.governor import ConcurrencyGovernor, GovernedTransport, retry_after
+
+
+class LimitedTransport:
+    # Throttles the requests beyond a number of concurrent ones
+    def __init__(self, limit: int, headers: dict | None = None):
+        self.limit = limit
+        self.headers = headers or {}
+        self.in_flight = 0
+        self.peak = 0
+        self.throttled = 0
+
+    async def send(self, request, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if self.in_flight > self.limit:
+                self.throttled += 1
+                return SimpleNamespace(status_code=503, headers=self.headers)
+            return SimpleNamespace(status_code=200, headers={})
+        finally:
+            self.in_flight -= 1
+
+
+def test_retry_after():
+    assert retry_after({"x-ms-retry-after-ms": "1500"}) == 1.5
+    assert retry_after({"Retry-After": "3"}) == 3.0
+    assert 50 < retry_after({"Retry-After": formatdate(time.time() + 60, usegmt=True)}) <= 60
+    assert retry_after({}) is None
+
+
+@pytest.mark.asyncio
+@patch("azure_streamflow.governor.BACKOFF_BASE", 0.001)
+async def test_window_converges_to_limit():
+    inner = LimitedTransport(limit=8)
+    governor = ConcurrencyGovernor("blob:test", initial=32)
+    transport = GovernedTransport(inner, governor)
+
+    async def worker():
+        for _ in range(25):
+            await transport.send(None)
+
+    await asyncio.gather(*(worker() for _ in range(64)))
+
+    assert governor.in_flight == 0
+    assert governor.window <= 16
+    # Concurrent throttled responses cut the window once
+    assert governor.throttles < inner.throttled
+    assert inner.throttled < 25 * 64 * 0.1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_senders():
+    governor = ConcurrencyGovernor("batch:test")
+    transport = GovernedTransport(LimitedTransport(limit=0, headers={"Retry-After": "0.2"}), governor)
+    await transport.send(None)
+    assert governor.window == 8
+    transport.transport.limit = 10
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await transport.send(None)
+
+    assert loop.time() - start >= 0.15
@@ -0,0 +1,144 @@
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.index import UNKNOWN, PrefixIndex
+from benchmarks.fake_azure import FakeBlobStorage, start_blob_server
+
+
+def _connector(account_url, **kwargs):
+    return AzureBlobConnector({
+        "blob_account_url": account_url,
+        "account_name": "devstoreaccount1",
+        "account_key": base64.b64encode(b"key").decode(),
+        "container": "data",
+        **kwargs
+    })
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_prefix_index_updates():
+    index = PrefixIndex(ttl=60)
+    container_client = SimpleNamespace(list_blobs=lambda name_starts_with, include: _aiter(
+        [SimpleNamespace(name="a/b/c.txt"), SimpleNamespace(name="a/b/d/e.txt")]))
+    assert index.lookup("data", "a/b/c.txt") is UNKNOWN
+    await index.load(container_client, "data", "a", deep=True)
+    assert index.lookup("data", "a/b/c.txt").name == "a/b/c.txt"
+    assert index.lookup("data", "a/b/x.txt") is None
+    assert index.is_directory("data", "a/b/d") is True and index.is_directory("data", "a/x") is False
+    assert index.lookup("data", "other.txt") is UNKNOWN and index.is_directory("data", "other") is UNKNOWN
+
+    index.invalidate("data", "a/x/y.txt")
+    assert index.lookup("data", "a/x/y.txt") is UNKNOWN and index.is_directory("data", "a/x") is True
+    assert index.entries("data", "a/x") == {"a/x/y.txt": UNKNOWN}
+
+    # Emptied directories stop being reported
+    index.remove("data", "a/b/d/e.txt")
+    assert index.is_directory("data", "a/b/d") is False and index.is_directory("data", "a/b") is True
+    index.remove("data", "a/b/c.txt")
+    assert index.lookup("data", "a/b/c.txt") is None and index.is_directory("data", "a/b") is False
+
+
+@pytest.mark.asyncio
+async def test_listing_fresh_after_slow_load(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("azure_streamflow.index.time.monotonic", lambda: clock[0])
+
+    async def list_blobs(name_starts_with, include):
+        # The listing takes longer than the TTL
+        clock[0] += 10
+        yield SimpleNamespace(name="tree/a.txt")
+
+    index = PrefixIndex(ttl=1)
+    container_client = SimpleNamespace(list_blobs=list_blobs)
+    listing = await index.load(container_client, "data", "tree", deep=True)
+    assert listing.entries("tree") and index.entries("data", "tree") == listing.entries("tree")
+    clock[0] += 2
+    assert index.entries("data", "tree") is None and index.is_directory("data", "tree") is UNKNOWN
+
+
+@pytest.mark.asyncio
+async def test_lookups_use_listings(tmp_path):
+    storage = FakeBlobStorage()
+    runner, account_url = await start_blob_server(storage)
+    source = tmp_path / "src"
+    for i in range(40):
+        path = source / (f"sub/f{i}.txt" if i < 4 else f"f{i}.txt")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"content {i}")
+    connector = _connector(account_url, prefix_index={"ttl": 60})
+    await connector.setup()
+    try:
+        await connector.copy_local_to_remote(str(source), "tree", None)
+
+        # One level of tree answers for its blobs and subdirectories, the root level for tree itself
+        requests = storage.requests
+        for i in range(4, 40):
+            assert (await connector.stat(f"tree/f{i}.txt"))["size"] == len(f"content {i}")
+        assert (await connector.stat("tree/sub"))["directory"]
+        assert not await connector.exists("tree/missing.txt")
+        assert await connector.exists("tree")
+        assert storage.requests == requests + 2
+        assert await connector.stat("missing") is None
+
+        # Own writes are visible at once, their properties are fetched again on the next lookup
+        (tmp_path / "new.txt").write_text("new")
+        await connector.copy_local_to_remote(str(tmp_path / "new.txt"), "tree/new.txt", None)
+        requests = storage.requests
+        assert (await connector.stat("tree/new.txt"))["size"] == 3
+        assert await connector.exists("tree/new.txt")
+        assert storage.requests == requests + 1
+
+        connector.config["operations"] = [{"action": "delete", "pattern": "tree/f1*"}]
+        await connector.run("")
+        requests = storage.requests
+        assert not await connector.exists("tree/f10.txt")
+        assert await connector.exists("tree/f20.txt")
+        assert storage.requests == requests
+
+        # An emptied subdirectory is not reported after its blobs are deleted
+        connector.config["operations"] = [{"action": "delete", "pattern": "tree/sub/*"}]
+        await connector.run("")
+        assert not await connector.exists("tree/sub")
+
+        # Expired listings are fetched again
+        for listing in connector.index.listings.values():
+            listing.loaded_at -= 120
+        requests = storage.requests
+        assert await connector.exists("tree/f20.txt")
+        assert storage.requests > requests
+    finally:
+        await connector.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_configured_prefixes_list_recursively(tmp_path):
+    storage = FakeBlobStorage()
+    runner, account_url = await start_blob_server(storage)
+    for i in range(10):
+        path = tmp_path / "src" / f"d{i}" / "f.txt"
+        path.parent.mkdir(parents=True)
+        path.write_text("x")
+    connector = _connector(account_url, sync=True, sync_manifest=str(tmp_path / "manifest.json"),
+                           prefix_index={"prefixes": ["runs"]})
+    await connector.setup()
+    try:
+        await connector.copy_local_to_remote(str(tmp_path / "src"), "runs", None)
+        connector.index.listings.clear()
+        requests = storage.requests
+        assert all([await connector.exists(f"runs/d{i}/f.txt") for i in range(10)])
+        assert storage.requests == requests + 1
+        # Unchanged trees are compared with the same recursive listing
+        await connector.copy_local_to_remote(str(tmp_path / "src"), "runs", None)
+        assert storage.requests == requests + 1
+    finally:
+        await connector.close()
+        await runner.cleanup()
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from azure_streamflow import metrics
+from azure_streamflow.metrics import (
+    Instrumentation,
+    MetricsRecorder,
+    RequestMetricsPolicy,
+    configure_instrumentation,
+    instrumentation,
+    release_instrumentation,
+    set_instrumentation
+)
+
+
+@pytest.fixture
+def recorder():
+    recorder = MetricsRecorder()
+    set_instrumentation(recorder)
+    yield recorder
+    set_instrumentation(None)
+
+
+def _request(method, url):
+    return SimpleNamespace(http_request=SimpleNamespace(method=method, url=url), context={})
+
+
+def test_prometheus_text(recorder):
+    recorder.observe("azure_request_seconds", 0.02, service="batch", operation="POST /jobs")
+    recorder.observe("azure_request_seconds", 3.0, service="batch", operation="POST /jobs")
+    recorder.increment("azure_throttled_total", service="blob")
+    recorder.gauge("azure_submission_queue_depth", 12)
+    text = recorder.prometheus_text()
+
+    assert "# TYPE azure_request_seconds histogram" in text
+    assert 'azure_request_seconds_bucket{operation="POST /jobs",service="batch",le="0.025"} 1' in text
+    assert 'azure_request_seconds_bucket{operation="POST /jobs",service="batch",le="+Inf"} 2' in text
+    assert 'azure_request_seconds_count{operation="POST /jobs",service="batch"} 2' in text
+    assert 'azure_throttled_total{service="blob"} 1' in text
+    assert "azure_submission_queue_depth 12" in text
+
+
+def test_spans_nest(recorder):
+    with instrumentation().span("azure_batch.run") as parent:
+        with instrumentation().span("batch POST /jobs/{id}/addtaskcollection") as child:
+            pass
+    with pytest.raises(ValueError):
+        with instrumentation().span("azure_blob.run"):
+            raise ValueError()
+
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert recorder.spans[-1].attributes["error"] == "ValueError"
+
+
+def test_request_policy(recorder):
+    policy = RequestMetricsPolicy("batch")
+    request = _request("POST", "https://account.batch.azure.com/jobs/job-1/addtaskcollection?api-version=2024")
+    for status in (429, 200):
+        policy.on_request(request)
+        policy.on_response(request, SimpleNamespace(http_response=SimpleNamespace(status_code=status)))
+
+    operation = "POST /jobs/{id}/addtaskcollection"
+    assert recorder.histograms[recorder._key(
+        "azure_request_seconds", {"service": "batch", "operation": operation})][3] == 2
+    assert recorder.counters[recorder._key(
+        "azure_throttled_total", {"service": "batch", "operation": operation})] == 1
+    assert recorder.counters[recorder._key(
+        "azure_retries_total", {"service": "batch", "component": "sdk"})] == 1
+    assert all("?" not in span.attributes["url"] for span in recorder.spans)
+    assert metrics._operation("blob", "PUT", "https://a.blob.core.windows.net/c/dir/f.txt?comp=block") == \
+           "PUT blob block"
+
+
+@pytest.mark.asyncio
+async def test_configure_and_release(tmp_path):
+    assert type(instrumentation()) is Instrumentation
+    path = tmp_path / "azure.prom"
+    first = await configure_instrumentation({"path": str(path)})
+    second = await configure_instrumentation({"exporter": "opentelemetry"})
+    assert first is second
+    first.increment("azure_throttled_total", service="blob")
+
+    await release_instrumentation()
+    assert instrumentation() is first
+    await release_instrumentation()
+    assert type(instrumentation()) is Instrumentation
+    assert 'azure_throttled_total{service="blob"} 1' in path.read_text()
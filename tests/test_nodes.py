@@ -0,0 +1,210 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.batch_connector import AzureBatchConnector
+from azure_streamflow.executor import AzureExecutor
+from azure_streamflow.nodes import vm_size_hardware
+
+
+def _node(node_id, state, boot=60):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return SimpleNamespace(
+        id=node_id, state=state, allocation_time=base, state_transition_time=base + timedelta(seconds=boot),
+        start_task_info=SimpleNamespace(start_time=base + timedelta(seconds=boot - 10),
+                                        end_time=base + timedelta(seconds=boot)))
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.nodes.NODE_POLL_MIN', 0.01)
+@patch('azure_streamflow.nodes.NODE_POLL_MAX', 0.01)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_node_monitor_ready_and_replace(mock_credentials, mock_batch_client_class, mock_config):
+    polls = [
+        [_node("n1", "creating"), _node("n2", "starting")],
+        [_node("n1", "idle", boot=90), _node("n2", "starting")],
+        [_node("n1", "running", boot=90), _node("n2", "starttaskfailed")],
+    ]
+
+    def list_nodes(pool_id, compute_node_list_options=None):
+        nodes = polls.pop(0) if len(polls) > 1 else polls[0]
+
+        async def iterate():
+            for node in nodes:
+                yield node
+        return iterate()
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.compute_node.list = MagicMock(side_effect=list_nodes)
+    mock_batch_client_instance.pool.get = AsyncMock(side_effect=[
+        SimpleNamespace(enable_auto_scale=False, target_dedicated_nodes=2, allocation_state="steady"),
+        SimpleNamespace(enable_auto_scale=False, target_dedicated_nodes=1, allocation_state="resizing"),
+        SimpleNamespace(enable_auto_scale=False, target_dedicated_nodes=1, allocation_state="steady"),
+    ])
+    mock_batch_client_instance.pool.remove_nodes = AsyncMock()
+    mock_batch_client_instance.pool.resize = AsyncMock()
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    monitor = executor.node_monitor("testpool")
+    await asyncio.wait_for(monitor.wait_ready(), 1)
+    assert monitor.ready_nodes == 1
+    assert monitor.stats["boot_latencies"] == {"n1": 90}
+    assert monitor.stats["start_task_latencies"] == {"n1": 10}
+
+    while not monitor.stats["replaced"]:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    mock_batch_client_instance.pool.remove_nodes.assert_awaited_once_with(
+        "testpool", {"node_list": ["n2"], "node_deallocation_option": "requeue"})
+    # Removing the node lowers the target, which is put back once the pool is steady
+    mock_batch_client_instance.pool.resize.assert_awaited_once()
+    assert mock_batch_client_instance.pool.resize.await_args.args[1]["target_dedicated_nodes"] == 2
+    await executor.close()
+    assert monitor.task is None
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.nodes.NODE_POLL_MIN', 0.01)
+@patch('azure_streamflow.nodes.NODE_POLL_MAX', 0.01)
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_node_monitor_gives_up(mock_credentials, mock_batch_client_class, mock_config):
+    nodes = [_node("n1", "starting"), _node("n2", "creating")]
+
+    def list_nodes(pool_id, compute_node_list_options=None):
+        async def iterate():
+            for node in list(nodes):
+                yield node
+        return iterate()
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.compute_node.list = MagicMock(side_effect=list_nodes)
+    mock_batch_client_instance.pool.get = AsyncMock(return_value=SimpleNamespace(
+        enable_auto_scale=True, target_dedicated_nodes=2, allocation_state="steady"))
+    mock_batch_client_instance.pool.remove_nodes = AsyncMock()
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    monitor = executor.node_monitor("testpool")
+    with pytest.raises(WorkflowExecutionException, match="within 0s"):
+        await monitor.wait_ready(timeout=0.05)
+
+    # Waiters fail as soon as no node can run, without waiting for the timeout
+    nodes[:] = [_node("n1", "starttaskfailed"), _node("n2", "unusable")]
+    with pytest.raises(WorkflowExecutionException, match="Every node of pool testpool is unusable"):
+        await asyncio.wait_for(monitor.wait_ready(), 1)
+
+    nodes[:] = [_node("n3", "idle")]
+    await monitor.poll()
+    await asyncio.wait_for(monitor.wait_ready(), 1)
+    await executor.close()
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_available_locations_follow_nodes(mock_credentials, mock_batch_client_class):
+    connector = AzureBatchConnector({
+        "batch_account_url": "https://test-batch-account.region.batch.azure.com",
+        "client_id": "fake-client-id",
+        "client_secret": "fake-client-secret",
+        "tenant_id": "fake-tenant-id",
+        "pool": {"id": "testpool", "vm_size": "STANDARD_D4_v3", "node_count": 2, "task_slots_per_node": 4,
+                 "os_image": {"publisher": "Canonical", "offer": "UbuntuServer", "sku": "18.04-LTS"}},
+        "job": {"id": "testjob", "pool_id": "testpool"},
+        "task": {"id": "testtask", "command_line": "echo"}
+    })
+    nodes = [_node("n1", "idle"), _node("n2", "starting")]
+
+    def list_nodes(pool_id, compute_node_list_options=None):
+        async def iterate():
+            for node in nodes:
+                yield SimpleNamespace(**vars(node), ip_address=f"10.0.0.{node.id[1:]}")
+        return iterate()
+
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.compute_node.list = MagicMock(side_effect=list_nodes)
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+    await connector.executor.initialize()
+    monitor = connector.executor.node_monitor("testpool")
+    await monitor.poll()
+
+    locations = await connector.get_available_locations()
+    assert list(locations) == ["n1"]
+    assert locations["n1"].hostname == "10.0.0.1"
+    assert locations["n1"].slots == 4
+    assert locations["n1"].hardware.cores == 4 and locations["n1"].hardware.memory == 16384
+    first = locations["n1"]
+
+    nodes[:] = [_node("n1", "running"), _node("n2", "idle")]
+    await monitor.poll()
+    locations = await connector.get_available_locations()
+    assert sorted(locations) == ["n1", "n2"]
+    assert locations["n1"] is first
+    nodes[:] = [_node("n2", "idle")]
+    await monitor.poll()
+    assert list(await connector.get_available_locations()) == ["n2"]
+    await connector.close()
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.nodes._vm_sizes', {})
+@patch('azure.mgmt.batch.aio.BatchManagementClient')
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_hardware_from_supported_vm_sizes(mock_credentials, mock_batch_client_class, mock_management_class):
+    def list_skus(location):
+        async def iterate():
+            yield SimpleNamespace(name="Standard_B1s", capabilities=[
+                SimpleNamespace(name="vCPUs", value="1"), SimpleNamespace(name="MemoryGB", value="1")])
+            yield SimpleNamespace(name="Standard_M128ms", capabilities=[
+                SimpleNamespace(name="vCPUs", value="128"), SimpleNamespace(name="MemoryGB", value="3892")])
+        return iterate()
+
+    management_client = MagicMock()
+    management_client.location.list_supported_virtual_machine_skus = MagicMock(side_effect=list_skus)
+    mock_management_class.return_value.__aenter__ = AsyncMock(return_value=management_client)
+    mock_management_class.return_value.__aexit__ = AsyncMock(return_value=False)
+    mock_batch_client_class.return_value.close = AsyncMock()
+
+    def connector(vm_size, **pool):
+        return AzureBatchConnector({
+            "batch_account_url": "https://test-batch-account.westeurope.batch.azure.com",
+            "client_id": "fake-client-id",
+            "client_secret": "fake-client-secret",
+            "tenant_id": "fake-tenant-id",
+            "subscription_id": "fake-subscription",
+            "pool": {"id": "testpool", "vm_size": vm_size, **pool},
+            "job": {"id": "testjob", "pool_id": "testpool"},
+            "task": {"id": "testtask", "command_line": "echo"}
+        })
+
+    small = connector("standard_b1s")
+    hardware = await small._hardware()
+    assert (hardware.cores, hardware.memory) == (1, 1024)
+    large = connector("Standard_M128ms", node_hardware={"memory": 1024 * 1024})
+    hardware = await large._hardware()
+    assert (hardware.cores, hardware.memory) == (128, 1024 * 1024)
+    # Sizes are listed once per region and the heuristic only covers the ones missing from the listing
+    hardware = await connector("Standard_D4_v3")._hardware()
+    assert (hardware.cores, hardware.memory) == (4, 16384)
+    management_client.location.list_supported_virtual_machine_skus.assert_called_once_with("westeurope")
+    assert mock_management_class.call_args.args[1] == "fake-subscription"
+
+
+def test_vm_size_hardware():
+    assert vm_size_hardware("Standard_D2_v2") == (2, 7168)
+    assert vm_size_hardware("Standard_E4-2s_v3") == (2, 32768)
+    assert vm_size_hardware("Standard_F8s_v2") == (8, 16384)
+    assert vm_size_hardware("custom") is None
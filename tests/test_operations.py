@@ -0,0 +1,128 @@
+import base64
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import jsonschema
+import pytest
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.operations import literal_prefix
+from benchmarks.fake_azure import FakeBlobStorage, start_blob_server
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def test_schema_accepts_operations_only():
+    schema = json.loads(AzureBlobConnector.get_schema())
+    base = {"blob_account_url": "https://dummy.blob.core.windows.net", "container": "data"}
+    jsonschema.validate({**base, "operations": [{"action": "delete", "pattern": "tmp/*"}]}, schema)
+    jsonschema.validate({**base, "action": "read", "blob_name": "a.txt"}, schema)
+    with pytest.raises(jsonschema.ValidationError):
+        jsonschema.validate(base, schema)
+    with pytest.raises(jsonschema.ValidationError):
+        jsonschema.validate({"blob_account_url": base["blob_account_url"], "operations": []}, schema)
+
+
+def test_literal_prefix():
+    assert literal_prefix("runs/2024*/out.txt") == "runs/2024"
+    assert literal_prefix("logs/[ab].txt") == "logs/"
+    assert literal_prefix("plain.txt") == "plain.txt"
+
+
+@pytest.mark.asyncio
+async def test_operations_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr("azure_streamflow.transfer.RETRY_BACKOFF", 0)
+    storage = FakeBlobStorage()
+    runner, account_url = await start_blob_server(storage)
+    source = tmp_path / "src"
+    for i in range(12):
+        path = source / f"d{i % 2}" / f"f{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"line {i}\n")
+    connector = AzureBlobConnector({
+        "blob_account_url": account_url,
+        "account_name": "devstoreaccount1",
+        "account_key": base64.b64encode(b"key").decode(),
+        "container": "data",
+        "operations": [
+            {"action": "upload", "local_path": str(source), "blob_name": "stage"},
+            {"action": "upload", "local_path": str(source / "d0" / "*.txt"), "blob_name": "flat"}
+        ]
+    })
+    await connector.setup()
+    try:
+        summary = await connector.run("")
+        assert summary["completed"] == 18 and summary["failed"] == 0
+        assert summary["bytes"] == 2 * sum(len(p.read_bytes()) for p in source.rglob("*.txt")) - sum(
+            len(p.read_bytes()) for p in (source / "d1").glob("*.txt"))
+        assert ("data", "stage/d1/f3.txt") in storage.blobs and ("data", "flat/f4.txt") in storage.blobs
+
+        connector.config["operations"] = [
+            {"action": "download", "pattern": "stage/d1/*.txt", "local_path": str(tmp_path / "dst")},
+            {"action": "read", "blob_name": "stage/d0/f2.txt"},
+            {"action": "copy", "pattern": "flat/*", "destination": "copies"},
+            {"action": "read", "blob_name": "missing.txt"}
+        ]
+        summary = await connector.run("")
+        assert summary["failed"] == 1
+        assert (tmp_path / "dst" / "f5.txt").read_text() == "line 5\n"
+        assert [r["content"] for r in summary["results"] if r["action"] == "read" and "content" in r] == ["line 2\n"]
+        assert storage.blobs[("data", "copies/f4.txt")]["data"] == b"line 4\n"
+        assert summary["results"][-1]["status"] == "failed"
+
+        # Batch requests are rejected by the fake, so blobs are deleted one by one
+        connector.config["operations"] = [
+            {"action": "set_tier", "pattern": "copies/*", "tier": "Cool"},
+            {"action": "delete", "pattern": "stage/*"}
+        ]
+        summary = await connector.run("")
+        assert summary["failed"] == 0 and not connector.batch_supported
+        assert storage.blobs[("data", "copies/f0.txt")]["tier"] == "Cool"
+        assert not [name for container, name in storage.blobs if name.startswith("stage/")]
+    finally:
+        await connector.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_operations_use_batch_api(monkeypatch):
+    monkeypatch.setattr("azure_streamflow.blob_connector.BATCH_SIZE", 3)
+    batches = []
+
+    async def delete_blobs(*names, raise_on_any_failure=True):
+        batches.append(names)
+        return _aiter([SimpleNamespace(status_code=404 if name == "c/missing" else 202) for name in names])
+
+    container_client = MagicMock()
+    container_client.delete_blobs = delete_blobs
+    container_client.list_blobs = lambda name_starts_with: _aiter(
+        [SimpleNamespace(name=f"c/{i}", size=1) for i in range(4)])
+    service = MagicMock()
+    service.get_container_client.return_value = container_client
+    service.list_containers = lambda name_starts_with: _aiter(
+        [SimpleNamespace(name="runs-1"), SimpleNamespace(name="runs-2"), SimpleNamespace(name="other")])
+
+    connector = AzureBlobConnector({"blob_account_url": "https://dummy.blob.core.windows.net", "operations": [
+        {"action": "delete", "container": "runs-*", "pattern": "c/*"},
+        {"action": "delete", "container": "runs-1", "blob_name": "c/missing"}
+    ]})
+    connector.blob_service_client = service
+    summary = await connector.run("")
+
+    assert [len(names) for names in batches] == [3, 3, 2, 1]
+    assert summary["completed"] == 8 and summary["failed"] == 1
+    assert summary["results"][-1]["error"] == "HTTP 404"
+    assert {r["container"] for r in summary["results"]} == {"runs-1", "runs-2"}
+
+
+@pytest.mark.asyncio
+async def test_operations_are_validated():
+    connector = AzureBlobConnector({"blob_account_url": "https://dummy.blob.core.windows.net",
+                                    "operations": [{"action": "copy", "blob_name": "a"}]})
+    with pytest.raises(WorkflowExecutionException, match="requires destination"):
+        await connector.run("")
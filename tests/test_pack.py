@@ -0,0 +1,99 @@
+import base64
+import io
+import json
+import tarfile
+
+import pytest
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.pack import PACK_ARCHIVE, PACK_INDEX, extract_tar, should_pack, tar_blocks
+from benchmarks.fake_azure import FakeBlobStorage, start_blob_server
+
+
+def _make_tree(root, count=80):
+    for i in range(count):
+        path = root / f"d{i % 4}" / f"f{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"content {i}\n" * (i % 7))
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_should_pack(tmp_path):
+    _make_tree(tmp_path, count=10)
+    assert await should_pack(str(tmp_path), min_files=10)
+    assert not await should_pack(str(tmp_path), min_files=11)
+    assert not await should_pack(str(tmp_path), min_files=1, max_average_size=1)
+
+
+@pytest.mark.asyncio
+async def test_tar_roundtrip(tmp_path):
+    source = tmp_path / "src"
+    _make_tree(source)
+    index = {}
+    blocks = [block async for block in tar_blocks(str(source), 4096, index)]
+    assert all(len(block) == 4096 for block in blocks[:-1])
+    archive = b"".join(blocks)
+
+    assert len(index) == 80
+    offset, size = index["d1/f5.txt"]
+    assert archive[offset:offset + size] == (source / "d1" / "f5.txt").read_bytes()
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        assert len(tar.getmembers()) == 80
+
+    await extract_tar(_aiter(blocks), str(tmp_path / "dst"))
+    for path in source.rglob("*.txt"):
+        assert (tmp_path / "dst" / path.relative_to(source)).read_bytes() == path.read_bytes()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression", [None, "gzip"])
+async def test_packed_transfers(tmp_path, compression):
+    storage = FakeBlobStorage()
+    runner, account_url = await start_blob_server(storage)
+    config = {
+        "blob_account_url": account_url,
+        "account_name": "devstoreaccount1",
+        "account_key": base64.b64encode(b"key").decode(),
+        "container": "data",
+        "block_size": 4096,
+        "pack": {"min_files": 16}
+    }
+    if compression:
+        config["compression"] = compression
+    connector = AzureBlobConnector(config)
+    await connector.setup()
+    try:
+        source = tmp_path / "src"
+        _make_tree(source)
+        await connector.copy_local_to_remote(str(source), "stage", None)
+        names = sorted(name for container, name in storage.blobs)
+        if compression:
+            assert names == [f"stage/{PACK_ARCHIVE}"]
+        else:
+            assert names == [f"stage/{PACK_INDEX}", f"stage/{PACK_ARCHIVE}"]
+            assert len(json.loads(storage.blobs[("data", f"stage/{PACK_INDEX}")]["data"])) == 80
+
+        await connector.copy_remote_to_local("stage", str(tmp_path / "dst"), None)
+        for path in source.rglob("*.txt"):
+            assert (tmp_path / "dst" / path.relative_to(source)).read_bytes() == path.read_bytes()
+
+        if not compression:
+            # A single member is read with a range request on the archive
+            await connector.copy_remote_to_local("stage/d2/f6.txt", str(tmp_path / "f6.txt"), None)
+            assert (tmp_path / "f6.txt").read_bytes() == (source / "d2" / "f6.txt").read_bytes()
+            await connector.copy_remote_to_local("stage/d0/f0.txt", str(tmp_path / "f0.txt"), None)
+            assert (tmp_path / "f0.txt").read_bytes() == b""
+            with pytest.raises(WorkflowExecutionException, match="stage/d2/missing.txt"):
+                await connector.copy_remote_to_local("stage/d2/missing.txt", str(tmp_path / "missing.txt"), None)
+        with pytest.raises(WorkflowExecutionException, match="No blob"):
+            await connector.copy_remote_to_local("absent", str(tmp_path / "absent"), None)
+        assert not (tmp_path / "absent").exists()
+    finally:
+        await connector.close()
+        await runner.cleanup()
@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+from azure_streamflow.blob_connector import AzureBlobConnector
+from azure_streamflow.plugin import AzureBlobConnectorType, AzureStreamFlowPlugin, load_schema
+
+HEAVY_MODULES = ["azure.batch", "azure.storage.blob", "azure.identity", "aiofiles"]
+
+
+def test_import_defers_sdks():
+    # Run in a fresh interpreter, the test session has already imported everything
+    code = (
+        "import json, sys\n"
+        "import azure_streamflow\n"
+        "azure_streamflow.AzureStreamFlowPlugin().register()\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    modules = json.loads(process.stdout.strip().splitlines()[-1])
+
+    assert [m for m in HEAVY_MODULES if m in modules] == []
+
+
+def test_lazy_connector():
+    plugin = AzureStreamFlowPlugin()
+    plugin.register()
+    types = {item["name"]: item["class"] for item in plugin.classes_["connector"]}
+
+    batch_schema = json.loads(types["eu.across.azure.batch"].get_schema())
+    blob_schema = json.loads(types["eu.across.azure.blob"].get_schema())
+    assert "pool" in batch_schema["properties"]
+    assert "container" in blob_schema["properties"]
+    assert AzureBlobConnector.get_schema() is AzureBlobConnectorType.get_schema()
+    assert load_schema.cache_info().currsize >= 2
+
+    connector = AzureBlobConnectorType({"blob_account_url": "https://dummy.blob.core.windows.net"})
+    assert isinstance(connector, AzureBlobConnector)
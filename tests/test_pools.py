@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+from azure_streamflow.executor import AzureExecutor
+from azure_streamflow.pools import FINGERPRINT_METADATA, USERS_METADATA, pool_fingerprint
+
+
+def _error(status_code):
+    error = HttpResponseError(message=f"status {status_code}")
+    error.status_code = status_code
+    return error
+
+
+class FakePools:
+    # In-memory pool operations with ETag preconditions on metadata updates
+    def __init__(self):
+        self.pools = {}
+        self.resizes = []
+        self.autoscale = {}
+        self.conflicts = 0
+
+    async def add(self, pool):
+        if pool["id"] in self.pools:
+            raise _error(409)
+        self.pools[pool["id"]] = {
+            "target": pool["target_dedicated_nodes"],
+            "metadata": {m["name"]: m["value"] for m in pool.get("metadata", [])},
+            "etag": 0
+        }
+
+    def _view(self, pool_id):
+        pool = self.pools[pool_id]
+        return SimpleNamespace(
+            id=pool_id, e_tag=str(pool["etag"]), target_dedicated_nodes=pool["target"],
+            enable_auto_scale=pool_id in self.autoscale,
+            metadata=[SimpleNamespace(name=k, value=v) for k, v in pool["metadata"].items()])
+
+    def list(self, pool_list_options=None):
+        async def pools():
+            for pool_id in list(self.pools):
+                yield self._view(pool_id)
+        return pools()
+
+    async def get(self, pool_id):
+        if pool_id not in self.pools:
+            raise _error(404)
+        view = self._view(pool_id)
+        # Another workflow updates the pool between our read and our write
+        if self.conflicts:
+            self.conflicts -= 1
+            self.pools[pool_id]["etag"] += 1
+        return view
+
+    async def patch(self, pool_id, parameter, pool_patch_options=None):
+        pool = self.pools[pool_id]
+        if pool_patch_options["if_match"] != str(pool["etag"]):
+            raise _error(412)
+        pool["metadata"] = {m["name"]: m["value"] for m in parameter["metadata"]}
+        pool["etag"] += 1
+
+    async def resize(self, pool_id, parameter):
+        self.resizes.append((pool_id, parameter["target_dedicated_nodes"]))
+        self.pools[pool_id]["target"] = parameter["target_dedicated_nodes"]
+
+    async def enable_auto_scale(self, pool_id, parameter):
+        self.autoscale[pool_id] = parameter["auto_scale_formula"]
+
+    async def disable_auto_scale(self, pool_id):
+        self.autoscale.pop(pool_id, None)
+
+
+def test_pool_fingerprint():
+    fingerprint = pool_fingerprint("STANDARD_A1_v2", "Canonical", "UbuntuServer", "18.04-LTS")
+    assert fingerprint == pool_fingerprint("standard_a1_v2", "Canonical", "UbuntuServer", "18.04-LTS")
+    assert fingerprint != pool_fingerprint("STANDARD_A1_v2", "Canonical", "UbuntuServer", "20.04-LTS")
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.executor.BatchClient', autospec=True)
+@patch('azure_streamflow.executor.DefaultAzureCredential')
+async def test_warm_pool_shared_and_released(mock_credentials, mock_batch_client_class, mock_config):
+    fake = FakePools()
+    mock_batch_client_instance = MagicMock()
+    mock_batch_client_instance.pool = fake
+    mock_batch_client_instance.close = AsyncMock()
+    mock_batch_client_class.return_value = mock_batch_client_instance
+    image = ("Canonical", "UbuntuServer", "18.04-LTS")
+
+    executor = AzureExecutor(mock_config)
+    await executor.initialize()
+    first = await executor.warm_pools.acquire("testpool", "STANDARD_A1_v2", 2, *image)
+    fake.conflicts = 1
+    second, third = await asyncio.gather(
+        executor.warm_pools.acquire("otherpool", "STANDARD_A1_v2", 4, *image),
+        executor.warm_pools.acquire("testpool", "STANDARD_A1_v2", 1, *image))
+    # An incompatible pool owning the configured identifier is left alone
+    other = await executor.warm_pools.acquire("testpool", "STANDARD_D2_v3", 1, *image)
+
+    assert first == second == third == "testpool"
+    assert other.startswith("testpool-")
+    assert fake.pools["testpool"]["metadata"][USERS_METADATA] == "3"
+    assert fake.pools["testpool"]["metadata"][FINGERPRINT_METADATA] == pool_fingerprint(
+        "STANDARD_A1_v2", *image)
+    assert fake.resizes == [("testpool", 4)]
+
+    await executor.warm_pools.release("testpool")
+    await executor.warm_pools.release("testpool")
+    assert fake.resizes == [("testpool", 4)]
+    await executor.warm_pools.release("testpool", idle_timeout=10)
+    assert "TimeInterval_Minute * 10" in fake.autoscale["testpool"]
+    assert fake.pools["testpool"]["metadata"][USERS_METADATA] == "0"
+
+    # Attaching again takes the pool back from the idle formula
+    await executor.warm_pools.acquire("testpool", "STANDARD_A1_v2", 2, *image)
+    assert "testpool" not in fake.autoscale
+    await executor.warm_pools.release("testpool")
+    assert fake.resizes[-1] == ("testpool", 0)
+    await executor.close()
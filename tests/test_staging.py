@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.staging import BlobStager
+from azure_streamflow.sync import SyncManifest
+
+
+@pytest.fixture
+def blob_connector(tmp_path):
+    manifest = SyncManifest(str(tmp_path / "manifest.json"))
+
+    async def sas_url(client, expiry, permission="r"):
+        return f"{client.url}?sig={permission}"
+
+    service_client = MagicMock()
+    service_client.get_blob_client = lambda container, blob: SimpleNamespace(
+        url=f"https://account.blob.core.windows.net/{container}/{blob}")
+    service_client.get_container_client = lambda container: SimpleNamespace(
+        url=f"https://account.blob.core.windows.net/{container}")
+    connector = SimpleNamespace(
+        config={"container": "staging"},
+        blob_service_client=service_client,
+        _sync_manifest=lambda: manifest,
+        _is_blob=AsyncMock(return_value=False),
+        _upload_blob=AsyncMock(),
+        copy_local_to_remote=AsyncMock(),
+        sas_url=sas_url
+    )
+    yield connector
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_stage_deduplicates_inputs(blob_connector, tmp_path):
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text("shared reference data")
+    (tmp_path / "ref").mkdir()
+    (tmp_path / "ref" / "genome.fa").write_text(">chr1\nACGT\n")
+    stager = BlobStager(blob_connector, prefix="stage/")
+
+    first, second = await asyncio.gather(
+        stager.stage(str(tmp_path / "a.txt"), "/work/1/a.txt"),
+        stager.stage(str(tmp_path / "b.txt"), "/work/2/b.txt"))
+    directory = await stager.stage(str(tmp_path / "ref"), "/work/1/ref")
+
+    assert first.blob_name == second.blob_name
+    assert first.blob_name.startswith("stage/")
+    blob_connector._upload_blob.assert_awaited_once_with(str(tmp_path / "a.txt"), "staging", first.blob_name)
+    blob_connector.copy_local_to_remote.assert_awaited_once_with(str(tmp_path / "ref"), directory.blob_name, None)
+    assert directory.blob_name.endswith("/")
+
+    command, resource_files = await stager.prepare("cat /work/1/a.txt /work/1/ref/genome.fa")
+    digest = directory.blob_name.rstrip("/")
+    assert command == f"cat work/1/a.txt work/1/ref/{digest}/genome.fa"
+    assert {"http_url": f"https://account.blob.core.windows.net/staging/{first.blob_name}?sig=r",
+            "file_path": "work/1/a.txt"} in resource_files
+    assert {"storage_container_url": "https://account.blob.core.windows.net/staging?sig=rl",
+            "blob_prefix": directory.blob_name, "file_path": "work/1/ref"} in resource_files
+    assert len(resource_files) == 2
+
+
+@pytest.mark.asyncio
+async def test_prepare_matches_whole_paths(blob_connector, tmp_path):
+    (tmp_path / "in").write_text("first")
+    (tmp_path / "in2").write_text("second")
+    stager = BlobStager(blob_connector)
+    staged = await stager.stage(str(tmp_path / "in"), "/data/in")
+
+    command, resource_files = await stager.prepare("cat /data/input /data/in2 /data/in.bak --x=/data/in '/data/in'")
+    assert command == "cat /data/input /data/in2 /data/in.bak --x=data/in 'data/in'"
+    assert [f["file_path"] for f in resource_files] == ["data/in"]
+
+    # Inputs are attached to the task that uses them, not to the later ones
+    command, resource_files = await stager.prepare("cat /data/in")
+    assert command == "cat /data/in" and resource_files == []
+
+    other = await stager.stage(str(tmp_path / "in2"), "/data/in2")
+    await stager.stage(str(tmp_path / "in"), "/data/in")
+    command, resource_files = await stager.prepare("cat /data/in2 /data/in;")
+    assert command == "cat data/in2 data/in;"
+    assert [f["http_url"] for f in resource_files] == [
+        f"https://account.blob.core.windows.net/staging/{other.blob_name}?sig=r",
+        f"https://account.blob.core.windows.net/staging/{staged.blob_name}?sig=r"]
+
+@pytest.mark.asyncio
+async def test_output_files(blob_connector):
+    stager = BlobStager(blob_connector, output_prefix="outputs")
+    output_files = await stager.output_files("task-1", ["results/*.csv", "summary.json", "logs/**/*.log"])
+
+    assert [f["destination"]["container"]["path"] for f in output_files] == [
+        "outputs/task-1/results", "outputs/task-1/summary.json", "outputs/task-1/logs"]
+    assert output_files[0]["destination"]["container"]["container_url"].endswith("?sig=cw")
+    assert output_files[0]["upload_options"] == {"upload_condition": "taskcompletion"}
+    assert stager.output_blob("task-1", "/results/a.csv") == "outputs/task-1/results/a.csv"
+
+
+@pytest.mark.asyncio
+async def test_stage_remote_outputs(blob_connector):
+    stager = BlobStager(blob_connector, output_prefix="outputs")
+    blob_connector._is_blob = AsyncMock(side_effect=lambda container, name: name.endswith(".csv"))
+    blob_connector._is_directory = AsyncMock(side_effect=lambda container, name: name.endswith("logs"))
+
+    staged = await stager.stage_remote(stager.output_blob("task-1", "a.csv"), "/work/2/a.csv")
+    assert staged.blob_name == "outputs/task-1/a.csv" and not staged.is_directory
+    staged = await stager.stage_remote(stager.output_blob("task-1", "logs"), "/work/2/logs")
+    assert staged.blob_name == "outputs/task-1/logs/" and staged.is_directory
+    with pytest.raises(WorkflowExecutionException, match="outputs/task-1/missing"):
+        await stager.stage_remote(stager.output_blob("task-1", "missing"), "/work/2/missing")
+    blob_connector._upload_blob.assert_not_awaited()
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+from streamflow.core.exception import WorkflowExecutionException
+
+from azure_streamflow.poller import TaskState
+from azure_streamflow.streams import ChunkStreamContextManager, follow_task_file
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_chunk_stream_reader():
+    async with ChunkStreamContextManager(_chunks(b"abc", b"defgh", b"i")) as reader:
+        assert await reader.read(2) == b"ab"
+        assert await reader.read(4) == b"cdef"
+        assert await reader.read() == b"ghi"
+        assert await reader.read(1) == b""
+        with pytest.raises(WorkflowExecutionException, match="read-only"):
+            await reader.write(b"x")
+
+
+@pytest.mark.asyncio
+@patch('azure_streamflow.streams.OUTPUT_POLL_MIN', 0.001)
+async def test_follow_task_file_reads_ranges_until_completion():
+    content = bytearray()
+    ranges = []
+    poller = SimpleNamespace(states={}, watch=lambda task_id: None)
+    poller.state = lambda task_id: poller.states.get(task_id)
+    # The task writes more output between reads and completes after the third one
+    writes = [b"hello ", b"", b"world\n", b""]
+
+    async def get_from_task(job_id, task_id, file_path, file_get_from_task_options=None):
+        ranges.append(file_get_from_task_options["ocp_range"])
+        offset = int(file_get_from_task_options["ocp_range"][6:-1])
+        content.extend(writes.pop(0) if writes else b"")
+        if len(ranges) == 3:
+            poller.states[task_id] = TaskState("completed", 0)
+        if offset >= len(content):
+            error = HttpResponseError(message="range not satisfiable")
+            error.status_code = 416
+            raise error
+        return _chunks(bytes(content[offset:]))
+
+    executor = SimpleNamespace(
+        task_poller=lambda job_id: poller,
+        batch_client=SimpleNamespace(file=SimpleNamespace(get_from_task=get_from_task)))
+    data = b"".join([chunk async for chunk in follow_task_file(executor, "job", "task", "stdout.txt")])
+
+    assert data == b"hello world\n"
+    assert ranges[:3] == ["bytes=0-", "bytes=6-", "bytes=6-"]
+    assert ranges[-1] == "bytes=12-"